@@ -37,13 +37,47 @@ __url__ = 'https://github.com/luaduck/suds'
 
 import config
 import enums
+import soapvalidator
+import soapblocklist
+import soapgeoip
+import soapnames
+import soapconfig
 import soaputils
+import soapreactor
+import soapdispatch
+import soapreconnect
+import soapthrottle
+import soapannounce
+import soapoutput
+import soaprelay
+import soapcommands
+import soapflood
+import soapreputation
+import soaprcon
+import soapsettings
 import soapclient
 import libottdadmin2
 import plugin
 reload(config)
 reload(enums)
+reload(soapvalidator)
+reload(soapblocklist)
+reload(soapgeoip)
+reload(soapnames)
+reload(soapconfig)
 reload(soaputils)
+reload(soapreactor)
+reload(soapdispatch)
+reload(soapreconnect)
+reload(soapthrottle)
+reload(soapannounce)
+reload(soapoutput)
+reload(soaprelay)
+reload(soapcommands)
+reload(soapflood)
+reload(soapreputation)
+reload(soaprcon)
+reload(soapsettings)
 reload(soapclient)
 reload(libottdadmin2)
 reload(plugin)
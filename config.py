@@ -53,6 +53,117 @@ conf.registerGlobalValue(Suds, 'logHistory',
     registry.Integer(2, """ Amount of logfiles to keep. This does not include
     the current logfile. A value of 2 will keep the current logfile, and the 2
     preceding ones as .log.1 and .log.2."""))
+conf.registerGlobalValue(Suds, 'sendQueueHighWater',
+    registry.PositiveInteger(65536, """ Amount of bytes that may be queued
+    for a server before commands sending to it have to wait for the queue to
+    drain. Packets are still queued above this limit, it only slows down the
+    sender. """))
+
+conf.registerGlobalValue(Suds, 'handlerWorkers',
+    registry.PositiveInteger(4, """ Number of threads handling events
+    received from the servers. Events of a single server are always handled in
+    the order they arrived. Requires a plugin reload to take effect """))
+conf.registerGlobalValue(Suds, 'handlerTimeout',
+    registry.PositiveInteger(5, """ Seconds an event handler may take before
+    it is logged and counted as timed out in the metrics. Handlers are never
+    interrupted: events of the same server keep waiting for it, so they are
+    always handled in order """))
+conf.registerGlobalValue(Suds, 'slowHandlerWorkers',
+    registry.PositiveInteger(4, """ Number of threads for slow tasks, such
+    as VPN checks and OFS commands. Requires a plugin reload to take
+    effect """))
+conf.registerGlobalValue(Suds, 'slowHandlerTimeout',
+    registry.PositiveInteger(30, """ Seconds after which a slow task is
+    counted as timed out in the metrics. The task itself keeps running """))
+
+conf.registerGlobalValue(Suds, 'connectTimeout',
+    registry.PositiveInteger(10, """ Seconds to wait for a server to accept
+    the connection """))
+conf.registerGlobalValue(Suds, 'reconnectDelay',
+    registry.PositiveInteger(5, """ Seconds to wait before reconnecting to a
+    server after the connection was lost or failed. This doubles with every
+    failed attempt, up to reconnectMaxDelay. Requires a plugin reload to take
+    effect """))
+conf.registerGlobalValue(Suds, 'reconnectMaxDelay',
+    registry.PositiveInteger(300, """ Maximum amount of seconds between two
+    reconnection attempts. Requires a plugin reload to take effect """))
+
+conf.registerGlobalValue(Suds, 'rconPipelineDepth',
+    registry.PositiveInteger(32, """ Maximum number of rcon commands sent to
+    a server before its answer to the first one has come in. Lower this if a
+    server has trouble keeping up with long command lists, such as setdef """))
+conf.registerGlobalValue(Suds, 'rconStarvationLimit',
+    registry.PositiveInteger(4, """ Interactive rcon commands are sent before
+    bulk ones (setdef, content). A waiting bulk command gets its turn after
+    being passed over this many times in a row """))
+conf.registerGlobalValue(Suds, 'rconOutputMemory',
+    registry.PositiveInteger(16384, """ Bytes of rcon output kept in memory
+    for each command waiting to be read with less. Anything beyond that goes
+    to a temporary file """))
+conf.registerGlobalValue(Suds, 'rconOutputMaxLines',
+    registry.PositiveInteger(10000, """ Maximum number of lines of output
+    kept for a single rcon command, further lines are dropped """))
+conf.registerGlobalValue(Suds, 'rconOutputTTL',
+    registry.PositiveInteger(600, """ Seconds rcon output waiting to be read
+    with less is kept after it was last looked at """))
+conf.registerChannelValue(Suds, 'rconPageSize',
+    registry.PositiveInteger(5, """ Number of lines of rcon output shown at
+    a time, use less to see the next page """))
+conf.registerChannelValue(Suds, 'rconRate',
+    registry.Float(20.0, """ Rcon commands per second sent to the server on
+    average, more wait their turn. 0 means no limit """))
+conf.registerChannelValue(Suds, 'rconBurst',
+    registry.PositiveInteger(40, """ Number of rcon commands that may be sent
+    at once before rconRate applies """))
+conf.registerChannelValue(Suds, 'chatRate',
+    registry.Float(5.0, """ Chat messages per second sent to the server on
+    average, more wait their turn. 0 means no limit """))
+conf.registerChannelValue(Suds, 'chatBurst',
+    registry.PositiveInteger(10, """ Number of chat messages that may be sent
+    at once before chatRate applies """))
+conf.registerChannelValue(Suds, 'moderationReserve',
+    registry.Integer(5, """ Rcon commands and chat messages on top of the
+    burst that only moderation (kicks, bans, moves) may use, so it isn't held
+    up by other traffic """))
+conf.registerGlobalValue(Suds, 'ircQueueDepth',
+    registry.PositiveInteger(200, """ Maximum number of messages per channel
+    waiting to be sent to IRC. When full, announcements are dropped first,
+    then other messages. Alerts such as admin requests always go through """))
+conf.registerChannelValue(Suds, 'announceWindow',
+    registry.Float(2.0, """ Seconds to collect joins, quits, name changes and
+    company moves, to announce them on IRC in a single line. Chat is never
+    held back. 0 announces everything separately """))
+conf.registerChannelValue(Suds, 'chatRelayPacking',
+    registry.Boolean(False, """ Join consecutive chat lines from the same
+    person into one message, both from the game to IRC and from IRC to the
+    game """))
+conf.registerChannelValue(Suds, 'chatRelayWindow',
+    registry.Float(0.3, """ Seconds chat is held back to be joined with
+    following lines, when chatRelayPacking is on """))
+conf.registerChannelValue(Suds, 'ingameCommandLimit',
+    registry.PositiveInteger(3, """ Number of ingame !commands a client may
+    use within ingameCommandWindow seconds, further ones are ignored """))
+conf.registerChannelValue(Suds, 'ingameCommandWindow',
+    registry.PositiveInteger(30, """ Length in seconds of the window used by
+    ingameCommandLimit """))
+conf.registerGlobalValue(Suds, 'rconCacheRules',
+    registry.SemicolonSeparatedListOfStrings(['get *=30', 'companies=10',
+    'clients=10', 'list_settings*=60', 'banlist=30'], """ Read-only rcon
+    commands whose output is reused for a while, as pattern=seconds. Patterns
+    may contain * and ?. Any other rcon command clears the cache, client and
+    company changes clear the related entries """))
+conf.registerChannelValue(Suds, 'rconStreaming',
+    registry.Boolean(False, """ Show rcon output while the command is still
+    running, instead of waiting for it to finish """))
+conf.registerChannelValue(Suds, 'rconStreamInterval',
+    registry.PositiveFloat(0.5, """ When streaming, seconds to collect rcon
+    output before showing it """))
+conf.registerChannelValue(Suds, 'rconStreamLines',
+    registry.PositiveInteger(5, """ When streaming, show collected rcon
+    output as soon as this many lines have come in """))
+conf.registerChannelValue(Suds, 'rconStreamBudget',
+    registry.PositiveInteger(20, """ When streaming, maximum number of lines
+    shown for a single rcon command. The rest can be read with less """))
 
 # OpenTTD server configuration
 conf.registerChannelValue(Suds, 'serverID',
@@ -94,8 +205,57 @@ conf.registerChannelValue(Suds, 'checkClientVPN',
      known VPN or other such ban evasion techniques, and kicked if they are using them."""))
 conf.registerGlobalValue(Suds, 'checkClientVPNWhitelist',
     SemicolonSeparatedListOfStrings('', """If checkClientVPN is enabled, you can disable checking certain IPs or subnets (in CIDR notation) here. Semicolon delimited."""))
+conf.registerGlobalValue(Suds, 'geoipFile',
+    registry.String('', """ GeoIP range table used to show the country of
+    joining players and in the players command, without any network access.
+    Build it from a db-ip or ip2location country csv with
+    'python soapgeoip.py <csv> <table>'. Leave empty to disable """))
+conf.registerGlobalValue(Suds, 'geoipCacheSize',
+    registry.PositiveInteger(1024, """ Number of recent GeoIP answers kept in
+    memory """))
+conf.registerGlobalValue(Suds, 'blocklistFiles',
+    SemicolonSeparatedListOfStrings('', """ Files with networks (datacenters,
+    VPN providers, Tor exits) to treat as proxies without asking the IP
+    validator. One address or CIDR subnet per line, # starts a comment.
+    Semicolon delimited """))
+conf.registerGlobalValue(Suds, 'blocklistReloadInterval',
+    registry.PositiveInteger(60, """ Seconds between checks whether the
+    blocklistFiles changed. Changed files are reloaded """))
+conf.registerGlobalValue(Suds, 'validatorUrl',
+    registry.String('http://check.getipintel.net/check.php?ip={ip}&format=json&oflags=bc&contact=ttd-abuse@duck.me.uk',
+    """ URL of the service used by checkClientVPN. {ip} is replaced by the
+    address being checked, the response has to be getipintel's JSON format """))
+conf.registerGlobalValue(Suds, 'validatorTimeout',
+    registry.PositiveFloat(5.0, """ Seconds to wait for the IP validator to
+    answer """))
+conf.registerGlobalValue(Suds, 'validatorConcurrency',
+    registry.PositiveInteger(4, """ Maximum number of requests to the IP
+    validator at the same time """))
+conf.registerGlobalValue(Suds, 'validatorFailureLimit',
+    registry.PositiveInteger(3, """ Number of failed requests in a row after
+    which the IP validator is considered down """))
+conf.registerGlobalValue(Suds, 'validatorCooldown',
+    registry.PositiveInteger(60, """ Seconds to skip the IP validator for once
+    it is considered down, before trying it again """))
+conf.registerGlobalValue(Suds, 'reputationCacheSize',
+    registry.PositiveInteger(10000, """ Number of IP addresses whose VPN check
+    result is remembered, shared by all servers. The least recently seen are
+    forgotten first """))
+conf.registerGlobalValue(Suds, 'reputationCacheFile',
+    registry.String('', """ sqlite database the VPN check results are kept in,
+    so they survive restarts. Leave empty to use Suds-reputation.sqlite3 in the
+    bot's data directory """))
+conf.registerGlobalValue(Suds, 'reputationProxyTTL',
+    registry.PositiveInteger(24, """ Hours a VPN check result flagging an
+    address as a proxy is remembered """))
+conf.registerGlobalValue(Suds, 'reputationCleanTTL',
+    registry.PositiveInteger(168, """ Hours a VPN check result clearing an
+    address is remembered """))
+conf.registerGlobalValue(Suds, 'reputationFlushInterval',
+    registry.PositiveInteger(60, """ Seconds between writes of new VPN check
+    results to reputationCacheFile """))
 conf.registerGlobalValue(Suds, 'nameBlacklist',
-    SemicolonSeparatedListOfStrings('', """List of player names to autokick. Semicolon delimited."""))
+    SemicolonSeparatedListOfStrings('', """List of player names to autokick, on joining and on changing name. Plain names also catch differently cased, spaced or lookalike spellings, * and ? make a wildcard and re: starts a regular expression matched against the lowercased name. Semicolon delimited."""))
 conf.registerChannelValue(Suds, 'playAsPlayer',
     registry.Boolean(True, """ True means players can play with Player as their
     name. False will get them moved to spectators any time they try to join a
@@ -104,6 +264,23 @@ conf.registerChannelValue(Suds, 'playerKickCount',
     registry.Integer(3, """ The number of times a player can attempt to join
     a company before they are automatically kicked. Setting to 0 will kick
     on the first infraction. """))
+conf.registerChannelValue(Suds, 'floodChatLimit',
+    registry.Integer(10, """ Number of chat messages a client may send within
+    floodChatWindow seconds. Clients going over it are warned first, then
+    moved to spectators and finally kicked. 0 disables chat flood detection """))
+conf.registerChannelValue(Suds, 'floodChatWindow',
+    registry.PositiveInteger(5, """ Length in seconds of the window used by
+    floodChatLimit """))
+conf.registerChannelValue(Suds, 'floodCommandLimit',
+    registry.Integer(100, """ Number of commands (building, money transfers
+    and so on) a client may do within floodCommandWindow seconds, escalating
+    like floodChatLimit. 0 disables command flood detection """))
+conf.registerChannelValue(Suds, 'floodCommandWindow',
+    registry.PositiveInteger(2, """ Length in seconds of the window used by
+    floodCommandLimit """))
+conf.registerChannelValue(Suds, 'floodForgiveTime',
+    registry.PositiveInteger(600, """ Seconds after which a client's flood
+    warnings are forgotten if they didn't flood again """))
 conf.registerChannelValue(Suds, 'passwordInterval',
     registry.Integer(0, """ Interval in seconds between soap changing the
     password clients use to join the server. Picks a random line from the
@@ -119,7 +296,13 @@ conf.registerChannelValue(Suds, 'welcomeMessage',
 conf.registerChannelValue(Suds, 'defaultSettings',
     registry.String('', """ This should be an absolute path pointing to a textfile
     containing one command per line. This file is read by the setdef command, and
-    all commands are executed """))
+    all commands are executed. Settings the server already has are skipped """))
+conf.registerGlobalValue(Suds, 'fanoutTimeout',
+    registry.PositiveInteger(10, """ Seconds to wait for each server to answer
+    an rcon command sent to all servers, or to a glob pattern of them """))
+conf.registerGlobalValue(Suds, 'settingsCacheTime',
+    registry.PositiveInteger(300, """ Seconds the server settings fetched by
+    setdef are reused, before fetching them again """))
 
 # various URL's
 conf.registerChannelValue(Suds, 'downloadUrl',
@@ -40,3 +40,14 @@ class RconStatus(EnumHelper):
     SHUTDOWNSAVED   = 0x03 # Game has been saved by the shutdown command, no output
     UPDATESAVED     = 0x04 # Game has been saved prior to shutting down for update, no output
     RESTARTSAVED    = 0x05 # Game has been saved prior to restarting, no output
+
+class RconPriority(EnumHelper):
+    MODERATION      = 0x00 # Automatic moderation actions: kicks, bans, moves
+    INTERACTIVE     = 0x01 # Commands someone is waiting for
+    BULK            = 0x02 # Long command lists, such as setdef and content
+
+class MessagePriority(EnumHelper):
+    ALERT           = 0x00 # Admin requests, bans, server errors. Skip the queue
+    CHAT            = 0x01 # Ingame chat
+    NORMAL          = 0x02 # Command replies and status messages
+    ROUTINE         = 0x03 # Joins, quits and other announcements
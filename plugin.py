@@ -19,8 +19,8 @@ import supybot.conf as conf
 import supybot.callbacks as callbacks
 
 from datetime import datetime
+import functools
 import os.path
-import Queue
 import random
 import socket
 from subprocess import Popen, PIPE, CalledProcessError
@@ -30,9 +30,25 @@ import time
 
 import soaputils as utils
 from soapclient import SoapClient
+from soapdispatch import SoapDispatcher, slowHandler
+from soapreconnect import ReconnectScheduler
+from soaprcon import parseCacheRules, RconFanout, CLIENT_QUERIES, COMPANY_QUERIES
+from soapthrottle import TokenBucket
+from soapannounce import AnnouncementBatcher, MAX_LINE_LENGTH
+from soapoutput import OutputScheduler
+from soaprelay import LinePacker
+from soapcommands import ingameCommand, ingameCommands, SlidingWindowLimiter
+from soapflood import FloodGuard
+from soapreputation import ReputationCache
+from soapvalidator import IPValidator
+from soapblocklist import CidrBlocklist
+from soapgeoip import GeoIP
+from soapnames import NamePolicy, isDefaultName
+from soapconfig import buildSnapshot, changed, SNAPSHOT_VALUES, SNAPSHOT_GLOBALS, FLOOD_VALUES
+import soapsettings
+from soapreactor import SoapReactor, EPOLLIN, EPOLLOUT, EPOLLERR, EPOLLHUP, EPOLLPRI
 from enums import *
 
-from libottdadmin2.trackingclient import poll, POLLIN, POLLOUT, POLLERR, POLLHUP, POLLPRI, POLL_MOD
 from libottdadmin2.constants import *
 from libottdadmin2.enums import *
 from libottdadmin2.packets import *
@@ -48,11 +64,56 @@ class Suds(callbacks.Plugin):
         self.__parent = super(Suds, self)
         self.__parent.__init__(irc)
 
-        self._pollObj = poll()
+        self.reactor = SoapReactor(self.log)
+        self.dispatcher = SoapDispatcher(self.log,
+            self.registryValue('handlerWorkers'),
+            self.registryValue('slowHandlerWorkers'),
+            self.registryValue('handlerTimeout'),
+            self.registryValue('slowHandlerTimeout'))
+        self.output = OutputScheduler(self.reactor, utils.sendChannel,
+                                      self.registryValue('ircQueueDepth'))
+        utils.setOutputScheduler(self.output)
+        self.announcer = AnnouncementBatcher(self.reactor, utils.msgChannel)
+        self.ingameCommands = ingameCommands(self)
+        self.commandLimiter = SlidingWindowLimiter()
+        self.ircRelay = LinePacker(self.reactor, self._relayToIrc, MAX_LINE_LENGTH)
+        self.gameRelay = LinePacker(self.reactor, self._relayToGame,
+                                    NETWORK_CHAT_LENGTH - 1)
+        self.reconnector = ReconnectScheduler(self.reactor,
+            lambda connChan: self.dispatcher.submit(None, self._startConnect, connChan),
+            self.registryValue('reconnectDelay'),
+            self.registryValue('reconnectMaxDelay'))
         self.channels = self.registryValue('channels')
         self.connections = {}
         self.registeredConnections = {}
+        self.connecting = {}
         self.connectionIds = []
+        # everything event handlers use has to exist before the first
+        # connection is made and the reactor starts delivering events
+        self.kickdict = dict()
+        self.reputation = ReputationCache(self._reputationFile(),
+            self.registryValue('reputationCacheSize'),
+            self.registryValue('reputationProxyTTL') * 3600,
+            self.registryValue('reputationCleanTTL') * 3600)
+        self.dispatcher.submit(None, self._loadReputation)
+        self.blocklist = CidrBlocklist(self.registryValue('blocklistFiles'))
+        self.geoip = self._loadGeoIP()
+        self.dispatcher.submit(None, self._reloadBlocklist)
+        self.validator = IPValidator(self.registryValue('validatorUrl'),
+            self.registryValue('validatorTimeout'),
+            self.registryValue('validatorConcurrency'),
+            self.registryValue('validatorFailureLimit'),
+            self.registryValue('validatorCooldown'))
+        self.vpnWhitelist = None
+        self._compileWhitelist()
+        conf.supybot.plugins.Suds.checkClientVPNWhitelist.addCallback(
+            self._compileWhitelist)
+        self.nameBlacklist = None
+        self._compileNameBlacklist()
+        conf.supybot.plugins.Suds.nameBlacklist.addCallback(
+            self._compileNameBlacklist)
+        for node in self._snapshotNodes():
+            node.addCallback(self._rebuildSnapshots)
         for channel in self.channels:
             serverID = self.registryValue('serverID', channel)
             conn = SoapClient(channel, serverID)
@@ -61,16 +122,24 @@ class Suds(callbacks.Plugin):
             self.connections[channel.lower()] = conn
             if self.registryValue('autoConnect', channel):
                 self._connectOTTD(irc, conn, channel)
-        self.stopPoll = threading.Event()
         self.pollingThread = threading.Thread(
-            target=self._pollThread,
+            target=self.reactor.run,
             name='SoapPollingThread')
         self.pollingThread.daemon = True
         self.pollingThread.start()
-        self.kickdict = dict()
-        self.ipdict = dict()
+        self.reactor.callLater(60, self._expireRconOutput)
+        self.reactor.callLater(self.registryValue('reputationFlushInterval'),
+                               self._flushReputation)
+        self.reactor.callLater(self.registryValue('blocklistReloadInterval'),
+                               self._checkBlocklist)
 
     def die(self):
+        conf.supybot.plugins.Suds.checkClientVPNWhitelist.removeCallback(
+            self._compileWhitelist)
+        conf.supybot.plugins.Suds.nameBlacklist.removeCallback(
+            self._compileNameBlacklist)
+        for node in self._snapshotNodes():
+            node.removeCallback(self._rebuildSnapshots)
         for conn in self.connections.itervalues():
             try:
                 if conn.connectionstate == ConnectionState.CONNECTED:
@@ -78,8 +147,16 @@ class Suds(callbacks.Plugin):
                     utils.disconnect(conn, False)
             except NameError:
                 pass
-        self.stopPoll.set()
+        self.announcer.flushAll()
+        utils.setOutputScheduler(None)
+        self.reactor.stop()
         self.pollingThread.join()
+        self.dispatcher.stop()
+        # Logs a failed write rather than cutting the rest of the teardown short
+        self._writeReputation()
+        self.validator.close()
+        if self.geoip:
+            self.geoip.close()
 
     def doJoin(self, irc, msg):
         channel = msg.args[0].lower()
@@ -96,38 +173,92 @@ class Suds(callbacks.Plugin):
     # Connection management
 
     def _attachEvents(self, conn):
-        conn.soapEvents.connected += self._connected
-        conn.soapEvents.disconnected += self._disconnected
+        dispatch = self.dispatcher.wrap
+        conn.soapEvents.connected += dispatch(self._connected)
+        conn.soapEvents.disconnected += dispatch(self._disconnected)
 
-        conn.soapEvents.shutdown += self._rcvShutdown
-        conn.soapEvents.new_game += self._rcvNewGame
+        conn.soapEvents.shutdown += dispatch(self._rcvShutdown)
+        conn.soapEvents.new_game += dispatch(self._rcvNewGame)
 
-        conn.soapEvents.new_map += self._rcvNewMap
+        conn.soapEvents.new_map += dispatch(self._rcvNewMap)
 
-        conn.soapEvents.clientjoin += self._rcvClientJoin
-        conn.soapEvents.clientupdate += self._rcvClientUpdate
-        conn.soapEvents.clientquit += self._rcvClientQuit
+        conn.soapEvents.clientjoin += dispatch(self._rcvClientJoin)
+        conn.soapEvents.clientupdate += dispatch(self._rcvClientUpdate)
+        conn.soapEvents.clientquit += dispatch(self._rcvClientQuit)
 
-        conn.soapEvents.chat += self._rcvChat
-        conn.soapEvents.rcon += self._rcvRcon
-        conn.soapEvents.rconend += self._rcvRconEnd
-        conn.soapEvents.console += self._rcvConsole
-        conn.soapEvents.cmdlogging += self._rcvCmdLogging
+        conn.soapEvents.companynew += dispatch(self._rcvCompanyChange)
+        conn.soapEvents.companyupdate += dispatch(self._rcvCompanyChange)
+        conn.soapEvents.companyremove += dispatch(self._rcvCompanyChange)
 
-        conn.soapEvents.pong += self._rcvPong
+        conn.soapEvents.chat += dispatch(self._rcvChat)
+        conn.soapEvents.rcon += dispatch(self._rcvRcon)
+        conn.soapEvents.rconend += dispatch(self._rcvRconEnd)
+        conn.soapEvents.console += dispatch(self._rcvConsole)
+        conn.soapEvents.cmdlogging += dispatch(self._rcvCmdLogging)
+
+        conn.soapEvents.pong += dispatch(self._rcvPong)
 
     def _connectOTTD(self, irc, conn, source=None, text='Connecting...'):
         utils.msgChannel(irc, conn.channel, text)
         if source and not source == conn.channel:
             utils.msgChannel(irc, source, text)
+        self.reconnector.schedule(conn.channel, 0)
+
+    @slowHandler()
+    def _startConnect(self, connChan):
+        conn = self.connections.get(connChan)
+        if not conn:
+            return
+        if conn.connectionstate not in (ConnectionState.DISCONNECTED,
+                ConnectionState.SHUTDOWN):
+            self.reconnector.cancel(conn.channel)
+            return
+        irc = conn.irc
         conn = utils.refreshConnection(
             self.connections, self.registeredConnections, conn)
         self._initSoapClient(conn, irc)
         conn.connectionstate = ConnectionState.CONNECTING
-        if not conn.connect():
-            conn.connectionstate = ConnectionState.DISCONNECTED
-            text = 'Connection failed'
-            utils.msgChannel(irc, conn.channel, text)
+        error = conn.start_connect()
+        if error:
+            self._connectFailed(conn, error)
+            return
+        self.connecting[conn.filenumber] = conn
+        conn.connectTimer = self.reactor.callLater(
+            self.registryValue('connectTimeout'), self._connectTimeout, conn)
+        self.reactor.register(conn.filenumber, self._connectEvent,
+                              EPOLLOUT | EPOLLERR | EPOLLHUP)
+
+    def _connectEvent(self, fileno, event):
+        conn = self.connecting.pop(fileno, None)
+        if not conn:
+            self.reactor.unregister(fileno)
+            return
+        conn.connectTimer.cancel()
+        error = conn.finish_connect()
+        if error:
+            self.reactor.unregister(fileno)
+            self._connectFailed(conn, error)
+            return
+        self.reconnector.succeeded(conn.channel)
+        self._registerSoapClient(conn)
+
+    def _connectTimeout(self, conn):
+        if self.connecting.pop(conn.filenumber, None) is not conn:
+            return
+        self.reactor.unregister(conn.filenumber)
+        self._connectFailed(conn, 'timed out')
+
+    def _connectFailed(self, conn, error):
+        conn.connectionstate = ConnectionState.DISCONNECTED
+        conn.close()
+        delay = self.reconnector.failed(conn.channel, error)
+        logMessage = '<CONNECT FAILED> %s' % error
+        conn.logger.info(logMessage)
+        if self.reconnector.attempts(conn.channel) <= 1:
+            text = 'Connection failed (%s)' % error
+            if delay is not None:
+                text += ', retrying in %ds' % delay
+            utils.msgChannel(conn.irc, conn.channel, text)
 
     def _connected(self, connChan):
         conn = self.connections.get(connChan)
@@ -135,7 +266,7 @@ class Suds(callbacks.Plugin):
             return
 
         conn.connectionstate = ConnectionState.AUTHENTICATING
-        pwInterval = self.registryValue('passwordInterval', conn.channel)
+        pwInterval = conn.channelConfig.passwordInterval
         if pwInterval != 0:
             connectionid = utils.getConnectionID(conn)
             pwThread = threading.Thread(
@@ -146,9 +277,7 @@ class Suds(callbacks.Plugin):
             pwThread.start()
         else:
             command = 'set server_password *'
-            conn.rconState = RconStatus.ACTIVE
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
+            conn.rconEngine.submit(command)
             conn.clientPassword = None
 
     def _disconnected(self, connChan, canRetry):
@@ -164,12 +293,7 @@ class Suds(callbacks.Plugin):
             del self.registeredConnections[fileno]
         except KeyError:
             pass
-        try:
-            self._pollObj.unregister(fileno)
-        except KeyError:
-            pass
-        except IOError:
-            pass
+        self.reactor.unregister(fileno)
 
         conn.logger.debug('>>--DEBUG--<< Disconnected')
         if conn.serverinfo.name:
@@ -181,9 +305,10 @@ class Suds(callbacks.Plugin):
 
         if conn.connectionstate == ConnectionState.CONNECTED:
             # We didn't disconnect on purpose, set this so we will reconnect
-            conn.connectionstate == ConnectionState.DISCONNECTED
-            text = 'Attempting to reconnect...'
-            self._connectOTTD(irc, conn, text=text)
+            conn.connectionstate = ConnectionState.DISCONNECTED
+            delay = self.reconnector.schedule(conn.channel)
+            text = 'Attempting to reconnect in %ds...' % delay
+            utils.msgChannel(irc, conn.channel, text)
         else:
             conn.connectionstate = ConnectionState.DISCONNECTED
 
@@ -196,13 +321,62 @@ class Suds(callbacks.Plugin):
             port=self.registryValue('port', conn.channel),
             name='%s-Soap' % irc.nick)
         utils.initLogger(conn, self.registryValue('logdir'), self.registryValue('logHistory'))
-        self._pollObj.register(conn.fileno(),
-                               POLLIN | POLLERR | POLLHUP | POLLPRI)
         conn.filenumber = conn.fileno()
+        conn.channelConfig = None
+        self._applySnapshot(conn, buildSnapshot(self.registryValue, conn.channel))
+        conn.rconEngine.cache.invalidate()
+        conn.serverSettings.invalidate()
+
+    def _applySnapshot(self, conn, config):
+        # Applies the settings a running connection holds on to, then makes
+        # config the snapshot handlers read
+        old = conn.channelConfig
+        engine = conn.rconEngine
+        engine.depth = config.rconPipelineDepth
+        engine.starvationLimit = config.rconStarvationLimit
+        engine.outputBytes = config.rconOutputMemory
+        engine.outputLines = config.rconOutputMaxLines
+        if changed(old, config, ('rconCacheRules',)):
+            rules, bad = parseCacheRules(config.rconCacheRules)
+            if bad:
+                self.log.warning('Ignoring invalid rconCacheRules entries: %s' % ', '.join(bad))
+            engine.cache.rules = rules
+            engine.cache.invalidate()
+        if changed(old, config, FLOOD_VALUES):
+            # counting starts afresh, the windows may have changed
+            conn.floodGuard = FloodGuard(*[getattr(config, name) for name in FLOOD_VALUES])
+        # switching throttling on or off takes a reconnect, rates change
+        # straight away
+        if engine.bucket is not None and config.rconRate > 0:
+            engine.bucket.configure(config.rconRate, config.rconBurst,
+                                    config.moderationReserve)
+        if conn.chatThrottle is not None and config.chatRate > 0:
+            conn.chatThrottle.bucket.configure(config.chatRate, config.chatBurst,
+                                               config.moderationReserve)
+        conn.channelConfig = config
+
+    def _registerSoapClient(self, conn):
+        # Only register once connected, epoll reports an unconnected socket
+        # as hung up straight away
         self.registeredConnections[conn.filenumber] = conn
+        self.reactor.register(conn.filenumber, self._pollEvent)
+        conn.enable_send_buffer(self.reactor,
+                                self.registryValue('sendQueueHighWater'))
+        config = conn.channelConfig
+        conn.enable_throttle(self.reactor,
+                             self._tokenBucket(config.rconRate, config.rconBurst,
+                                               config.moderationReserve),
+                             self._tokenBucket(config.chatRate, config.chatBurst,
+                                               config.moderationReserve))
+
+    def _tokenBucket(self, rate, burst, reserve):
+        if rate <= 0:
+            return None
+        return TokenBucket(rate, burst, reserve)
 
     # Thread functions
 
+    @slowHandler(timeout=600)
     def _commandThread(self, conn, irc, ofsCommand, successText=None, delay=0):
         time.sleep(delay)
         ofs = self.registryValue('ofslocation', conn.channel)
@@ -254,20 +428,12 @@ class Suds(callbacks.Plugin):
                 utils.msgChannel(irc, conn.channel, successText)
 
         if ofsCommand.startswith('ofs-svnupdate.py'):
-            conn.rconState = RconStatus.UPDATESAVED
             rconcommand = 'save autosave/autosavesoap'
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=rconcommand)
+            conn.rconEngine.submit(rconcommand, state=RconStatus.UPDATESAVED)
         elif ofsCommand.startswith('ofs-svntobin.py'):
             ofsCommand = 'ofs-start.py'
             successText = 'Server is starting'
-            connectionid = utils.getConnectionID(conn)
-            cmdThread = threading.Thread(
-                target=self._commandThread,
-                name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-                args=[conn, irc, ofsCommand, successText])
-            cmdThread.daemon = True
-            cmdThread.start()
+            self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText)
 
     def _passwordThread(self, conn):
         pluginDir = os.path.dirname(__file__)
@@ -283,61 +449,160 @@ class Suds(callbacks.Plugin):
             return
 
         while True:
-            interval = self.registryValue('passwordInterval', conn.channel)
+            interval = conn.channelConfig.passwordInterval
             if conn.connectionstate != ConnectionState.CONNECTED:
                 break
-            if conn.rconState == RconStatus.IDLE:
-                if interval > 0:
-                    newPassword = random.choice(list(open(pwFileName)))
-                    newPassword = newPassword.strip()
-                    newPassword = newPassword.lower()
-                    command = 'set server_password %s' % newPassword
-                    conn.rconState = RconStatus.ACTIVE
-                    conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                    conn.send_packet(AdminRcon, command=command)
-                    conn.clientPassword = newPassword
-                    time.sleep(interval)
-                else:
-                    command = 'set server_password *'
-                    conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                    conn.send_packet(AdminRcon, command=command)
-
-                    conn.clientPassword = None
-                    break
-            else:
+            if interval > 0:
+                newPassword = random.choice(list(open(pwFileName)))
+                newPassword = newPassword.strip()
+                newPassword = newPassword.lower()
+                command = 'set server_password %s' % newPassword
+                conn.rconEngine.submit(command)
+                conn.clientPassword = newPassword
                 time.sleep(interval)
-
-    def _pollThread(self):
-        timeout = 1.0
-
-        while True:
-            if len(self.registeredConnections) >= 1:
-                events = self._pollObj.poll(timeout * POLL_MOD)
-                for fileno, event in events:
-                    conn = self.registeredConnections.get(fileno)
-                    if not conn:
-                        continue
-                    if (event & POLLIN) or (event & POLLPRI):
-                        packet = conn.recv_packet()
-                        if packet == None:
-                            logMessage = '>>--DEBUG--<< Received empty packet, forcing disconnect'
-                            conn.logger.debug(logMessage)
-                            utils.disconnect(conn, True)
-                        else:
-                            logMessage = '>>--DEBUG--<< Received packet: %s' % str(packet)
-                            conn.logger.debug(logMessage)
-                    elif (event & POLLERR) or (event & POLLHUP):
-                        logMessage = '>>--DEBUG--<< Received POLLERR or POLLHUP, forcing disconnect'
-                        conn.logger.debug(logMessage)
-                        utils.disconnect(conn, True)
-                else:
-                    time.sleep(0.001)
-            # lets not use up 100% cpu if there are no active connections
             else:
-                time.sleep(1)
-            if self.stopPoll.isSet():
+                command = 'set server_password *'
+                conn.rconEngine.submit(command)
+
+                conn.clientPassword = None
                 break
 
+    def _pollEvent(self, fileno, event):
+        conn = self.registeredConnections.get(fileno)
+        if not conn:
+            self.reactor.unregister(fileno)
+            return
+        if event & EPOLLOUT:
+            if not conn.flush_send_buffer():
+                logMessage = '>>--DEBUG--<< Failed writing to server, forcing disconnect'
+                conn.logger.debug(logMessage)
+                utils.disconnect(conn, True)
+                return
+        if (event & EPOLLIN) or (event & EPOLLPRI):
+            packets = conn.recv_packets()
+            if packets == None:
+                logMessage = '>>--DEBUG--<< Connection closed by server, forcing disconnect'
+                conn.logger.debug(logMessage)
+                utils.disconnect(conn, True)
+            elif conn.debugLog:
+                for packet in packets:
+                    logMessage = '>>--DEBUG--<< Received packet: %s' % str(packet)
+                    conn.logger.debug(logMessage)
+        elif (event & EPOLLERR) or (event & EPOLLHUP):
+            logMessage = '>>--DEBUG--<< Received POLLERR or POLLHUP, forcing disconnect'
+            conn.logger.debug(logMessage)
+            utils.disconnect(conn, True)
+
+    @slowHandler()
+    def _checkClientIP(self, conn, client):
+        utils.checkIP(functools.partial(self._tellChannel, conn), conn, client,
+                      self.vpnWhitelist, self.blocklist, self.reputation, self.validator)
+
+    def _loadGeoIP(self):
+        path = self.registryValue('geoipFile')
+        if not path:
+            return None
+        try:
+            geoip = GeoIP(path, self.registryValue('geoipCacheSize'))
+        except (EnvironmentError, ValueError) as e:
+            self.log.warning('Couldn\'t load GeoIP table %s: %s' % (path, e))
+            return None
+        if geoip.empty():
+            self.log.warning('GeoIP table %s holds no ranges, countries won\'t be shown' % path)
+        return geoip
+
+    def _clientCountry(self, client):
+        if not self.geoip:
+            return None
+        return self.geoip.country(client.hostname)
+
+    def _countrySuffix(self, client):
+        country = self._clientCountry(client)
+        if country:
+            return ' from %s' % country
+        return ''
+
+    @slowHandler()
+    def _reloadBlocklist(self):
+        problems = self.blocklist.reload()
+        if problems is None:
+            return
+        v4, v6, files, lookups, listed = self.blocklist.stats()
+        self.log.info('Loaded blocklist: %d IPv4 and %d IPv6 ranges from %d files'
+            % (v4, v6, files))
+        for problem in problems:
+            self.log.warning('Blocklist: %s' % problem)
+
+    def _checkBlocklist(self):
+        # Runs on the reactor thread, the files are read by a worker
+        if self.blocklist.paths:
+            self.dispatcher.submit(None, self._reloadBlocklist)
+        self.reactor.callLater(self.registryValue('blocklistReloadInterval'),
+                               self._checkBlocklist)
+
+    def _reputationFile(self):
+        path = self.registryValue('reputationCacheFile')
+        if not path:
+            path = conf.supybot.directories.data.dirize('Suds-reputation.sqlite3')
+        return path
+
+    @slowHandler()
+    def _loadReputation(self):
+        try:
+            self.reputation.load()
+        except Exception as e:
+            self.log.warning('Couldn\'t load the IP reputation cache from %s: %s'
+                % (self.reputation.path, e))
+
+    def _flushReputation(self):
+        # Runs on the reactor thread, leave the disk writes to a worker
+        self.dispatcher.submit(None, self._writeReputation)
+        self.reactor.callLater(self.registryValue('reputationFlushInterval'),
+                               self._flushReputation)
+
+    @slowHandler()
+    def _writeReputation(self):
+        try:
+            self.reputation.flush()
+        except Exception as e:
+            self.log.warning('Couldn\'t save the IP reputation cache to %s: %s'
+                % (self.reputation.path, e))
+
+    def _snapshotNodes(self):
+        # The registry entries behind the channel snapshots, both the default
+        # and the channel specific ones
+        group = conf.supybot.plugins.Suds
+        for name in SNAPSHOT_VALUES:
+            node = group.get(name)
+            yield node
+            for channel in self.channels:
+                yield node.get(channel)
+        for name in SNAPSHOT_GLOBALS:
+            yield group.get(name)
+
+    def _rebuildSnapshots(self):
+        # Registry callback. Handlers keep using the snapshot they already
+        # have, new events get the new one
+        for conn in self.connections.itervalues():
+            self._applySnapshot(conn, buildSnapshot(self.registryValue, conn.channel))
+
+    def _compileNameBlacklist(self):
+        # Registry callback, runs whenever nameBlacklist is set
+        policy = NamePolicy(self.registryValue('nameBlacklist'))
+        if policy.bad:
+            self.log.warning('Ignoring invalid nameBlacklist entries: %s'
+                % ', '.join(policy.bad))
+        self.nameBlacklist = policy
+
+    def _compileWhitelist(self):
+        # Registry callback, runs whenever checkClientVPNWhitelist is set
+        whitelist, bad = utils.compileWhitelist(
+            self.registryValue('checkClientVPNWhitelist'))
+        if bad:
+            self.log.warning('Ignoring invalid checkClientVPNWhitelist entries: %s'
+                % ', '.join(bad))
+        self.vpnWhitelist = whitelist
+
     # Miscelanious functions
 
     def _ircCommandInit(self, irc, msg, serverID, needsPermission):
@@ -357,6 +622,26 @@ class Suds(callbacks.Plugin):
         else:
             return (None, None)
 
+    def _ircMultiInit(self, irc, msg, selector, needsPermission):
+        # Returns the connections matching selector, or None if selector
+        # doesn't pick multiple servers
+        conns = utils.getConnections(self.connections, selector)
+        if conns is None or not needsPermission:
+            return conns
+        return utils.permittedConnections(irc, msg, conns,
+            lambda channel: self.registryValue('allowOps', channel))
+
+    def _fleetReply(self, irc, conns, describe):
+        if not conns:
+            irc.reply('No servers match')
+            return
+        for conn in conns:
+            if conn.connectionstate != ConnectionState.CONNECTED:
+                text = 'Not connected'
+            else:
+                text = describe(conn)
+            irc.reply('%s: %s' % (utils.getConnectionID(conn), text), prefixNick=False)
+
     def _ircRconInit(self, irc, msg, firstWord, remainder, command, needsPermission):
         if not remainder:
             remainder = ''
@@ -410,6 +695,7 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
         irc = conn.irc
+        conn.rconEngine.cache.invalidate()
 
         text = 'Starting new game'
         utils.msgChannel(irc, conn.channel, text)
@@ -429,6 +715,8 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
         irc = conn.irc
+        conn.rconEngine.cache.invalidate()
+        conn.serverSettings.invalidate()
 
         conn.connectionstate = ConnectionState.CONNECTED
         text = 'Now playing on %s (Version %s)' % (
@@ -436,8 +724,7 @@ class Suds(callbacks.Plugin):
         utils.msgChannel(irc, conn.channel, text)
         command = 'set min_active_clients %s' % self.registryValue(
             'minPlayers', conn.channel)
-        conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-        conn.send_packet(AdminRcon, command=command)
+        conn.rconEngine.submit(command)
         logMessage = '-' * 80
         conn.logger.info(logMessage)
         logMessage = '<CONNECTED> Version: %s, Name: \'%s\' Mapname: \'%s\' Mapsize: %dx%d' % (
@@ -446,32 +733,36 @@ class Suds(callbacks.Plugin):
 
     def _rcvClientJoin(self, connChan, client):
         conn = self.connections.get(connChan)
-        if not conn or isinstance(client, (long, int)):
+        if not conn:
+            return
+        conn.rconEngine.cache.invalidate(CLIENT_QUERIES)
+        if isinstance(client, (long, int)):
             return
         irc = conn.irc
 
-        if client.name in self.registryValue('nameBlacklist'):
+        entry = self.nameBlacklist.match(client.name)
+        if entry is not None:
             text = '*** %s tried to join with a blacklisted name, auto-kicking' % client.name
-            logMessage = '<JOIN-AUTOKICK> Name: \'%s\' (Host: %s, ClientID: %s)' % (
-                client.name, client.hostname, client.id)
-            conn.logger.info(logMessage)
-            utils.msgChannel(irc, conn.channel, text)
-
-            command = 'kick %s "This name is blacklisted - please change your name and rejoin"' % client.id
-            conn.rcon = conn.channel
-            conn.send_packet(AdminRcon, command=command)
-            return
-
-        text = '*** %s has joined' % client.name
-        logMessage = '<JOIN> Name: \'%s\' (Host: %s, ClientID: %s)' % (
-            client.name, client.hostname, client.id)
+            logMessage = '<JOIN-AUTOKICK> Name: \'%s\' (Host: %s, ClientID: %s, Entry: \'%s\')' % (
+                client.name, client.hostname, client.id, entry)
+            self._kickBlacklisted(conn, client, text, logMessage)
+            return
+
+        name = client.name
+        country = self._clientCountry(client)
+        if country:
+            name = '%s (%s)' % (client.name, country)
+        text = '*** %s has joined' % name
+        logMessage = '<JOIN> Name: \'%s\' (Host: %s, ClientID: %s%s)' % (
+            client.name, client.hostname, client.id,
+            ', Country: %s' % country if country else '')
         conn.logger.info(logMessage)
-        utils.msgChannel(irc, conn.channel, text)
+        self._announce(conn, 'join', name, text, '*** %s have joined')
 
-        if self.registryValue('checkClientVPN', conn.channel):
-            utils.checkIP(irc, conn, client, self.registryValue('checkClientVPNWhitelist'), self.ipdict)
+        if conn.channelConfig.checkClientVPN:
+            self.dispatcher.submit(None, self._checkClientIP, conn, client)
 
-        welcome = self.registryValue('welcomeMessage', conn.channel)
+        welcome = conn.channelConfig.welcomeMessage
         if welcome:
             replacements = {
                 '{clientname}': client.name,
@@ -491,20 +782,36 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
         irc = conn.irc
+        conn.rconEngine.cache.invalidate(CLIENT_QUERIES)
 
         if 'name' in changed:
             text = '*** %s has changed their name to %s' % (
                 old.name, client.name)
-            utils.msgChannel(conn.irc, conn.channel, text)
+            self._announce(conn, 'name', '%s -> %s' % (old.name, client.name),
+                           text, '*** Name changes: %s')
             logMessage = '<NAMECHANGE> Old name: \'%s\' New Name: \'%s\' (Host: %s)' % (
                 old.name, client.name, client.hostname)
             conn.logger.info(logMessage)
 
+            entry = self.nameBlacklist.match(client.name)
+            if entry is not None:
+                text = '*** %s changed their name to a blacklisted name, auto-kicking' % old.name
+                logMessage = '<NAMECHANGE-AUTOKICK> Name: \'%s\' (Host: %s, ClientID: %s, Entry: \'%s\')' % (
+                    client.name, client.hostname, client.id, entry)
+                self._kickBlacklisted(conn, client, text, logMessage)
+
+    def _kickBlacklisted(self, conn, client, text, logMessage):
+        conn.logger.info(logMessage)
+        self.announcer.say(conn.irc, conn.channel, text, MessagePriority.ALERT)
+        command = 'kick %s "This name is blacklisted - please change your name and rejoin"' % client.id
+        conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
+
     def _rcvClientQuit(self, connChan, client, errorcode):
         conn = self.connections.get(connChan)
         if not conn:
             return
         irc = conn.irc
+        conn.rconEngine.cache.invalidate(CLIENT_QUERIES)
 
         if not isinstance(client, (long, int)):
             if errorcode:
@@ -512,7 +819,8 @@ class Suds(callbacks.Plugin):
             else:
                 reason = 'Leaving'
             text = '*** %s has left the game (%s)' % (client.name, reason)
-            utils.msgChannel(irc, conn.channel, text)
+            self._announce(conn, ('quit', reason), client.name, text,
+                           '*** %%s have left the game (%s)' % reason.replace('%', '%%'))
             logMessage = '<QUIT> Name: \'%s\' (Host: %s, ClientID: %s, Reason: \'%s\')' % (
                 client.name, client.hostname, client.id, reason)
             conn.logger.info(logMessage)
@@ -520,6 +828,14 @@ class Suds(callbacks.Plugin):
             # garbage collect the kickdict
             if client.id in self.kickdict:
                 del self.kickdict[client.id]
+            self.commandLimiter.forget((conn.channel, client.id))
+            conn.floodGuard.forget(client.id)
+
+    def _rcvCompanyChange(self, connChan, company, *args):
+        conn = self.connections.get(connChan)
+        if not conn:
+            return
+        conn.rconEngine.cache.invalidate(COMPANY_QUERIES)
 
     def _rcvChat(self, connChan, client, action, destType, clientID, message, data):
         conn = self.connections.get(connChan)
@@ -530,84 +846,24 @@ class Suds(callbacks.Plugin):
         clientName = str(clientID)
         if client != clientID:
             clientName = client.name
+            if action in (Action.CHAT, Action.CHAT_COMPANY, Action.CHAT_CLIENT):
+                strike = conn.floodGuard.chat(clientID)
+                if strike:
+                    self._flooding(conn, client, 'chat messages', strike)
 
         if action == Action.CHAT:
-            rulesUrl = self.registryValue('rulesUrl', conn.channel)
-            text = '<%s> %s' % (clientName, message)
-            utils.msgChannel(irc, conn.channel, text)
-            if message.startswith('!admin'):
-                demand = message.partition(' ')[2]
-                demand = demand.strip()
-                if len(demand) > 0:
-                    text = '*[ADM]* %s requested an admin (reason: %s)' % (clientName, demand)
-                    utils.msgChannel(irc, conn.channel, text)
-                    conn.send_packet(AdminChat,
-                                     action=Action.CHAT,
-                                     destType=DestType.BROADCAST,
-                                     clientID=ClientID.SERVER,
-                                     message=text)
-                else:
-                    text = 'You\'re about to call for an admin to attend - abusing this can result in severe penalties. To use this command, use !admin + a reason'
-                    conn.send_packet(AdminChat,
-                                     action=Action.CHAT,
-                                     destType=DestType.BROADCAST,
-                                     clientID=ClientID.SERVER,
-                                     message=text)
-            elif message.startswith('!nick ') or message.startswith('!name '):
-                newName = message.partition(' ')[2]
-                newName = newName.strip()
-                if len(newName) > 0:
-                    command = 'client_name %s %s' % (clientID, newName)
-                    conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                    conn.send_packet(AdminRcon, command=command)
-            elif message.startswith('!rules') and not rulesUrl.lower() == 'none':
-                self.log.info('should display rules now')
-                text = 'Server rules can be found here: %s' % rulesUrl
-                utils.msgChannel(irc, conn.channel, text)
-                conn.send_packet(AdminChat,
-                                 action=Action.CHAT,
-                                 destType=DestType.BROADCAST,
-                                 clientID=ClientID.SERVER,
-                                 message=text)
-            elif message.startswith('!resetme') or message.startswith('!reset'):
-                if client.play_as == 255:
-                    conn.send_packet(AdminChat,
-                                     action=Action.CHAT_CLIENT,
-                                     destType=DestType.CLIENT,
-                                     clientID=client.id,
-                                     message='You can\'t dissolve the spectators, that\'d be silly!')
+            self.ircRelay.add(conn.channel, clientID, '<%s> ' % clientName, message,
+                              self._relayWindow(conn))
+            command, dummy, argument = message.partition(' ')
+            handler = self.ingameCommands.get(command)
+            if handler:
+                limit = conn.channelConfig.ingameCommandLimit
+                window = conn.channelConfig.ingameCommandWindow
+                if self.commandLimiter.allow((conn.channel, clientID), limit, window):
+                    handler(conn, client, clientName, argument.strip())
                 else:
-                    companyparticipants = []
-                    companyID = client.play_as
-                    companyclients = 0
-                    for c in conn.clients.values():
-                        if client.play_as == companyID:
-                            companyclients + 1
-                    if (companyclients > 1):
-                        conn.send_packet(AdminChat,
-                                         action=Action.CHAT_CLIENT,
-                                         destType=DestType.CLIENT,
-                                         clientID=client.id,
-                                         message='Your company has other players in it - get them to leave before resetting!')
-                    else:
-                        company = conn.companies.get(client.play_as)
-                        self.log.info('Resetting company %s (%s)' % (company.id + 1, company.name))
-                        # notify the public
-                        text = '*** %s has reset their company (%s)' % (clientName, company.name)
-                        utils.msgChannel(irc, conn.channel, text)
-                        conn.send_packet(AdminChat,
-                                         action=Action.CHAT,
-                                         destType=DestType.BROADCAST,
-                                         clientID=ClientID.SERVER,
-                                         message=text)
-                        # move the client out of the company
-                        command = 'move %s 255' % client.id
-                        conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                        conn.send_packet(AdminRcon, command=command)
-                        # reset the company
-                        command = 'reset_company %s' % (company.id + 1)
-                        conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                        conn.send_packet(AdminRcon, command=command)
+                    logMessage = '<RATELIMIT> Name: \'%s\' ignored command: %s' % (clientName, command)
+                    conn.logger.info(logMessage)
         elif action == Action.COMPANY_JOIN or action == Action.COMPANY_NEW:
             if not isinstance(client, (long, int)):
                 company = conn.companies.get(client.play_as)
@@ -615,46 +871,209 @@ class Suds(callbacks.Plugin):
                     text = ('*** %s has joined company #%d' %
                             (client.name, company.id + 1))
                     joining = 'JOIN'
+                    self._announce(conn, ('company', company.id), client.name, text,
+                                   '*** %%s have joined company #%d' % (company.id + 1))
                 else:
                     text = ('*** %s has started a new company #%d' %
                             (client.name, company.id + 1))
                     joining = 'NEW'
+                    self._announce(conn, 'newcompany',
+                                   '%s (#%d)' % (client.name, company.id + 1), text,
+                                   '*** %s have started new companies')
 
                 logMessage = '<COMPANY %s> Name: \'%s\' Company Name: \'%s\' Company ID: %s' % (
                     joining, clientName, company.name, company.id + 1)
-                utils.msgChannel(irc, conn.channel, text)
                 conn.logger.info(logMessage)
 
-            playAsPlayer = self.registryValue('playAsPlayer', conn.channel)
-            kickcount = self.registryValue('playerKickCount', conn.channel)
-            if clientName.lower().startswith('player') and not playAsPlayer:
-                utils.moveToSpectators(irc, conn, client, kickcount, self.kickdict)
+            playAsPlayer = conn.channelConfig.playAsPlayer
+            if not playAsPlayer and isDefaultName(clientName):
+                kickcount = conn.channelConfig.playerKickCount
+                utils.moveToSpectators(functools.partial(self._tellChannel, conn),
+                                       conn, client, kickcount, self.kickdict)
         elif action == Action.COMPANY_SPECTATOR:
             text = '*** %s has joined spectators' % clientName
-            utils.msgChannel(irc, conn.channel, text)
+            self._announce(conn, 'spectators', clientName, text,
+                           '*** %s have joined spectators')
             logMessage = '<SPECTATOR JOIN> Name: \'%s\'' % clientName
             conn.logger.info(logMessage)
 
+    def _flooding(self, conn, client, kind, strike):
+        logMessage = '<FLOOD> Name: \'%s\' (Host: %s, ClientID: %s) is sending too many %s, strike %d' % (
+            client.name, client.hostname, client.id, kind, strike)
+        conn.logger.info(logMessage)
+        if strike == 1:
+            conn.send_packet(AdminChat,
+                             action=Action.CHAT_CLIENT,
+                             destType=DestType.CLIENT,
+                             clientID=client.id,
+                             message='You are sending too many %s. Slow down, or you will be moved to spectators' % kind,
+                             moderation=True)
+            return
+        elif strike == 2:
+            if client.play_as == 255:
+                return
+            text = '*** %s was moved to spectators for sending too many %s' % (client.name, kind)
+            command = 'move %s 255' % client.id
+        else:
+            text = '*** %s was kicked for sending too many %s' % (client.name, kind)
+            command = 'kick %s "Flooding (too many %s)"' % (client.id, kind)
+        conn.send_packet(AdminChat,
+                         action=Action.CHAT,
+                         destType=DestType.BROADCAST,
+                         clientID=ClientID.SERVER,
+                         message=text,
+                         moderation=True)
+        self._tellChannel(conn, text, MessagePriority.ALERT)
+        conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
+
+    def _announce(self, conn, key, name, single, plural):
+        # chat collected so far happened before this
+        self.ircRelay.flush(conn.channel, True)
+        window = conn.channelConfig.announceWindow
+        self.announcer.announce(conn.irc, conn.channel, key, name, single, plural, window)
+
+    def _tellChannel(self, conn, text, priority=MessagePriority.NORMAL):
+        # after the chat and announcements that led up to it
+        self.ircRelay.flush(conn.channel, True)
+        self.announcer.say(conn.irc, conn.channel, text, priority)
+
+    def _relayWindow(self, conn):
+        if not conn.channelConfig.chatRelayPacking:
+            return 0
+        return conn.channelConfig.chatRelayWindow
+
+    def _relayToIrc(self, connChan, text):
+        conn = self.connections.get(connChan)
+        if not conn:
+            return
+        self.announcer.say(conn.irc, conn.channel, text)
+
+    def _relayToGame(self, connChan, text):
+        conn = self.connections.get(connChan)
+        if not conn or conn.connectionstate != ConnectionState.CONNECTED:
+            return
+        conn.send_packet(AdminChat,
+                         action=Action.CHAT,
+                         destType=DestType.BROADCAST,
+                         clientID=ClientID.SERVER,
+                         message=text)
+
+    def _relayStats(self):
+        lines = []
+        toIrc = self.ircRelay.stats()
+        toGame = self.gameRelay.stats()
+        for conn in self.connections.itervalues():
+            ircLines, ircMessages = toIrc.get(conn.channel, (0, 0))
+            gameLines, gamePackets = toGame.get(conn.channel, (0, 0))
+            lines.append('%s: game to IRC %d lines in %d messages, IRC to game %d lines in %d packets' % (
+                utils.getConnectionID(conn), ircLines, ircMessages, gameLines, gamePackets))
+        return lines
+
+    # Ingame commands
+
+    @ingameCommand('!admin')
+    def _ingameAdmin(self, conn, client, clientName, demand):
+        if len(demand) > 0:
+            text = '*[ADM]* %s requested an admin (reason: %s)' % (clientName, demand)
+            self._tellChannel(conn, text, MessagePriority.ALERT)
+            conn.send_packet(AdminChat,
+                             action=Action.CHAT,
+                             destType=DestType.BROADCAST,
+                             clientID=ClientID.SERVER,
+                             message=text)
+        else:
+            text = 'You\'re about to call for an admin to attend - abusing this can result in severe penalties. To use this command, use !admin + a reason'
+            conn.send_packet(AdminChat,
+                             action=Action.CHAT,
+                             destType=DestType.BROADCAST,
+                             clientID=ClientID.SERVER,
+                             message=text)
+
+    @ingameCommand('!nick', '!name')
+    def _ingameName(self, conn, client, clientName, newName):
+        if len(newName) > 0:
+            command = 'client_name %s %s' % (client.id, newName)
+            conn.rconEngine.submit(command)
+
+    @ingameCommand('!rules')
+    def _ingameRules(self, conn, client, clientName, argument):
+        rulesUrl = conn.channelConfig.rulesUrl
+        if rulesUrl.lower() == 'none':
+            return
+        text = 'Server rules can be found here: %s' % rulesUrl
+        self._tellChannel(conn, text)
+        conn.send_packet(AdminChat,
+                         action=Action.CHAT,
+                         destType=DestType.BROADCAST,
+                         clientID=ClientID.SERVER,
+                         message=text)
+
+    @ingameCommand('!reset', '!resetme')
+    def _ingameReset(self, conn, client, clientName, argument):
+        if client.play_as == 255:
+            conn.send_packet(AdminChat,
+                             action=Action.CHAT_CLIENT,
+                             destType=DestType.CLIENT,
+                             clientID=client.id,
+                             message='You can\'t dissolve the spectators, that\'d be silly!')
+        else:
+            companyparticipants = []
+            companyID = client.play_as
+            companyclients = 0
+            for c in conn.clients.values():
+                if client.play_as == companyID:
+                    companyclients + 1
+            if (companyclients > 1):
+                conn.send_packet(AdminChat,
+                                 action=Action.CHAT_CLIENT,
+                                 destType=DestType.CLIENT,
+                                 clientID=client.id,
+                                 message='Your company has other players in it - get them to leave before resetting!')
+            else:
+                company = conn.companies.get(client.play_as)
+                self.log.info('Resetting company %s (%s)' % (company.id + 1, company.name))
+                # notify the public
+                text = '*** %s has reset their company (%s)' % (clientName, company.name)
+                self._tellChannel(conn, text)
+                conn.send_packet(AdminChat,
+                                 action=Action.CHAT,
+                                 destType=DestType.BROADCAST,
+                                 clientID=ClientID.SERVER,
+                                 message=text)
+                # move the client out of the company, then reset it
+                conn.rconEngine.submit([
+                    'move %s 255' % client.id,
+                    'reset_company %s' % (company.id + 1)])
+
     def _rcvRcon(self, connChan, result, colour):
         conn = self.connections.get(connChan)
-        if not conn or conn.rconState == RconStatus.IDLE:
+        if not conn:
+            return
+        command, request = conn.rconEngine.received()
+        if not request:
             return
         irc = conn.irc
 
-        if conn.rconNick:
-            resultobj = conn.rconResults.get(conn.rconNick)
-            if not resultobj:
+        if request.state == RconStatus.ACTIVE:
+            if request.output is None:
+                return
+            if command.startswith('move') or command.startswith('kick'):
+                # these echo the resulting console message, don't repeat it
+                if result[3:].startswith('***'):
+                    return
+            request.output.append(result)
+            if request.callback:
                 return
-            resultobj.results.put(result)
-        elif conn.rconState == RconStatus.SHUTDOWNSAVED:
+            if conn.channelConfig.rconStreaming:
+                self._streamRcon(conn, request)
+        elif request.state == RconStatus.SHUTDOWNSAVED:
             if result.startswith('Map successfully saved'):
                 utils.msgChannel(irc, conn.channel, 'Successfully saved game as autosavesoap.sav')
                 conn.connectionstate = ConnectionState.SHUTDOWN
                 command = 'quit'
-                conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                conn.send_packet(AdminRcon, command=command)
+                conn.rconEngine.submit(command)
             return
-        elif conn.rconState == RconStatus.UPDATESAVED:
+        elif request.state == RconStatus.UPDATESAVED:
             if result.startswith('Map successfully saved'):
                 message = 'Game saved. Shutting down server to finish update. We\'ll be back shortly'
                 utils.msgChannel(irc, conn.channel, message)
@@ -665,20 +1084,13 @@ class Suds(callbacks.Plugin):
                                  message=message)
                 conn.connectionstate = ConnectionState.SHUTDOWN
                 command = 'quit'
-                conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                conn.send_packet(AdminRcon, command=command)
+                conn.rconEngine.submit(command)
 
                 ofsCommand = 'ofs-svntobin.py'
                 successText = None
-                connectionid = utils.getConnectionID(conn)
-                cmdThread = threading.Thread(
-                    target=self._commandThread,
-                    name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-                    args=[conn, irc, ofsCommand, successText, 15])
-                cmdThread.daemon = True
-                cmdThread.start()
-            return
-        elif conn.rconState == RconStatus.RESTARTSAVED:
+                self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText, 15)
+            return
+        elif request.state == RconStatus.RESTARTSAVED:
             if result.startswith('Map successfully saved'):
                 message = 'Game saved. Restarting server...'
                 utils.msgChannel(irc, conn.channel, message)
@@ -689,18 +1101,11 @@ class Suds(callbacks.Plugin):
                                  message=message)
                 conn.connectionstate = ConnectionState.SHUTDOWN
                 command = 'quit'
-                conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                conn.send_packet(AdminRcon, command=command)
+                conn.rconEngine.submit(command)
 
                 ofsCommand = 'ofs-start.py'
                 successText = 'Server is starting'
-                connectionid = utils.getConnectionID(conn)
-                cmdThread = threading.Thread(
-                    target=self._commandThread,
-                    name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-                    args=[conn, irc, ofsCommand, successText, 15])
-                cmdThread.daemon = True
-                cmdThread.start()
+                self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText, 15)
             return
 
     def _rcvRconEnd(self, connChan, command):
@@ -708,44 +1113,116 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
 
-        nick = conn.rconNick
-        rconresult = conn.rconResults.get(nick)
-        if conn.rconCommands.empty():
-            conn.rconNick = None
-            conn.rconState = RconStatus.IDLE
-            if rconresult:
-                irc = rconresult.irc
-                for i in range(5):
-                    if not rconresult.results.empty():
-                        text = rconresult.results.get()
-                        if text[3:].startswith('***') and (
-                                command.startswith('move') or
-                                command.startswith('kick')):
-                            pass
-                        else:
-                            irc.reply(text, prefixNick=False)
-                    else:
-                        break
-                if rconresult.results.empty():
-                    del conn.rconResults[nick]
-                elif rconresult.results.qsize() <= 2:
-                    for i in range(2):
-                        if not rconresult.results.empty():
-                            text = rconresult.results.get()
-                            irc.reply(text, prefixNick=False)
-                        else:
-                            break
-                else:
-                    actionChar = conf.get(conf.supybot.reply.whenAddressedBy.chars)[:1]
-                    text = 'You have %d more messages. Type %sless to view them' % (
-                        rconresult.results.qsize(), actionChar)
-                    irc.reply(text)
-                if rconresult.succestext:
-                    irc.reply(rconresult.succestext)
+        for request in conn.rconEngine.ended(command):
+            if request.callback:
+                request.callback(request)
+                request.output.close()
+                continue
+            if not request.irc:
+                continue
+            if request.streamTimer:
+                request.streamTimer.cancel()
+                request.streamTimer = None
+            if request.streamed:
+                self._flushRconStream(conn, request)
+                self._rconOverflow(conn, request.nick, request.output, request.irc)
+            else:
+                self._rconReply(conn, request.nick, request.output, request.irc)
+            if request.succestext:
+                request.irc.reply(request.succestext)
+
+    def _rconReply(self, conn, nick, output, irc, page=None):
+        pageSize = conn.channelConfig.rconPageSize
+        if page == 'all':
+            lines = output.read(output.remaining())
+        elif page:
+            lines = output.page(page, pageSize)
+            if lines:
+                irc.reply('Page %d of %d' % (page, output.pages(pageSize)),
+                          prefixNick=False)
         else:
-            command = conn.rconCommands.get()
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
+            lines = output.read(pageSize)
+            # don't make anyone type less for just a line or two
+            if output.remaining() <= 2:
+                lines.extend(output.read(output.remaining()))
+        for line in lines:
+            irc.reply(line, prefixNick=False)
+        self._rconOverflow(conn, nick, output, irc)
+
+    def _rconOverflow(self, conn, nick, output, irc):
+        pageSize = conn.channelConfig.rconPageSize
+        if output.dropped and not output.remaining():
+            irc.reply('%d more lines were dropped' % output.dropped)
+
+        if output.remaining():
+            conn.rconPager.keep(nick, output)
+            actionChar = conf.get(conf.supybot.reply.whenAddressedBy.chars)[:1]
+            text = 'You have %d more messages (%d pages of %d). Type %sless [page|all] to view them' % (
+                output.remaining(), output.pages(pageSize), pageSize, actionChar)
+            irc.reply(text)
+        elif conn.rconPager.get(nick) is not output:
+            output.close()
+
+    def _streamRcon(self, conn, request, timer=False):
+        # Runs for every line of output, and from the stream timer. Lines go
+        # out once a window full has come in, or the timer fires, whichever
+        # is first
+        if timer:
+            request.streamTimer = None
+            if request.done:
+                return
+        budget = conn.channelConfig.rconStreamBudget
+        if request.streamed >= budget:
+            return
+        window = conn.channelConfig.rconStreamLines
+        if timer or request.output.remaining() >= window:
+            if request.streamTimer:
+                request.streamTimer.cancel()
+                request.streamTimer = None
+            self._flushRconStream(conn, request)
+        elif request.output.remaining() and not request.streamTimer:
+            interval = conn.channelConfig.rconStreamInterval
+            request.streamTimer = self.reactor.callLater(interval,
+                self.dispatcher.submit, conn.channel, self._streamRcon,
+                conn, request, True)
+
+    def _flushRconStream(self, conn, request):
+        budget = conn.channelConfig.rconStreamBudget
+        output = request.output
+        lines = output.read(min(output.remaining(), budget - request.streamed))
+        request.streamed += len(lines)
+        for line in lines:
+            request.irc.reply(line, prefixNick=False)
+
+    def _reputationStats(self):
+        entries, hits, misses, evictions, dirty, writes = self.reputation.stats()
+        lookups = hits + misses
+        return ['IP reputation: %d of %d entries (%d loaded from disk), %d hits, %d misses (%.0f%% hit rate), '
+                '%d evicted, %d changes pending, %d written' % (
+                entries, self.reputation.maxEntries, self.reputation.loaded, hits, misses,
+                100.0 * hits / lookups if lookups else 0, evictions, dirty, writes),
+                'IP validator: %d requests, %d coalesced, %d rejected, %d failed, '
+                '%d in flight, circuit %s' % self.validator.stats(),
+                self._blocklistStats(), self._geoipStats()]
+
+    def _geoipStats(self):
+        if not self.geoip:
+            return 'GeoIP: no table loaded'
+        v4, v6, cached, hits, misses = self.geoip.stats()
+        return 'GeoIP: %d IPv4 and %d IPv6 ranges, %d cached, %d hits, %d misses' % (
+            v4, v6, cached, hits, misses)
+
+    def _blocklistStats(self):
+        v4, v6, files, lookups, listed = self.blocklist.stats()
+        return ('Blocklist: %d IPv4 and %d IPv6 ranges from %d files, %d of %d checked joins '
+                'resolved locally (%.0f%%)' % (v4, v6, files, listed, lookups,
+                100.0 * listed / lookups if lookups else 0))
+
+    def _expireRconOutput(self):
+        ttl = self.registryValue('rconOutputTTL')
+        for conn in self.connections.itervalues():
+            conn.rconPager.expire(ttl)
+        self.reactor.callLater(60, self._expireRconOutput)
 
     def _rcvConsole(self, connChan, origin, message):
         conn = self.connections.get(connChan)
@@ -760,7 +1237,7 @@ class Suds(callbacks.Plugin):
                 ('reported an error' in message and not 'IRC' in message)):
             ircMessage = message.replace("\n", ", ")
             ircMessage = ircMessage.replace("?", ", ")
-            utils.msgChannel(irc, conn.channel, ircMessage)
+            utils.msgChannel(irc, conn.channel, ircMessage, MessagePriority.ALERT)
         else:
             ircMessage = message[3:]
             if ircMessage.startswith('***') and 'paused' in ircMessage:
@@ -777,6 +1254,9 @@ class Suds(callbacks.Plugin):
             client = conn.clients.get(clientID)
             if client:
                 name = client.name
+                strike = conn.floodGuard.command(clientID)
+                if strike:
+                    self._flooding(conn, client, 'commands', strike)
             else:
                 name = clientID
         commandName = conn.commands.get(commandID)
@@ -813,14 +1293,12 @@ class Suds(callbacks.Plugin):
 
         if conn.connectionstate == ConnectionState.CONNECTED:
             irc.reply('Already connected!!', prefixNick=False)
+        elif conn.connectionstate in (ConnectionState.CONNECTING,
+                ConnectionState.AUTHENTICATING):
+            irc.reply('Already connecting!!', prefixNick=False)
         else:
             # just in case an existing connection failed to de-register upon disconnect
-            try:
-                self._pollObj.unregister(conn.filenumber)
-            except KeyError:
-                pass
-            except IOError:
-                pass
+            self.reactor.unregister(conn.filenumber)
             self._connectOTTD(irc, conn, source)
 
     apconnect = wrap(apconnect, [optional('text')])
@@ -836,13 +1314,35 @@ class Suds(callbacks.Plugin):
             return
 
         if conn.connectionstate == ConnectionState.CONNECTED:
+            self.reconnector.cancel(conn.channel)
             conn.connectionstate = ConnectionState.DISCONNECTING
             utils.disconnect(conn, False)
+        elif self.reconnector.attempts(conn.channel):
+            self.reconnector.cancel(conn.channel)
+            irc.reply('Stopped trying to reconnect', prefixNick=False)
         else:
             irc.reply('Not connected!!', prefixNick=False)
 
     apdisconnect = wrap(apdisconnect, [optional('text')])
 
+    def reconnects(self, irc, msg, args):
+        """ Takes no arguments
+
+        Shows the servers the bot is trying to (re)connect to, and when it
+        will try next
+        """
+
+        status = self.reconnector.status()
+        if not status:
+            irc.reply('Not waiting to reconnect to any server', prefixNick=False)
+            return
+        for connChan, text in status:
+            conn = self.connections.get(connChan)
+            name = conn and utils.getConnectionID(conn) or connChan
+            irc.reply('%s: %s' % (name, text), prefixNick=False)
+
+    reconnects = wrap(reconnects)
+
     def date(self, irc, msg, args, serverID):
         """ [Server ID or channel]
 
@@ -865,23 +1365,24 @@ class Suds(callbacks.Plugin):
     date = wrap(date, [optional('text')])
 
     def rcon(self, irc, msg, args, parameters):
-        """ [Server ID or channel] <rcon command>
+        """ [Server ID, channel, glob or all] <rcon command>
 
-        sends a rcon command to the [specified] openttd server
+        sends a rcon command to the [specified] openttd server. With all or a
+        glob pattern, the command goes to every matching server at once
         """
 
         command = ''
         (firstWord, dummy, remainder) = parameters.partition(' ')
+        conns = self._ircMultiInit(irc, msg, firstWord, True)
+        if conns is not None:
+            self._rconFanout(irc, msg, conns, remainder)
+            return
         (source, conn, command) = self._ircRconInit(irc, msg, firstWord, remainder, command, True)
         if not conn:
             return
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState != RconStatus.IDLE:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
-            return
 
         if len(command) >= NETWORK_RCONCOMMAND_LENGTH:
             message = "RCON Command too long (%d/%d)" % (
@@ -892,61 +1393,80 @@ class Suds(callbacks.Plugin):
         logMessage = '<RCON> Nick: %s, command: %s' % (msg.nick, command)
         conn.logger.info(logMessage)
 
-        conn.rconNick = msg.nick
-        conn.rconState = RconStatus.ACTIVE
-        resultdict = utils.RconResults({
-            'irc': irc,
-            'succestext': None,
-            'command': command,
-            'results': Queue.Queue()
-        })
-        conn.rconResults[conn.rconNick] = resultdict
-        conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-        conn.send_packet(AdminRcon, command=command)
+        if command.lower().startswith('set '):
+            conn.serverSettings.invalidate()
+        output = conn.rconEngine.cached(command)
+        if output is not None:
+            self._rconReply(conn, msg.nick, output, irc)
+            return
+        conn.rconEngine.submit(command, irc=irc, nick=msg.nick, cache=True)
 
     rcon = wrap(rcon, ['text'])
 
-    def less(self, irc, msg, args, serverID):
-        """ [Server ID or channel]
+    def _rconFanout(self, irc, msg, conns, command):
+        if not command:
+            irc.reply('No rcon command given')
+            return
+        if len(command) >= NETWORK_RCONCOMMAND_LENGTH:
+            message = "RCON Command too long (%d/%d)" % (
+                len(command), NETWORK_RCONCOMMAND_LENGTH)
+            irc.reply(message, prefixNick=False)
+            return
+        connected = [conn for conn in conns
+                     if conn.connectionstate == ConnectionState.CONNECTED]
+        if not connected:
+            self._fleetReply(irc, conns, None)
+            return
+        for conn in connected:
+            if command.lower().startswith('set '):
+                conn.serverSettings.invalidate()
+            logMessage = '<RCON> Nick: %s, command: %s' % (msg.nick, command)
+            conn.logger.info(logMessage)
 
-        outputs remaining rcon output which didn't get shown in the previous rounds
+        timeout = self.registryValue('fanoutTimeout')
+        def done(fanout):
+            for conn in conns:
+                lines = fanout.results.get(conn)
+                if conn.connectionstate != ConnectionState.CONNECTED and lines is None:
+                    text = 'Not connected'
+                elif lines is None:
+                    text = 'Busy, no answer within %ds' % timeout
+                elif not lines:
+                    text = 'Done'
+                else:
+                    text = ' | '.join(lines[:3])
+                    if len(lines) > 3:
+                        text += ' (+%d more lines)' % (len(lines) - 3)
+                irc.reply('%s: %s' % (utils.getConnectionID(conn), text), prefixNick=False)
+        RconFanout(self.reactor, connected, command, timeout, done).start()
+
+    def less(self, irc, msg, args, page, serverID):
+        """ [page|all] [Server ID or channel]
+
+        outputs remaining rcon output which didn't get shown in the previous
+        rounds. With a page number, shows that page of the output, with all
+        shows everything that is left
         """
 
         source, conn = self._ircCommandInit(irc, msg, serverID, False)
         if not conn:
             return
 
-        if conn.connectionstate != ConnectionState.CONNECTED:
-            irc.reply('Not connected!!', prefixNick=False)
+        output = conn.rconPager.get(msg.nick)
+        if not output:
+            text = 'There are no more messages to display kemosabi'
+            irc.reply(text)
             return
-
-        rconresult = conn.rconResults.get(msg.nick)
-        if rconresult:
-            for i in range(5):
-                if not rconresult.results.empty():
-                    text = rconresult.results.get()
-                    irc.reply(text, prefixNick=False)
-                else:
-                    break
-            if rconresult.results.empty():
-                del conn.rconResults[msg.nick]
-            elif rconresult.results.qsize() <= 2:
-                for i in range(2):
-                    if not rconresult.results.empty():
-                        text = rconresult.results.get()
-                        irc.reply(text, prefixNick=False)
-                    else:
-                        break
-            else:
-                actionChar = conf.get(conf.supybot.reply.whenAddressedBy.chars)[:1]
-                text = 'You have %d more messages. Type %sless to view them' % (
-                    rconresult.results.qsize(), actionChar)
-                irc.reply(text)
-        else:
+        pageSize = conn.channelConfig.rconPageSize
+        if page and page != 'all' and page > output.pages(pageSize):
+            irc.reply('There are only %d pages' % output.pages(pageSize))
+        elif not page and not output.remaining():
             text = 'There are no more messages to display kemosabi'
             irc.reply(text)
+        else:
+            self._rconReply(conn, msg.nick, output, irc, page)
 
-    less = wrap(less, [optional('text')])
+    less = wrap(less, [optional(first('positiveInt', ('literal', 'all'))), optional('text')])
 
     def shutdown(self, irc, msg, args, serverID):
         """ [Server ID or channel]
@@ -962,16 +1482,8 @@ class Suds(callbacks.Plugin):
             irc.reply('Not connected!!', prefixNick=False)
             return
 
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('save autosave/autosavesoap')
-            conn.rconState = RconStatus.SHUTDOWNSAVED
-            command = conn.rconCommands.get()
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        command = 'save autosave/autosavesoap'
+        conn.rconEngine.submit(command, state=RconStatus.SHUTDOWNSAVED)
 
     shutdown = wrap(shutdown, [optional('text')])
 
@@ -989,14 +1501,8 @@ class Suds(callbacks.Plugin):
             irc.reply('Not connected!!', prefixNick=False)
             return
 
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconState = RconStatus.RESTARTSAVED
-            command = 'save autosave/autosavesoap'
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        command = 'save autosave/autosavesoap'
+        conn.rconEngine.submit(command, state=RconStatus.RESTARTSAVED)
 
     restart = wrap(restart, [optional('text')])
 
@@ -1013,24 +1519,8 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('content update')
-            conn.rconNick = msg.nick
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            resultdict = utils.RconResults({
-                'irc': irc,
-                'succestext': None,
-                'command': command,
-                'results': Queue.Queue()
-            })
-            conn.rconResults[conn.rconNick] = resultdict
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-            irc.reply('Performing content update')
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        conn.rconEngine.submit('content update', irc=irc, nick=msg.nick)
+        irc.reply('Performing content update')
 
     contentupdate = wrap(contentupdate, [optional('text')])
 
@@ -1047,25 +1537,9 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('content select all')
-            conn.rconCommands.put('content upgrade')
-            conn.rconCommands.put('content download')
-            conn.rconNick = msg.nick
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            resultdict = utils.RconResults({
-                'irc': irc,
-                'succestext': None,
-                'command': command,
-                'results': Queue.Queue()
-            })
-            conn.rconResults[conn.rconNick] = resultdict
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        commands = ['content select all', 'content upgrade', 'content download']
+        conn.rconEngine.submit(commands, irc=irc, nick=msg.nick,
+                               priority=RconPriority.BULK)
 
     content = wrap(content, [optional('text')])
 
@@ -1082,26 +1556,10 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            irc.reply('Scanning content directories')
-            conn.rconCommands.put('rescannewgrf')
-            conn.rconCommands.put('rescanai')
-            conn.rconCommands.put('rescangame')
-            conn.rconNick = msg.nick
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            resultdict = utils.RconResults({
-                'irc': irc,
-                'succestext': 'Rescan completed',
-                'command': command,
-                'results': Queue.Queue()
-            })
-            conn.rconResults[conn.rconNick] = resultdict
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        irc.reply('Scanning content directories')
+        commands = ['rescannewgrf', 'rescanai', 'rescangame']
+        conn.rconEngine.submit(commands, irc=irc, nick=msg.nick,
+                               succestext='Rescan completed')
 
     rescan = wrap(rescan, [optional('text')])
 
@@ -1118,20 +1576,7 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('save game')
-            conn.rconNick = msg.nick
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            resultdict = utils.RconResults({
-                'irc': irc,
-                'succestext': None,
-                'command': command,
-                'results': Queue.Queue()
-            })
-            conn.rconResults[conn.rconNick] = resultdict
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
+        conn.rconEngine.submit('save game', irc=irc, nick=msg.nick)
 
     save = wrap(save, [optional('text')])
 
@@ -1148,15 +1593,7 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('pause')
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        conn.rconEngine.submit('pause')
 
     pause = wrap(pause, [optional('text')])
 
@@ -1174,19 +1611,12 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
-        if conn.rconState == RconStatus.IDLE:
-            minPlayers = self.registryValue('minPlayers', conn.channel)
-            if minPlayers > 0:
-                conn.rconCommands.put('set min_active_clients %s' %
-                                      minPlayers)
-            conn.rconCommands.put('unpause')
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        commands = []
+        minPlayers = self.registryValue('minPlayers', conn.channel)
+        if minPlayers > 0:
+            commands.append('set min_active_clients %s' % minPlayers)
+        commands.append('unpause')
+        conn.rconEngine.submit(commands)
 
     auto = wrap(auto, [optional('text')])
 
@@ -1204,16 +1634,7 @@ class Suds(callbacks.Plugin):
             irc.reply('Not connected!!', prefixNick=False)
             return
 
-        if conn.rconState == RconStatus.IDLE:
-            conn.rconCommands.put('set min_active_clients 0')
-            conn.rconCommands.put('unpause')
-            conn.rconState = RconStatus.ACTIVE
-            command = conn.rconCommands.get()
-            conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-            conn.send_packet(AdminRcon, command=command)
-        else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+        conn.rconEngine.submit(['set min_active_clients 0', 'unpause'])
 
     unpause = wrap(unpause, [optional('text')])
 
@@ -1250,11 +1671,15 @@ class Suds(callbacks.Plugin):
     ip = wrap(ip, [optional('text')])
 
     def info(self, irc, msg, args, serverID):
-        """ [Server ID or channel]
+        """ [Server ID, channel, glob or all]
 
         Shows some basic information about the server
         """
 
+        conns = self._ircMultiInit(irc, msg, serverID, False)
+        if conns is not None:
+            self._fleetReply(irc, conns, self._serverInfo)
+            return
         source, conn = self._ircCommandInit(irc, msg, serverID, False)
         if not conn:
             return
@@ -1262,6 +1687,11 @@ class Suds(callbacks.Plugin):
         if conn.connectionstate != ConnectionState.CONNECTED:
             irc.reply('Not connected!!', prefixNick=False)
             return
+        irc.reply(self._serverInfo(conn))
+
+    info = wrap(info, [optional('text')])
+
+    def _serverInfo(self, conn):
         version = conn.serverinfo.version
         name = conn.serverinfo.name
         size = '%dx%d' % (conn.mapinfo.x, conn.mapinfo.y)
@@ -1281,10 +1711,8 @@ class Suds(callbacks.Plugin):
             clients = ', clients connected: %d' % clients
         else:
             clients = ''
-        irc.reply('%s, Version: %s, date: %s%s, map size: %s%s' %
-                  (name, version, date, clients, size, ip))
-
-    info = wrap(info, [optional('text')])
+        return '%s, Version: %s, date: %s%s, map size: %s%s' % (
+            name, version, date, clients, size, ip)
 
     def vehicles(self, irc, msg, args, serverID):
         """ [Server ID or channel]
@@ -1358,7 +1786,7 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
 
-        rulesUrl = self.registryValue('rulesUrl', conn.channel)
+        rulesUrl = conn.channelConfig.rulesUrl
         if not rulesUrl.lower() == 'none':
             text = 'Server rules can be found here: %s' % rulesUrl
             irc.reply(text, prefixNick=False)
@@ -1408,11 +1836,16 @@ class Suds(callbacks.Plugin):
     companies = wrap(companies, [optional('text')])
 
     def players(self, irc, msg, args, serverID):
-        """ [Server ID or channel]
+        """ [Server ID, channel, glob or all]
 
-        Show a list of players currently playing
+        Show a list of players currently playing. For more than one server,
+        shows how many there are on each
         """
 
+        conns = self._ircMultiInit(irc, msg, serverID, False)
+        if conns is not None:
+            self._fleetReply(irc, conns, utils.playercount)
+            return
         isOp = True
         source, conn = self._ircCommandInit(irc, msg, serverID, True)
         if not conn:
@@ -1433,12 +1866,14 @@ class Suds(callbacks.Plugin):
                     if conn.serverinfo.dedicated and client.id == 1:
                         pass
                     else:
-                        spectators.append('Client %d (%s)' % (client.id, client.name))
+                        spectators.append('Client %d (%s%s)' % (
+                            client.id, client.name, self._countrySuffix(client)))
                 else:
                     company = conn.companies.get(client.play_as)
                     companyColour = utils.getColourNameFromNumber(company.colour)
-                    players.append('Client %d (%s) is %s, in company %s (%s)' %
-                                   (client.id, companyColour, client.name, company.id + 1,
+                    players.append('Client %d (%s) is %s%s, in company %s (%s)' %
+                                   (client.id, companyColour, client.name,
+                                    self._countrySuffix(client), company.id + 1,
                                     company.name))
             spectators.sort()
             players.sort()
@@ -1456,11 +1891,15 @@ class Suds(callbacks.Plugin):
     players = wrap(players, [optional('text')])
 
     def playercount(self, irc, msg, args, serverID):
-        """ [Server ID or channel]
+        """ [Server ID, channel, glob or all]
 
         Tells you the number of players and spectators on the server at this moment
         """
 
+        conns = self._ircMultiInit(irc, msg, serverID, False)
+        if conns is not None:
+            self._fleetReply(irc, conns, utils.playercount)
+            return
         source, conn = self._ircCommandInit(irc, msg, serverID, False)
         if not conn:
             return
@@ -1518,28 +1957,41 @@ class Suds(callbacks.Plugin):
             irc.reply('Cannot read from %s, please set it to a valid bot-readable file. Absolute path is a must'
                       % rconFile)
             return
-        if conn.rconState == RconStatus.IDLE:
-            commandlist = []
-            with open(rconFile) as rf:
-                for line in rf.readlines():
-                    commandlist.append(line.rstrip())
-            if len(commandlist):
-                commandlist.sort()
-                for item in commandlist:
-                    conn.rconCommands.put(item)
-                conn.rconState = RconStatus.ACTIVE
-                command = conn.rconCommands.get()
-                conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
-                conn.send_packet(AdminRcon, command=command)
-                irc.reply('Setting default settings: %s' % format('%L', commandlist))
-            else:
-                irc.reply('No commands found in %s.' % rconFile)
+        settings, commands = soapsettings.loadDefaults(rconFile)
+        if not settings and not commands:
+            irc.reply('No commands found in %s.' % rconFile)
+            return
+
+        if conn.serverSettings.fresh(self.registryValue('settingsCacheTime')):
+            self._applyDefaults(conn, irc, settings, commands)
         else:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
+            def fetched(request):
+                conn.serverSettings.update(request.output.lines(0, request.output.total))
+                self._applyDefaults(conn, irc, settings, commands)
+            conn.rconEngine.submit('list_settings', priority=RconPriority.BULK,
+                                   callback=fetched)
 
     setdef = wrap(setdef, [optional('text')])
 
+    def _applyDefaults(self, conn, irc, settings, commands):
+        changes, unchanged = conn.serverSettings.diff(settings)
+        commandlist = commands + ['set %s %s' % (name, value)
+                                  for name, current, value in changes]
+        if commandlist:
+            commandlist.sort()
+            conn.rconEngine.submit(commandlist, priority=RconPriority.BULK)
+        conn.serverSettings.apply(changes)
+
+        changed = ['%s (%s -> %s)' % (name, current, value) if current is not None
+                   else '%s (%s)' % (name, value)
+                   for name, current, value in changes]
+        if changed:
+            irc.reply('Setting default settings: %s' % format('%L', changed))
+        if commands:
+            irc.reply('Running commands: %s' % format('%L', commands))
+        if unchanged:
+            irc.reply('%d settings already had their default value' % unchanged)
+
     def download(self, irc, msg, args, osType, serverID):
         """ [OS type/program] [Server ID or channel]
 
@@ -1577,6 +2029,49 @@ class Suds(callbacks.Plugin):
                                          ['lin', 'lin64', 'osx', 'ottdau', 'win32', 'win64', 'win9x', 'source'])),
                                optional('text')])
 
+    def _rconStats(self):
+        lines = []
+        for conn in self.connections.itervalues():
+            inflight, waiting = conn.rconEngine.stats()
+            outputs, outputLines = conn.rconPager.stats()
+            lines.append('%s: %d rcon commands in flight, queued: %d moderation, %d interactive, %d bulk; %d lines kept for less in %d outputs' % (
+                utils.getConnectionID(conn), inflight,
+                waiting[RconPriority.MODERATION], waiting[RconPriority.INTERACTIVE],
+                waiting[RconPriority.BULK], outputLines, outputs))
+            if conn.chatThrottle is not None:
+                lines.append('%s: %d chat messages waiting to be sent' % (
+                    utils.getConnectionID(conn), conn.chatThrottle.depth()))
+            entries, hits, misses, invalidations = conn.rconEngine.cache.stats()
+            lines.append('%s: rcon cache %d entries, %d hits, %d misses, %d invalidations' % (
+                utils.getConnectionID(conn), entries, hits, misses, invalidations))
+        return lines
+
+    def metrics(self, irc, msg, args, section):
+        """ [section]
+
+        Shows runtime statistics of the plugin. Available sections: dispatch,
+        irc, rcon, relay, reputation
+        """
+
+        sections = {
+            'dispatch': self.dispatcher.stats,
+            'rcon': self._rconStats,
+            'irc': self.output.stats,
+            'relay': self._relayStats,
+            'reputation': self._reputationStats,
+        }
+        if not section:
+            irc.reply('Available sections: %s' % ', '.join(sorted(sections)))
+            return
+        stats = sections.get(section.lower())
+        if not stats:
+            irc.reply('Unknown section %s' % section)
+            return
+        for line in stats():
+            irc.reply(line, prefixNick=False)
+
+    metrics = wrap(metrics, [optional('something')])
+
     def help(self, irc, msg, args):
         """  Takes no arguments
 
@@ -1605,16 +2100,13 @@ class Suds(callbacks.Plugin):
         if actionChar and actionChar in text[:1]:
             return
         if not 'ACTION' in text:
-            message = 'IRC <%s> %s' % (msg.nick, text)
+            self.gameRelay.add(conn.channel, msg.nick, 'IRC <%s> ' % msg.nick, text,
+                               self._relayWindow(conn))
         else:
             text = text.split(' ', 1)[1]
             text = text[:-1]
-            message = 'IRC ** %s %s' % (msg.nick, text)
-        conn.send_packet(AdminChat,
-                         action=Action.CHAT,
-                         destType=DestType.BROADCAST,
-                         clientID=ClientID.SERVER,
-                         message=message)
+            # actions read oddly when packed, send them as they are
+            self.gameRelay.add(conn.channel, None, '', 'IRC ** %s %s' % (msg.nick, text), 0)
 
     # ofs related commands
 
@@ -1632,13 +2124,7 @@ class Suds(callbacks.Plugin):
             irc.reply('Starting download...', prefixNick=False)
             ofsCommand = 'ofs-getsave.py %s' % saveUrl
             successText = 'Savegame successfully downloaded'
-            connectionid = utils.getConnectionID(conn)
-            cmdThread = threading.Thread(
-                target=self._commandThread,
-                name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-                args=[conn, irc, ofsCommand, successText])
-            cmdThread.daemon = True
-            cmdThread.start()
+            self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText)
         else:
             irc.reply('Sorry, only .sav files are supported')
 
@@ -1659,13 +2145,7 @@ class Suds(callbacks.Plugin):
 
         ofsCommand = 'ofs-start.py'
         successText = 'Server is starting...'
-        connectionid = utils.getConnectionID(conn)
-        cmdThread = threading.Thread(
-            target=self._commandThread,
-            name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-            args=[conn, irc, ofsCommand, successText])
-        cmdThread.daemon = True
-        cmdThread.start()
+        self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText)
 
     start = wrap(start, [optional('text')])
 
@@ -1690,13 +2170,7 @@ class Suds(callbacks.Plugin):
             irc.reply('Attempting to transfer %s' % savegame)
             ofsCommand = 'ofs-transfersave.py %d %s' % (gameNo, savegame)
             successText = 'Transfer done. File now at %s' % saveUrl
-            connectionid = utils.getConnectionID(conn)
-            cmdThread = threading.Thread(
-                target=self._commandThread,
-                name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-                args=[conn, irc, ofsCommand, successText])
-            cmdThread.daemon = True
-            cmdThread.start()
+            self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText)
 
     transfer = wrap(transfer, ['int', 'something', optional('text')])
 
@@ -1710,11 +2184,6 @@ class Suds(callbacks.Plugin):
         if not conn:
             return
 
-        if conn.rconState != RconStatus.IDLE:
-            message = 'Sorry, still processing previous rcon command'
-            irc.reply(message, prefixNick=False)
-            return
-
         irc.reply('Starting update...', prefixNick=False)
         if conn.connectionstate == ConnectionState.CONNECTED:
             message = 'Server is being updated, and will shut down in a bit...'
@@ -1725,13 +2194,7 @@ class Suds(callbacks.Plugin):
                              message=message)
         ofsCommand = 'ofs-svnupdate.py'
         successText = 'Game successfully updated'
-        connectionid = utils.getConnectionID(conn)
-        cmdThread = threading.Thread(
-            target=self._commandThread,
-            name='Command.%s.%s' % (connectionid, ofsCommand.split()[0]),
-            args=[conn, irc, ofsCommand, successText])
-        cmdThread.daemon = True
-        cmdThread.start()
+        self.dispatcher.submit(None, self._commandThread, conn, irc, ofsCommand, successText)
 
     update = wrap(update, [optional('text')])
 
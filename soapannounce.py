@@ -0,0 +1,111 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import threading
+
+from enums import MessagePriority
+
+# Room left in an IRC line once the PRIVMSG command and target are added
+MAX_LINE_LENGTH = 400
+
+def joinNames(names, others=0):
+    if others:
+        return '%s and %d other%s' % (', '.join(names), others, '' if others == 1 else 's')
+    if len(names) == 1:
+        return names[0]
+    return '%s and %s' % (', '.join(names[:-1]), names[-1])
+
+class _Batch(object):
+    __slots__ = ('plural', 'items')
+
+    def __init__(self, plural):
+        self.plural = plural
+        self.items = []
+
+    def text(self, maxLength):
+        if len(self.items) == 1:
+            return self.items[0][1]
+        names = [name for name, single in self.items]
+        shown = 1
+        while shown < len(names):
+            text = self.plural % joinNames(names[:shown + 1], len(names) - shown - 1)
+            if len(text) > maxLength:
+                break
+            shown += 1
+        return self.plural % joinNames(names[:shown], len(names) - shown)
+
+class AnnouncementBatcher(object):
+    """
+    Collects announcements of the same kind that arrive within a short
+    window, and sends them to the channel as a single line, like
+    '*** A, B and C have joined'. Lines sent with say() go out immediately,
+    after whatever was collected for that channel so far, so nothing is
+    shown out of order
+    """
+
+    def __init__(self, reactor, send, maxLength=MAX_LINE_LENGTH):
+        self.reactor = reactor
+        self._send = send
+        self.maxLength = maxLength
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def announce(self, irc, channel, key, name, single, plural, window):
+        """
+        Announces name. single is the line to use if nothing else of the
+        same key comes in, plural the line for more names, with %s where the
+        names go
+        """
+        with self._lock:
+            if window <= 0:
+                self._flush(channel)
+                self._send(irc, channel, single, MessagePriority.ROUTINE)
+                return
+            pending = self._pending.get(channel)
+            if pending is None:
+                timer = self.reactor.callLater(window, self.flush, channel)
+                pending = self._pending[channel] = (irc, [], {}, timer)
+            batches, byKey = pending[1], pending[2]
+            batch = byKey.get(key)
+            if batch is None:
+                batch = byKey[key] = _Batch(plural)
+                batches.append(batch)
+            batch.items.append((name, single))
+
+    def say(self, irc, channel, text, priority=MessagePriority.CHAT):
+        with self._lock:
+            self._flush(channel)
+            self._send(irc, channel, text, priority)
+
+    def flush(self, channel):
+        with self._lock:
+            self._flush(channel)
+
+    def flushAll(self):
+        with self._lock:
+            for channel in self._pending.keys():
+                self._flush(channel)
+
+    def _flush(self, channel):
+        # Called with the lock held, sending under it keeps the order
+        pending = self._pending.pop(channel, None)
+        if pending is None:
+            return
+        irc, batches, byKey, timer = pending
+        timer.cancel()
+        for batch in batches:
+            self._send(irc, channel, batch.text(self.maxLength),
+                       MessagePriority.ROUTINE)
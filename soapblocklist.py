@@ -0,0 +1,123 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from bisect import bisect_right
+import os
+import threading
+
+import netaddr
+
+class _Ranges(object):
+    """ Sorted, non-overlapping address ranges of one IP version """
+    __slots__ = ('starts', 'ends', 'labels')
+
+    def __init__(self, ranges):
+        self.starts = []
+        self.ends = []
+        self.labels = []
+        for start, end, label in sorted(ranges):
+            if self.ends and start <= self.ends[-1] + 1:
+                # overlapping or adjacent, the first list keeps its label
+                self.ends[-1] = max(self.ends[-1], end)
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.labels.append(label)
+
+    def find(self, value):
+        index = bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.labels[index]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+class CidrBlocklist(object):
+    """
+    Local list of networks (datacenters, VPN providers, Tor exits) checked
+    before asking the remote validator. Each file holds one address or CIDR
+    subnet per line, # starts a comment. lookup() is a binary search over the
+    merged ranges. reload() rereads the files when they changed and swaps in
+    the new ranges at once, so lookups never see a half loaded list
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._tables = (_Ranges([]), _Ranges([]))
+        self._mtimes = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.listed = 0
+        self.bad = 0
+
+    def _stat(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def reload(self, force=False):
+        """ Returns a list of problems if the files were (re)loaded, else None """
+        mtimes = self._stat()
+        if mtimes == self._mtimes and not force:
+            return None
+        ranges = {4: [], 6: []}
+        problems = []
+        bad = 0
+        for path in self.paths:
+            label = os.path.basename(path)
+            try:
+                with open(path) as listFile:
+                    for line in listFile:
+                        line = line.split('#', 1)[0].strip()
+                        if not line:
+                            continue
+                        try:
+                            network = netaddr.IPNetwork(line)
+                        except (netaddr.AddrFormatError, ValueError):
+                            bad += 1
+                            continue
+                        ranges[network.version].append(
+                            (network.first, network.last, label))
+            except IOError as e:
+                problems.append('%s: %s' % (path, e.strerror))
+        if bad:
+            problems.append('%d invalid entries ignored' % bad)
+        tables = (_Ranges(ranges[4]), _Ranges(ranges[6]))
+        with self._lock:
+            self._tables = tables
+            self._mtimes = mtimes
+            self.bad = bad
+        return problems
+
+    def lookup(self, ipAddr):
+        """ Returns the name of the list ipAddr is on, None if it isn't listed """
+        v4, v6 = self._tables
+        ranges = v4 if ipAddr.version == 4 else v6
+        label = ranges.find(ipAddr.value)
+        with self._lock:
+            self.lookups += 1
+            if label:
+                self.listed += 1
+        return label
+
+    def stats(self):
+        v4, v6 = self._tables
+        return len(v4), len(v6), len(self.paths), self.lookups, self.listed
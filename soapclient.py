@@ -15,14 +15,34 @@
 # <http://www.gnu.org/licenses/>.
 ###
 
+import errno
 import logging
-import Queue
+import os
+import socket
+import struct
+import threading
 
 from libottdadmin2.trackingclient import TrackingAdminClient
 from libottdadmin2.event import Event
 from libottdadmin2.enums import UpdateType, UpdateFrequency
-
-from enums import RconStatus, ConnectionState
+from libottdadmin2.packets import receive
+from libottdadmin2.packets.admin import AdminJoin, AdminChat
+
+from enums import ConnectionState
+from soaprcon import RconEngine, RconPager
+from soapsettings import SettingsSnapshot
+from soapthrottle import PacketThrottle
+from soapreactor import DEFAULT_EVENTMASK, EPOLLOUT
+
+# Every adminport packet starts with its total size (header included) as a
+# little-endian uint16, followed by a uint8 packet type
+PACKET_HEADER = struct.Struct('<HB')
+# A packet can never be larger than what fits in its size field, so a buffer
+# of this size always has room for at least one complete packet
+RECV_BUFFER_SIZE = 0x10000
+# How long a thread other than the reactor waits for the send buffer to drop
+# below the high-water mark before queueing anyway
+SEND_WAIT_TIMEOUT = 5.0
 
 class SoapEvents(object):
     def __init__(self):
@@ -43,9 +63,9 @@ class SoapEvents(object):
         self.clientquit     = Event()
 
         # self.companyinfo    = Event()
-        # self.companynew     = Event()
-        # self.companyupdate  = Event()
-        # self.companyremove  = Event()
+        self.companynew     = Event()
+        self.companyupdate  = Event()
+        self.companyremove  = Event()
         # self.companystats   = Event()
         # self.companyeconomy = Event()
 
@@ -72,16 +92,33 @@ class SoapClient(TrackingAdminClient):
         self.logger = logging.getLogger('Soap-%s' % self.ID)
         self.logger.setLevel(logging.INFO)
 
-        self.rconCommands = Queue.Queue()
-        self.rconNick = None
-        self.rconResults = {}
-        self.rconState = RconStatus.IDLE
+        self.rconEngine = RconEngine(self)
+        self.rconPager = RconPager()
+        self.serverSettings = SettingsSnapshot()
+        self.chatThrottle = None
+        self.floodGuard = None
+        self.channelConfig = None
 
         self.connectionstate = ConnectionState.DISCONNECTED
         self.registered = False
         self.filenumber = None
 
         self.clientPassword = None
+        self.connectTimer = None
+
+        self._recvBuffer = bytearray(RECV_BUFFER_SIZE)
+        self._recvView = memoryview(self._recvBuffer)
+        self._recvStart = 0
+        self._recvEnd = 0
+
+        self.reactor = None
+        self.sendHighWater = 0
+        self.sendCalls = 0
+        self.queuedWrites = 0
+        self._sendBuffer = bytearray()
+        self._sendStart = 0
+        self._sendLock = threading.Lock()
+        self._sendDrained = threading.Condition(self._sendLock)
 
     def _attachEvents(self):
         self.events.connected       += self._rcvConnected
@@ -96,6 +133,10 @@ class SoapClient(TrackingAdminClient):
         self.events.clientupdate    += self._rcvClientUpdate
         self.events.clientquit      += self._rcvClientQuit
 
+        self.events.companynew      += self._rcvCompanyNew
+        self.events.companyupdate   += self._rcvCompanyUpdate
+        self.events.companyremove   += self._rcvCompanyRemove
+
         self.events.chat            += self._rcvChat
         self.events.rcon            += self._rcvRcon
         self.events.rconend         += self._rcvRconEnd
@@ -112,6 +153,227 @@ class SoapClient(TrackingAdminClient):
 
 
 
+    # Non-blocking connecting
+
+    def start_connect(self):
+        """
+        Starts connecting without waiting for the server to answer. Returns
+        None if the connection is under way, or the reason it failed
+        """
+        self.setblocking(False)
+        try:
+            error = self.connect_ex((self.host, self.port))
+        except socket.error as e:
+            # raised for name resolution errors
+            return str(e)
+        if error in (0, errno.EINPROGRESS):
+            return None
+        return os.strerror(error)
+
+    def finish_connect(self):
+        """
+        To be called once the socket became writable after start_connect.
+        Returns None and logs in if the connection was established, or the
+        reason it failed
+        """
+        error = self.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            return os.strerror(error)
+        self.setblocking(True)
+        self.send_packet(AdminJoin, password=self.password, name=self.name,
+                         version=self.version)
+        return None
+
+
+
+    # Buffered packet reading
+
+    def recv_packets(self):
+        """
+        Reads everything the socket has available and dispatches every
+        complete packet in it. Incomplete packets stay in the buffer until the
+        rest arrives. Returns the list of dispatched packets, or None when the
+        connection was closed
+        """
+        packets = []
+        while True:
+            if self._recvEnd == RECV_BUFFER_SIZE:
+                self._compactRecvBuffer()
+            try:
+                nbytes = self.recv_into(self._recvView[self._recvEnd:], 0,
+                                        socket.MSG_DONTWAIT)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                elif e.errno == errno.EINTR:
+                    continue
+                self.logger.debug('>>--DEBUG--<< Socket error while receiving: %s' % e)
+                return None
+            if not nbytes:
+                return None
+            self._recvEnd += nbytes
+            if not self._splitPackets(packets):
+                return None
+        return packets
+
+    def _splitPackets(self, packets):
+        buf = self._recvBuffer
+        start = self._recvStart
+        end = self._recvEnd
+        while end - start >= PACKET_HEADER.size:
+            size, packetType = PACKET_HEADER.unpack_from(buf, start)
+            if size < PACKET_HEADER.size:
+                self.logger.debug('>>--DEBUG--<< Received malformed packet header (size %d)' % size)
+                return False
+            if end - start < size:
+                break
+            payload = self._recvView[start + PACKET_HEADER.size:start + size].tobytes()
+            start += size
+            # handlers may call back into this connection, keep state current
+            self._recvStart = start
+            packets.append(self._dispatchPacket(packetType, payload))
+        if start == end:
+            self._recvStart = self._recvEnd = 0
+        else:
+            self._recvStart = start
+        return True
+
+    def _compactRecvBuffer(self):
+        # Only reached when a partial packet sits at the very end of the
+        # buffer; move it to the front to make room for the remainder
+        remaining = self._recvEnd - self._recvStart
+        self._recvBuffer[:remaining] = self._recvView[self._recvStart:self._recvEnd]
+        self._recvStart = 0
+        self._recvEnd = remaining
+
+    def _dispatchPacket(self, packetType, payload):
+        packet = receive.get(packetType)
+        if packet is None:
+            self.logger.debug('>>--DEBUG--<< Received unknown packet type: %d' % packetType)
+            return packetType
+        self.handle_packet(packet, packet.decode(payload))
+        return packet
+
+
+
+    # Buffered packet writing
+
+    def enable_send_buffer(self, reactor, highWater):
+        """
+        From here on outgoing data is queued and written by the reactor when
+        the socket is writable, instead of by whichever thread sent it
+        """
+        self.sendHighWater = highWater
+        self.reactor = reactor
+
+    def enable_throttle(self, reactor, rconBucket, chatBucket):
+        """
+        Limits how fast rcon commands and chat go out, None as bucket leaves
+        that kind of traffic unlimited
+        """
+        if rconBucket is not None:
+            self.rconEngine.throttle(reactor, rconBucket)
+        if chatBucket is not None:
+            self.chatThrottle = PacketThrottle(reactor, chatBucket,
+                                               super(SoapClient, self).send_packet)
+
+    def send_packet(self, packet, moderation=False, **kwargs):
+        throttle = self.chatThrottle
+        if packet is AdminChat and throttle is not None:
+            return throttle.send(packet, kwargs, moderation)
+        return super(SoapClient, self).send_packet(packet, **kwargs)
+
+    def sendall(self, data, flags=0):
+        # libottdadmin2 writes every encoded packet through sendall, which
+        # makes this the single place to catch all outgoing traffic
+        reactor = self.reactor
+        if reactor is None:
+            self.sendCalls += 1
+            return super(SoapClient, self).sendall(data, flags)
+        with self._sendLock:
+            wasEmpty = self._sendStart == len(self._sendBuffer)
+            self._sendBuffer += data
+            self.queuedWrites += 1
+            if wasEmpty:
+                reactor.modify(self.filenumber, DEFAULT_EVENTMASK | EPOLLOUT)
+            if not reactor.inReactorThread():
+                # Let busy threads feel the backpressure, the reactor itself
+                # must never wait on its own socket
+                remaining = SEND_WAIT_TIMEOUT
+                while (self.pendingBytes() > self.sendHighWater
+                        and self.reactor is not None and remaining > 0):
+                    self._sendDrained.wait(0.1)
+                    remaining -= 0.1
+
+    def pendingBytes(self):
+        return len(self._sendBuffer) - self._sendStart
+
+    def flush_send_buffer(self):
+        """
+        Writes as much of the send buffer as the socket accepts without
+        blocking. Returns False if the connection broke while writing
+        """
+        with self._sendLock:
+            view = memoryview(self._sendBuffer)
+            while self._sendStart < len(self._sendBuffer):
+                try:
+                    sent = self.send(view[self._sendStart:], socket.MSG_DONTWAIT)
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    elif e.errno == errno.EINTR:
+                        continue
+                    self.logger.debug('>>--DEBUG--<< Socket error while sending: %s' % e)
+                    return False
+                self.sendCalls += 1
+                self._sendStart += sent
+            del view
+            self._compactSendBuffer()
+            if self._sendStart == len(self._sendBuffer):
+                if self.reactor is not None:
+                    self.reactor.modify(self.filenumber, DEFAULT_EVENTMASK)
+            if self.pendingBytes() <= self.sendHighWater:
+                self._sendDrained.notify_all()
+        return True
+
+    def _compactSendBuffer(self):
+        if self._sendStart == len(self._sendBuffer):
+            del self._sendBuffer[:]
+            self._sendStart = 0
+        elif self._sendStart > len(self._sendBuffer) // 2:
+            del self._sendBuffer[:self._sendStart]
+            self._sendStart = 0
+
+    def _detachSendBuffer(self):
+        self.rconEngine.throttle(None, None)
+        if self.chatThrottle is not None:
+            self.chatThrottle.stop()
+            self.chatThrottle = None
+        with self._sendLock:
+            self.reactor = None
+            pending = self._sendBuffer[self._sendStart:]
+            del self._sendBuffer[:]
+            self._sendStart = 0
+            self._sendDrained.notify_all()
+        return pending
+
+    def disconnect(self):
+        # Write out whatever is still queued, and let the quit packet go
+        # straight to the socket before it gets closed
+        pending = self._detachSendBuffer()
+        if pending:
+            try:
+                super(SoapClient, self).sendall(pending)
+            except socket.error:
+                pass
+        return super(SoapClient, self).disconnect()
+
+    def force_disconnect(self):
+        self._detachSendBuffer()
+        return super(SoapClient, self).force_disconnect()
+
+
+
     # Insert connection info into parameters
 
     def _rcvConnected(self):
@@ -140,6 +402,15 @@ class SoapClient(TrackingAdminClient):
     def _rcvClientQuit(self, client, errorcode):
         self.soapEvents.clientquit(self.channel, client, errorcode)
 
+    def _rcvCompanyNew(self, company):
+        self.soapEvents.companynew(self.channel, company)
+
+    def _rcvCompanyUpdate(self, old, company, changed):
+        self.soapEvents.companyupdate(self.channel, old, company, changed)
+
+    def _rcvCompanyRemove(self, company, reason):
+        self.soapEvents.companyremove(self.channel, company, reason)
+
     def _rcvChat(self, **kwargs):
         data = dict(kwargs.items())
         data['connChan'] = self.channel
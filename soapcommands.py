@@ -0,0 +1,70 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import deque
+import threading
+import time
+
+def ingameCommand(*names):
+    """
+    Makes the decorated method the handler for the given ingame chat
+    commands. Handlers are called as handler(conn, client, clientName,
+    argument)
+    """
+    def decorate(func):
+        func.ingameCommands = names
+        return func
+    return decorate
+
+def ingameCommands(obj):
+    """ Maps the ingame commands of obj's class to its bound handlers """
+    table = {}
+    cls = type(obj)
+    for name in dir(cls):
+        func = getattr(cls, name, None)
+        for command in getattr(func, 'ingameCommands', ()):
+            table[command] = getattr(obj, name)
+    return table
+
+class SlidingWindowLimiter(object):
+    """
+    Allows at most limit events per key within any window seconds. Only the
+    times of the last limit events are kept for each key
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+
+    def allow(self, key, limit, window):
+        now = time.time()
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = deque()
+            while events and now - events[0] >= window:
+                events.popleft()
+            if len(events) >= limit:
+                return False
+            events.append(now)
+            return True
+
+    def forget(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def __len__(self):
+        return len(self._events)
@@ -0,0 +1,84 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import namedtuple
+
+# Channel values read while handling server events or applied to a running
+# connection. Values only needed by irc commands or when (re)connecting are
+# still looked up in the registry
+SNAPSHOT_VALUES = (
+    'announceWindow',
+    'chatBurst',
+    'chatRate',
+    'chatRelayPacking',
+    'chatRelayWindow',
+    'checkClientVPN',
+    'floodChatLimit',
+    'floodChatWindow',
+    'floodCommandLimit',
+    'floodCommandWindow',
+    'floodForgiveTime',
+    'ingameCommandLimit',
+    'ingameCommandWindow',
+    'moderationReserve',
+    'passwordInterval',
+    'playAsPlayer',
+    'playerKickCount',
+    'rconBurst',
+    'rconPageSize',
+    'rconRate',
+    'rconStreamBudget',
+    'rconStreamInterval',
+    'rconStreamLines',
+    'rconStreaming',
+    'rulesUrl',
+    'welcomeMessage',
+)
+
+# Global values applied to every connection
+SNAPSHOT_GLOBALS = (
+    'rconCacheRules',
+    'rconOutputMaxLines',
+    'rconOutputMemory',
+    'rconPipelineDepth',
+    'rconStarvationLimit',
+)
+
+FLOOD_VALUES = ('floodChatWindow', 'floodChatLimit', 'floodCommandWindow',
+                'floodCommandLimit', 'floodForgiveTime')
+
+ChannelConfig = namedtuple('ChannelConfig', SNAPSHOT_VALUES + SNAPSHOT_GLOBALS)
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+def buildSnapshot(registryValue, channel):
+    """
+    Reads the SNAPSHOT_VALUES of channel and the SNAPSHOT_GLOBALS into an
+    immutable ChannelConfig. List values are copied to tuples, so the
+    snapshot can't change under a handler using it
+    """
+    values = [_freeze(registryValue(name, channel)) for name in SNAPSHOT_VALUES]
+    values.extend(_freeze(registryValue(name)) for name in SNAPSHOT_GLOBALS)
+    return ChannelConfig._make(values)
+
+def changed(old, new, names):
+    """ True if any of names differs between two snapshots """
+    if old is None:
+        return True
+    return any(getattr(old, name) != getattr(new, name) for name in names)
@@ -0,0 +1,206 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import deque
+import threading
+import time
+
+def slowHandler(timeout=None):
+    """
+    Marks a handler as slow (network lookups, external commands). Slow
+    handlers run on their own workers and never hold up event processing
+    """
+    def decorate(func):
+        func.slowHandler = True
+        func.handlerTimeout = timeout
+        return func
+    return decorate
+
+def handlerName(func):
+    return getattr(func, '__name__', str(func))
+
+class _Task(object):
+    __slots__ = ('func', 'args', 'kwargs', 'timeout', 'start', 'overrun')
+
+    def __init__(self, func, args, kwargs, timeout):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.start = None
+        self.overrun = False
+
+    def expired(self, now):
+        return self.timeout and self.start and now - self.start > self.timeout
+
+class _Lane(object):
+    __slots__ = ('key', 'pending', 'running')
+
+    def __init__(self, key):
+        self.key = key
+        self.pending = deque()
+        self.running = None
+
+class WorkerPool(object):
+    """
+    Fixed size pool of worker threads. Tasks sharing a key run one at a time
+    in submission order, tasks with key None run as soon as a worker is free.
+    A task running longer than its timeout is logged and counted, but never
+    interrupted; the next task for its key still waits for it to return
+    """
+
+    def __init__(self, log, name, workers, timeout):
+        self.log = log
+        self.name = name
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._lanes = {}
+        self._ready = deque()
+        self._stopped = False
+
+        self.depth = 0
+        self.maxDepth = 0
+        self.handled = 0
+        self.timeouts = 0
+        self.overruns = 0
+        self.handlerStats = {}
+
+        self._threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      name='%s.%d' % (name, number))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func, args=(), kwargs=None):
+        task = _Task(func, args, kwargs or {},
+                     getattr(func, 'handlerTimeout', None) or self.timeout)
+        with self._cond:
+            if self._stopped:
+                return
+            if key is None:
+                lane = _Lane(None)
+            else:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    lane = self._lanes[key] = _Lane(key)
+            idle = lane.running is None and not lane.pending
+            lane.pending.append(task)
+            self.depth += 1
+            self.maxDepth = max(self.maxDepth, self.depth)
+            if idle:
+                self._ready.append(lane)
+                self._cond.notify()
+            elif (lane.running is not None and not lane.running.overrun and
+                  lane.running.expired(time.time())):
+                self._overrun(lane)
+
+    def _overrun(self, lane):
+        task = lane.running
+        task.overrun = True
+        self.overruns += 1
+        self.log.warning('%s: %s exceeded its %ss timeout, %d events for %s are waiting for it'
+            % (self.name, handlerName(task.func), task.timeout, len(lane.pending), lane.key))
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                lane = self._ready.popleft()
+                task = lane.pending.popleft()
+                self.depth -= 1
+                task.start = time.time()
+                lane.running = task
+
+            try:
+                task.func(*task.args, **task.kwargs)
+            except Exception:
+                self.log.exception('%s: uncaught exception in %s'
+                    % (self.name, handlerName(task.func)))
+
+            with self._cond:
+                self._record(task, time.time() - task.start)
+                lane.running = None
+                if lane.pending:
+                    self._ready.append(lane)
+                    self._cond.notify()
+                elif lane.key is not None:
+                    self._lanes.pop(lane.key, None)
+
+    def _record(self, task, elapsed):
+        self.handled += 1
+        if task.timeout and elapsed > task.timeout:
+            self.timeouts += 1
+        name = handlerName(task.func)
+        stats = self.handlerStats.get(name)
+        if stats is None:
+            stats = self.handlerStats[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._ready.clear()
+            self._lanes.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            text = '%s: %d workers, queue depth %d (max %d), %d handled, %d timed out, %d held up their server' % (
+                self.name, len(self._threads), self.depth, self.maxDepth,
+                self.handled, self.timeouts, self.overruns)
+            handlers = ['%s %d x %.1fms (max %.1fms)' % (
+                    name, count, total / count * 1000, longest * 1000)
+                for name, (count, total, longest) in sorted(self.handlerStats.items())]
+        return [text] + handlers
+
+class SoapDispatcher(object):
+    """
+    Sits between the connections' SoapEvents and the plugin's handlers, so
+    handlers run on worker threads instead of on the reactor. Events of one
+    connection keep their order, handlers marked slowHandler get a separate
+    pool
+    """
+
+    def __init__(self, log, workers, slowWorkers, timeout, slowTimeout):
+        self.events = WorkerPool(log, 'SoapWorker', workers, timeout)
+        self.slow = WorkerPool(log, 'SoapSlowWorker', slowWorkers, slowTimeout)
+
+    def submit(self, key, func, *args, **kwargs):
+        if getattr(func, 'slowHandler', False):
+            self.slow.submit(None, func, args, kwargs)
+        else:
+            self.events.submit(key, func, args, kwargs)
+
+    def wrap(self, handler):
+        def dispatch(*args, **kwargs):
+            key = kwargs.get('connChan') or args[0]
+            self.submit(key, handler, *args, **kwargs)
+        dispatch.__name__ = handlerName(handler)
+        return dispatch
+
+    def stop(self):
+        self.events.stop()
+        self.slow.stop()
+
+    def stats(self):
+        return self.events.stats() + self.slow.stats()
@@ -0,0 +1,117 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from array import array
+import threading
+import time
+
+BUCKETS = 8
+BUCKET_MAX = 0xFFFF
+
+class _Counter(object):
+    __slots__ = ('counts', 'slot', 'total')
+
+    def __init__(self, slot):
+        self.counts = array('H', [0] * BUCKETS)
+        self.slot = slot
+        self.total = 0
+
+class FloodCounter(object):
+    """
+    Counts events per key over a sliding window. Every key costs a fixed ring
+    of BUCKETS counters, each covering window / BUCKETS seconds, so the window
+    slides in steps of one bucket
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.width = float(window) / BUCKETS
+        self._counters = {}
+
+    def hit(self, key, now):
+        slot = int(now / self.width)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = _Counter(slot)
+        elif slot - counter.slot >= BUCKETS:
+            counter.counts = array('H', [0] * BUCKETS)
+            counter.total = 0
+        else:
+            for expired in range(counter.slot + 1, slot + 1):
+                index = expired % BUCKETS
+                counter.total -= counter.counts[index]
+                counter.counts[index] = 0
+        counter.slot = max(counter.slot, slot)
+        index = counter.slot % BUCKETS
+        if counter.counts[index] < BUCKET_MAX:
+            counter.counts[index] += 1
+            counter.total += 1
+        return counter.total
+
+    def reset(self, key):
+        self._counters.pop(key, None)
+
+    def __len__(self):
+        return len(self._counters)
+
+class FloodGuard(object):
+    """
+    Flood detection for the clients of one server. chat() and command() count
+    a client's events, once a limit is exceeded they return the client's
+    strike: 1 for a warning, 2 to move them to spectators, 3 and up to kick.
+    Strikes are forgiven after forgive seconds without exceeding a limit
+    """
+
+    def __init__(self, chatWindow, chatLimit, commandWindow, commandLimit, forgive):
+        self.chatLimit = chatLimit
+        self.commandLimit = commandLimit
+        self.forgive = forgive
+        self._lock = threading.Lock()
+        self._chat = FloodCounter(chatWindow)
+        self._commands = FloodCounter(commandWindow)
+        self._strikes = {}
+
+    def chat(self, clientID):
+        return self._hit(self._chat, self.chatLimit, clientID)
+
+    def command(self, clientID):
+        return self._hit(self._commands, self.commandLimit, clientID)
+
+    def _hit(self, counter, limit, clientID):
+        if limit <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            if counter.hit(clientID, now) <= limit:
+                return None
+            # start counting afresh, the next strike needs a new flood
+            counter.reset(clientID)
+            strikes, last = self._strikes.get(clientID, (0, now))
+            if now - last > self.forgive:
+                strikes = 0
+            strikes += 1
+            self._strikes[clientID] = (strikes, now)
+            return strikes
+
+    def forget(self, clientID):
+        with self._lock:
+            self._chat.reset(clientID)
+            self._commands.reset(clientID)
+            self._strikes.pop(clientID, None)
+
+    def stats(self):
+        with self._lock:
+            return len(self._chat), len(self._commands), len(self._strikes)
@@ -0,0 +1,168 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import OrderedDict
+import csv
+import mmap
+import socket
+import struct
+import sys
+import threading
+
+MAGIC = 'SGEO'
+HEADER = struct.Struct('>4sII')
+# record: first address, last address, country code, addresses big endian
+# so records compare as plain strings
+SIZES = {4: 4 * 2 + 2, 6: 16 * 2 + 2}
+MAPPED_PREFIX = '\0' * 10 + '\xff\xff'
+
+def _packNumber(value):
+    # ip2location stores addresses as decimal numbers
+    if value < 0:
+        return None, None
+    if value <= 0xFFFFFFFF:
+        return 4, struct.pack('>I', value)
+    if value >> 128:
+        return None, None
+    packed = struct.pack('>QQ', value >> 64, value & 0xFFFFFFFFFFFFFFFF)
+    if packed.startswith(MAPPED_PREFIX):
+        return 4, packed[12:]
+    return 6, packed
+
+def packAddress(address):
+    """
+    Returns (version, packed address), or (None, None) if it isn't valid.
+    Takes dotted quads, IPv6 notation and decimal numbers
+    """
+    try:
+        address = address.strip()
+        if address.isdigit():
+            return _packNumber(int(address))
+        if ':' in address:
+            packed = socket.inet_pton(socket.AF_INET6, address)
+            if packed.startswith(MAPPED_PREFIX):
+                return 4, packed[12:]
+            return 6, packed
+        return 4, socket.inet_pton(socket.AF_INET, address)
+    except (socket.error, ValueError, TypeError):
+        return None, None
+
+def buildTable(rows, path):
+    """
+    Writes a range table from (first address, last address, country code)
+    rows, as found in the free db-ip and ip2location csv files. Returns the
+    number of IPv4 and IPv6 ranges written
+    """
+    records = {4: [], 6: []}
+    for first, last, country in rows:
+        version, start = packAddress(first)
+        endVersion, end = packAddress(last)
+        if version is None or version != endVersion or len(country) != 2:
+            continue
+        records[version].append(start + end + country.upper())
+    with open(path, 'wb') as table:
+        table.write(HEADER.pack(MAGIC, len(records[4]), len(records[6])))
+        for version in (4, 6):
+            records[version].sort()
+            table.write(''.join(records[version]))
+    return len(records[4]), len(records[6])
+
+class GeoIP(object):
+    """
+    Country lookups in a range table built by buildTable. The file is memory
+    mapped and searched in place, recent answers are kept in a small LRU
+    """
+
+    def __init__(self, path, cacheSize=1024):
+        self.path = path
+        self.cacheSize = cacheSize
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        with open(path, 'rb') as table:
+            self._map = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError('%s is not a GeoIP range table' % path)
+        magic, count4, count6 = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a GeoIP range table' % path)
+        offset4 = HEADER.size
+        offset6 = offset4 + count4 * SIZES[4]
+        if offset6 + count6 * SIZES[6] > len(self._map):
+            self._map.close()
+            raise ValueError('%s is truncated' % path)
+        self._tables = {4: (offset4, count4), 6: (offset6, count6)}
+
+    def empty(self):
+        return not (self._tables[4][1] or self._tables[6][1])
+
+    def _search(self, version, packed):
+        offset, count = self._tables[version]
+        size = SIZES[version]
+        width = len(packed)
+        data = self._map
+        # rightmost record starting at or before packed
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start = offset + middle * size
+            if data[start:start + width] <= packed:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        record = offset + (low - 1) * size
+        if packed <= data[record + width:record + 2 * width]:
+            return data[record + 2 * width:record + size]
+        return None
+
+    def country(self, address):
+        """ Returns the two letter country code of address, None if unknown """
+        with self._lock:
+            if address in self._cache:
+                country = self._cache.pop(address)
+                self._cache[address] = country
+                self.hits += 1
+                return country
+            self.misses += 1
+        version, packed = packAddress(address)
+        country = self._search(version, packed) if version else None
+        with self._lock:
+            self._cache[address] = country
+            if len(self._cache) > self.cacheSize:
+                self._cache.popitem(last=False)
+        return country
+
+    def close(self):
+        self._map.close()
+
+    def stats(self):
+        return (self._tables[4][1], self._tables[6][1], len(self._cache),
+                self.hits, self.misses)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: %s <ip ranges csv> <table file>' % sys.argv[0])
+    with open(sys.argv[1], 'rb') as source:
+        v4, v6 = buildTable((row[:3] for row in csv.reader(source) if len(row) >= 3),
+                            sys.argv[2])
+    print('Wrote %d IPv4 and %d IPv6 ranges' % (v4, v6))
+    if not v4 and not v6:
+        sys.exit('Warning: no usable ranges found in %s' % sys.argv[1])
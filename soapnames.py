@@ -0,0 +1,199 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import re
+import unicodedata
+
+# Characters commonly used to dodge a name filter, mapped to the letter they
+# stand in for. Applied after lowercasing and NFKC normalization. Only
+# symbols, digits and non-latin lookalikes: mapping one latin letter onto
+# another would make different, legitimate names collide
+HOMOGLYPHS = {
+    u'0': u'o', u'3': u'e', u'4': u'a', u'@': u'a', u'5': u's', u'$': u's',
+    u'7': u't', u'8': u'b',
+    # cyrillic
+    u'\u0430': u'a', u'\u0432': u'b', u'\u0435': u'e', u'\u043a': u'k',
+    u'\u043c': u'm', u'\u043d': u'h', u'\u043e': u'o', u'\u0440': u'p',
+    u'\u0441': u'c', u'\u0442': u't', u'\u0443': u'y', u'\u0445': u'x',
+    u'\u0456': u'i', u'\u0458': u'j', u'\u0455': u's',
+    # greek
+    u'\u03b1': u'a', u'\u03b5': u'e', u'\u03b9': u'i', u'\u03ba': u'k',
+    u'\u03bd': u'v', u'\u03bf': u'o', u'\u03c1': u'p', u'\u03c4': u't',
+    u'\u03c5': u'u', u'\u03c7': u'x',
+}
+# stand in for an i as often as for an l, names using them are tried both ways
+AMBIGUOUS = u'1!|'
+
+def _table(ambiguous):
+    table = dict((ord(key), value) for key, value in HOMOGLYPHS.iteritems())
+    if ambiguous:
+        table.update((ord(char), ambiguous) for char in AMBIGUOUS)
+    return table
+
+HOMOGLYPH_TABLE = _table(None)
+I_TABLE = _table(u'i')
+L_TABLE = _table(u'l')
+SEPARATORS = re.compile(r'[\s_.\-]+', re.UNICODE)
+REGEX_PREFIX = 're:'
+PATTERN_ERRORS = (re.error, AssertionError, OverflowError, ValueError)
+
+def foldName(name):
+    """ Lowercased, NFKC normalized unicode version of name """
+    if not isinstance(name, unicode):
+        name = name.decode('utf-8', 'replace')
+    return unicodedata.normalize('NFKC', name).lower()
+
+def normalizedForms(folded):
+    """
+    The forms a folded name is matched against: lookalike characters
+    replaced and separators removed. Two forms if the name has characters
+    that could be either an i or an l
+    """
+    first = SEPARATORS.sub(u'', folded.translate(I_TABLE))
+    if not any(char in folded for char in AMBIGUOUS):
+        return (first,)
+    second = SEPARATORS.sub(u'', folded.translate(L_TABLE))
+    return (first, second)
+
+def _wildcard(pattern):
+    parts = []
+    for char in pattern:
+        if char == u'*':
+            parts.append(u'.*')
+        elif char == u'?':
+            parts.append(u'.')
+        elif char in AMBIGUOUS:
+            parts.append(u'[il]')
+        else:
+            parts.append(re.escape(char))
+    return u''.join(parts)
+
+class _Patterns(object):
+    """
+    Patterns merged into one regular expression. Patterns with groups of
+    their own are kept apart, merging would renumber their groups and break
+    backreferences
+    """
+
+    def __init__(self, flags):
+        self.flags = flags
+        self.merged = []
+        self.separate = []
+        self.combined = None
+
+    def add(self, source, entry):
+        source = u'(?:%s)\\Z' % source
+        try:
+            compiled = re.compile(source, self.flags)
+        except PATTERN_ERRORS:
+            return False
+        if compiled.groups:
+            self.separate.append((compiled, entry))
+        else:
+            self.merged.append((compiled, source, entry))
+        return True
+
+    def compile(self):
+        if not self.merged:
+            return
+        try:
+            self.combined = re.compile(
+                u'|'.join(source for compiled, source, entry in self.merged),
+                self.flags)
+        except PATTERN_ERRORS:
+            self.combined = None
+            self.separate = [(compiled, entry)
+                             for compiled, source, entry in self.merged] + self.separate
+            self.merged = []
+
+    def match(self, name):
+        if self.combined is not None and self.combined.match(name):
+            # only reached for names that are going to be acted on anyway
+            for compiled, source, entry in self.merged:
+                if compiled.match(name):
+                    return entry
+        for compiled, entry in self.separate:
+            if compiled.match(name):
+                return entry
+        return None
+
+    def __len__(self):
+        return len(self.merged) + len(self.separate)
+
+class NamePolicy(object):
+    """
+    Matches player names against a list of entries, compiled once. Plain
+    entries match the exact name, or any name normalizing to the same form.
+    Entries with * or ? are wildcards matched against the normalized name,
+    entries starting with re: are case insensitive regular expressions
+    matched against the name. Patterns of each kind are merged into one
+    regular expression where possible, so a check costs a few set lookups
+    and a handful of matches however long the list is
+    """
+
+    def __init__(self, entries):
+        self.exact = set()
+        self.normalized = {}
+        self.wildcards = _Patterns(re.UNICODE)
+        self.regexes = _Patterns(re.IGNORECASE | re.UNICODE)
+        self.bad = []
+        for entry in entries:
+            entry = entry.strip()
+            if not entry:
+                continue
+            if entry.startswith(REGEX_PREFIX):
+                source = entry[len(REGEX_PREFIX):]
+                if not isinstance(source, unicode):
+                    source = source.decode('utf-8', 'replace')
+                added = self.regexes.add(source, entry)
+            elif '*' in entry or '?' in entry:
+                pattern = SEPARATORS.sub(u'', foldName(entry).translate(HOMOGLYPH_TABLE))
+                added = self.wildcards.add(_wildcard(pattern), entry)
+            else:
+                self.exact.add(entry)
+                for form in normalizedForms(foldName(entry)):
+                    self.normalized.setdefault(form, entry)
+                added = True
+            if not added:
+                self.bad.append(entry)
+        self.wildcards.compile()
+        self.regexes.compile()
+
+    def match(self, name):
+        """ Returns the entry name matches, None if it matches none """
+        if name in self.exact:
+            return name
+        folded = foldName(name)
+        for form in normalizedForms(folded):
+            entry = self.normalized.get(form)
+            if entry is None:
+                entry = self.wildcards.match(form)
+            if entry is not None:
+                return entry
+        return self.regexes.match(folded)
+
+    def __len__(self):
+        return len(self.exact) + len(self.wildcards) + len(self.regexes)
+
+# names OpenTTD hands out to players who didn't set one
+DEFAULT_NAME_PREFIX = 'player'
+
+def isDefaultName(name):
+    """
+    True if name looks like one OpenTTD made up. Only case is folded, a
+    name that merely resembles it is somebody's real name
+    """
+    return name.lower().startswith(DEFAULT_NAME_PREFIX)
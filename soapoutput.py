@@ -0,0 +1,130 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import deque
+import threading
+
+from enums import MessagePriority
+from soapthrottle import TokenBucket
+
+# Messages handed to the bot's own IRC queue at a time. Anything beyond
+# that waits here, where alerts can still get ahead of it
+FEED_DEPTH = 2
+PUMP_INTERVAL = 0.2
+# Alerts skip all queues, but not so many that the bot floods off IRC
+ALERT_RATE = 1
+ALERT_BURST = 5
+
+class _ChannelQueue(object):
+    def __init__(self, irc):
+        self.irc = irc
+        self.queues = dict((priority, deque()) for priority in (
+            MessagePriority.CHAT, MessagePriority.NORMAL, MessagePriority.ROUTINE))
+        self.depth = 0
+        self.dropped = 0
+        self.totalDropped = 0
+
+    def pop(self):
+        for priority in sorted(self.queues):
+            if self.queues[priority]:
+                self.depth -= 1
+                return self.queues[priority].popleft()
+
+    def lowest(self):
+        for priority in sorted(self.queues, reverse=True):
+            if self.queues[priority]:
+                return priority
+
+class OutputScheduler(object):
+    """
+    Sits between msgChannel and the bot's IRC queue, handing messages over
+    by priority as the IRC queue empties. Alerts are sent right away. Each
+    channel holds at most maxDepth messages; when full, the oldest message
+    of the lowest priority is dropped, and the number dropped is reported
+    once the channel has caught up
+    """
+
+    def __init__(self, reactor, send, maxDepth):
+        self.reactor = reactor
+        self._send = send
+        self.maxDepth = maxDepth
+        self.alertBucket = TokenBucket(ALERT_RATE, ALERT_BURST)
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._timer = None
+
+    def send(self, irc, channel, text, priority):
+        if priority == MessagePriority.ALERT:
+            if not self.alertBucket.take():
+                self._send(irc, channel, text, True)
+                return
+            priority = MessagePriority.CHAT
+        with self._lock:
+            queue = self._channels.get(channel)
+            if queue is None:
+                queue = self._channels[channel] = _ChannelQueue(irc)
+            queue.irc = irc
+            if queue.depth >= self.maxDepth:
+                lowest = queue.lowest()
+                if priority > lowest:
+                    queue.dropped += 1
+                    return
+                queue.queues[lowest].popleft()
+                queue.depth -= 1
+                queue.dropped += 1
+            queue.queues[priority].append(text)
+            queue.depth += 1
+            self._pump()
+
+    def _backlog(self, irc):
+        try:
+            return len(irc.queue)
+        except (AttributeError, TypeError):
+            return 0
+
+    def _pump(self):
+        # Called with the lock held
+        progress = True
+        while progress:
+            progress = False
+            for channel, queue in self._channels.iteritems():
+                if queue.depth and self._backlog(queue.irc) < FEED_DEPTH:
+                    self._send(queue.irc, channel, queue.pop(), False)
+                    progress = True
+                if not queue.depth and queue.dropped:
+                    self._send(queue.irc, channel,
+                        '[%d less important messages were dropped]' % queue.dropped, False)
+                    queue.totalDropped += queue.dropped
+                    queue.dropped = 0
+        if self._timer is None and any(queue.depth for queue in self._channels.itervalues()):
+            self._timer = self.reactor.callLater(PUMP_INTERVAL, self._timedPump)
+
+    def _timedPump(self):
+        with self._lock:
+            self._timer = None
+            self._pump()
+
+    def stats(self):
+        lines = []
+        with self._lock:
+            for channel, queue in sorted(self._channels.iteritems()):
+                lines.append('%s: %d messages waiting for IRC (%d chat, %d normal, %d routine), %d dropped' % (
+                    channel, queue.depth,
+                    len(queue.queues[MessagePriority.CHAT]),
+                    len(queue.queues[MessagePriority.NORMAL]),
+                    len(queue.queues[MessagePriority.ROUTINE]),
+                    queue.totalDropped + queue.dropped))
+        return lines
@@ -0,0 +1,508 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from array import array
+from collections import deque
+import fnmatch
+import functools
+import itertools
+import tempfile
+import threading
+import time
+
+from libottdadmin2.packets.admin import AdminRcon
+
+from enums import RconStatus, RconPriority
+from soapthrottle import SendQueue
+
+# Cached rcon commands whose output changes when clients or companies do
+CLIENT_QUERIES = ('clients*', 'status*')
+COMPANY_QUERIES = ('companies*',)
+
+def normalizeCommand(command):
+    return ' '.join(command.lower().split())
+
+def parseCacheRules(entries):
+    """
+    Turns 'pattern=ttl' strings into (pattern, ttl) tuples. Returns the
+    rules, and the entries that couldn't be parsed
+    """
+    rules = []
+    bad = []
+    for entry in entries:
+        pattern, sep, ttl = entry.rpartition('=')
+        pattern = normalizeCommand(pattern)
+        try:
+            ttl = float(ttl)
+        except ValueError:
+            ttl = None
+        if not sep or not pattern or ttl is None or ttl < 0:
+            bad.append(entry)
+        else:
+            rules.append((pattern, ttl))
+    return rules, bad
+
+class RconRequest(object):
+    """
+    One or more rcon commands sent on behalf of a single requester, together
+    with the output the server returned for them
+    """
+    _tags = itertools.count(1)
+
+    def __init__(self, commands, irc=None, nick=None, succestext=None,
+                 state=RconStatus.ACTIVE, priority=RconPriority.INTERACTIVE,
+                 cache=False, callback=None):
+        self.tag = next(self._tags)
+        self.commands = list(commands)
+        self.priority = priority
+        self.cache = cache
+        self.callback = callback
+        self.generation = None
+        self.irc = irc
+        self.nick = nick
+        self.succestext = succestext
+        self.state = state
+        self.output = None
+        self.streamed = 0
+        self.streamTimer = None
+        self.unsent = deque(self.commands)
+        self.pending = 0
+
+    @property
+    def done(self):
+        return not self.unsent and not self.pending
+
+class RconOutput(object):
+    """
+    The lines an rcon request returned, read back a page at a time. Lines
+    are kept in memory up to maxBytes; beyond that the oldest lines move
+    to a temporary file. Lines after the first maxLines are dropped
+    """
+
+    def __init__(self, maxBytes, maxLines):
+        self.maxBytes = maxBytes
+        self.maxLines = maxLines
+        self.total = 0
+        self.dropped = 0
+        self.position = 0
+        self.lastUsed = time.time()
+        self._lines = deque()
+        self._bytes = 0
+        self._spill = None
+        self._offsets = array('L')
+        self._spillEnd = 0
+        self._unicode = False
+
+    def append(self, line):
+        if self.total >= self.maxLines:
+            self.dropped += 1
+            return
+        self._lines.append(line)
+        self._bytes += len(line)
+        self.total += 1
+        while self._bytes > self.maxBytes and len(self._lines) > 1:
+            self._spillLine()
+
+    def _spillLine(self):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='soap-rcon-')
+        line = self._lines.popleft()
+        self._bytes -= len(line)
+        if isinstance(line, unicode):
+            self._unicode = True
+            line = line.encode('utf-8')
+        self._spill.seek(self._spillEnd)
+        self._spill.write(line)
+        self._offsets.append(self._spillEnd)
+        self._spillEnd += len(line)
+
+    def lines(self, start, stop):
+        stop = min(stop, self.total)
+        spilled = len(self._offsets)
+        result = []
+        if start < spilled:
+            end = min(stop, spilled)
+            self._spill.seek(self._offsets[start])
+            data = self._spill.read(
+                (self._offsets[end] if end < spilled else self._spillEnd) - self._offsets[start])
+            base = self._offsets[start]
+            for i in range(start, end):
+                last = self._offsets[i + 1] if i + 1 < spilled else self._spillEnd
+                line = data[self._offsets[i] - base:last - base]
+                if self._unicode:
+                    line = line.decode('utf-8', 'replace')
+                result.append(line)
+        if stop > spilled:
+            result.extend(itertools.islice(self._lines,
+                max(start, spilled) - spilled, stop - spilled))
+        return result
+
+    def remaining(self):
+        return self.total - self.position
+
+    def pages(self, pageSize):
+        return (self.total + pageSize - 1) // pageSize
+
+    def read(self, count):
+        """ Returns the next count lines and moves past them """
+        self.lastUsed = time.time()
+        result = self.lines(self.position, self.position + count)
+        self.position += len(result)
+        return result
+
+    def page(self, number, pageSize):
+        """ Returns page number (starting at 1) and continues after it """
+        self.lastUsed = time.time()
+        start = (number - 1) * pageSize
+        result = self.lines(start, start + pageSize)
+        self.position = start + len(result)
+        return result
+
+    def close(self):
+        self._lines.clear()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+class RconPager(object):
+    """
+    The rcon output each nick hasn't finished reading yet, one per nick.
+    Output that nobody looked at for a while is thrown away by expire()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outputs = {}
+
+    def get(self, nick):
+        with self._lock:
+            return self._outputs.get(nick)
+
+    def keep(self, nick, output):
+        with self._lock:
+            old = self._outputs.get(nick)
+            self._outputs[nick] = output
+        if old is not None and old is not output:
+            old.close()
+
+    def expire(self, ttl):
+        now = time.time()
+        with self._lock:
+            expired = [(nick, output) for nick, output in self._outputs.iteritems()
+                       if now - output.lastUsed > ttl]
+            for nick, output in expired:
+                del self._outputs[nick]
+        for nick, output in expired:
+            output.close()
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            outputs = self._outputs.values()
+        return len(outputs), sum(output.total for output in outputs)
+
+class RconCache(object):
+    """
+    Output of read-only rcon commands, matched by the (pattern, ttl) rules.
+    Entries are reused until their ttl runs out, or until a command or an
+    event changes what they show. Output of commands sent before an
+    invalidation is not stored, as it could already be out of date
+    """
+
+    def __init__(self, rules=(), maxEntries=128):
+        self.rules = list(rules)
+        self.maxEntries = maxEntries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def ttl(self, command):
+        """ Returns how long output of command may be cached, None if never """
+        command = normalizeCommand(command)
+        for pattern, ttl in self.rules:
+            if fnmatch.fnmatchcase(command, pattern):
+                return ttl or None
+        return None
+
+    def get(self, command):
+        key = normalizeCommand(command)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def store(self, command, generation, lines):
+        ttl = self.ttl(command)
+        if not ttl:
+            return
+        now = time.time()
+        with self._lock:
+            if generation != self.generation:
+                return
+            if len(self._entries) >= self.maxEntries:
+                for key, (expires, dummy) in self._entries.items():
+                    if expires < now:
+                        del self._entries[key]
+                if len(self._entries) >= self.maxEntries:
+                    oldest = min(self._entries, key=lambda key: self._entries[key][0])
+                    del self._entries[oldest]
+            self._entries[normalizeCommand(command)] = (now + ttl, lines)
+
+    def invalidate(self, patterns=None):
+        """ Drops the entries matching any of patterns, or all of them """
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            if patterns is None:
+                self._entries.clear()
+                return
+            for key in self._entries.keys():
+                if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return len(self._entries), self.hits, self.misses, self.invalidations
+
+class RconFanout(object):
+    """
+    Sends one rcon command to several servers at once, and calls
+    done(fanout) when all of them answered or timeout ran out. results maps
+    each connection that answered in time to its output
+    """
+
+    def __init__(self, reactor, conns, command, timeout, done):
+        self.reactor = reactor
+        self.conns = list(conns)
+        self.command = command
+        self.timeout = timeout
+        self.results = {}
+        self._done = done
+        self._lock = threading.Lock()
+        self._pending = set(self.conns)
+        self._finished = False
+        self._timer = None
+
+    def start(self):
+        self._timer = self.reactor.callLater(self.timeout, self._finish)
+        for conn in self.conns:
+            conn.rconEngine.submit(self.command,
+                                   callback=functools.partial(self._answered, conn))
+        if not self.conns:
+            self._finish()
+
+    def _answered(self, conn, request):
+        output = request.output
+        with self._lock:
+            if self._finished:
+                return
+            self.results[conn] = output.lines(0, output.total)
+            self._pending.discard(conn)
+            if self._pending:
+                return
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if self._timer:
+            self._timer.cancel()
+        self._done(self)
+
+class RconEngine(object):
+    """
+    Sends rcon commands for a connection, keeping up to `depth` of them in
+    flight at once. The server answers rcon commands strictly in the order it
+    received them, so output belongs to the oldest command in flight, and the
+    command string in rconend tells when it is complete.
+
+    Waiting commands are sent by priority. Moderation goes out straight away,
+    regardless of depth. Otherwise interactive commands go before bulk ones,
+    but a waiting bulk command is sent after being passed over
+    `starvationLimit` times in a row. With a bucket set by throttle(),
+    commands wait for a token before they are sent; moderation may use the
+    bucket's reserve. Packets are written after the lock is released, so a
+    worker waiting on a full socket never blocks the reactor's pump timer
+    """
+
+    def __init__(self, conn, depth=32, starvationLimit=4, outputBytes=16384,
+                 outputLines=10000):
+        self.conn = conn
+        self.depth = depth
+        self.starvationLimit = starvationLimit
+        self.outputBytes = outputBytes
+        self.outputLines = outputLines
+        self.cache = RconCache()
+        self._lock = threading.Lock()
+        self._queues = dict((priority, deque()) for priority in
+            (RconPriority.MODERATION, RconPriority.INTERACTIVE, RconPriority.BULK))
+        self._passedOver = dict((priority, 0) for priority in self._queues)
+        self._inflight = deque()
+        self._outbox = SendQueue(conn.send_packet)
+        self.reactor = None
+        self.bucket = None
+        self._pumpTimer = None
+
+    def submit(self, commands, **kwargs):
+        if isinstance(commands, basestring):
+            commands = [commands]
+        request = RconRequest(commands, **kwargs)
+        if request.irc or request.callback:
+            request.output = RconOutput(self.outputBytes, self.outputLines)
+        # Anything that isn't a known query may change what queries return
+        if not all(self.cache.ttl(command) for command in request.commands):
+            self.cache.invalidate()
+        request.generation = self.cache.generation
+        with self._lock:
+            self._queues[request.priority].append(request)
+            self._pump()
+        self._outbox.deliver()
+        return request
+
+    def cached(self, command):
+        """ Returns the cached output of command, None if there is none """
+        if not self.cache.ttl(command):
+            return None
+        lines = self.cache.get(command)
+        if lines is None:
+            return None
+        output = RconOutput(self.outputBytes, self.outputLines)
+        for line in lines:
+            output.append(line)
+        return output
+
+    def _next(self):
+        if self._queues[RconPriority.MODERATION]:
+            return RconPriority.MODERATION
+        if len(self._inflight) >= self.depth:
+            return None
+        waiting = [priority for priority in (RconPriority.INTERACTIVE, RconPriority.BULK)
+                   if self._queues[priority]]
+        if not waiting:
+            return None
+        chosen = waiting[0]
+        for priority in waiting[1:]:
+            if self._passedOver[priority] >= self.starvationLimit:
+                chosen = priority
+        return chosen
+
+    def _chosen(self, chosen):
+        if chosen == RconPriority.MODERATION:
+            return
+        for priority in (RconPriority.INTERACTIVE, RconPriority.BULK):
+            if priority == chosen:
+                self._passedOver[priority] = 0
+            elif self._queues[priority]:
+                self._passedOver[priority] += 1
+
+    def throttle(self, reactor, bucket):
+        """ Limits sending to what bucket allows, None to stop limiting """
+        with self._lock:
+            if self._pumpTimer:
+                self._pumpTimer.cancel()
+                self._pumpTimer = None
+            self.reactor = reactor
+            self.bucket = bucket
+
+    def _timedPump(self):
+        with self._lock:
+            self._pumpTimer = None
+            self._pump()
+        self._outbox.deliver()
+
+    def _pump(self):
+        # Called with the lock held. Queueing under the lock keeps the order
+        # on the wire identical to the order of _inflight; the caller
+        # delivers the queued packets once it released the lock
+        while True:
+            priority = self._next()
+            if priority is None:
+                break
+            if self.bucket is not None:
+                wait = self.bucket.take(priority == RconPriority.MODERATION)
+                if wait:
+                    if self._pumpTimer is None:
+                        self._pumpTimer = self.reactor.callLater(wait, self._timedPump)
+                    break
+            self._chosen(priority)
+            queue = self._queues[priority]
+            request = queue[0]
+            command = request.unsent.popleft()
+            if not request.unsent:
+                queue.popleft()
+            request.pending += 1
+            self._inflight.append((command, request))
+            self.conn.logger.debug('>>--DEBUG--<< Sending rcon: %s' % command)
+            self._outbox.push(AdminRcon, command=command)
+
+    def received(self):
+        """
+        Returns the command and request the current line of output belongs
+        to, (None, None) if nothing is in flight
+        """
+        with self._lock:
+            if not self._inflight:
+                return None, None
+            return self._inflight[0]
+
+    def ended(self, command):
+        """
+        Marks command as answered. Returns the requests that got completed
+        by it, normally just the one the command belonged to
+        """
+        with self._lock:
+            for index, (sent, request) in enumerate(self._inflight):
+                if sent == command:
+                    break
+            else:
+                self.conn.logger.debug('>>--DEBUG--<< Unexpected rconend for: %s' % command)
+                return []
+            completed = []
+            # Anything sent before command can't be answered anymore
+            for i in range(index + 1):
+                sent, request = self._inflight.popleft()
+                request.pending -= 1
+                if request.done:
+                    completed.append(request)
+            self._pump()
+        self._outbox.deliver()
+        for request in completed:
+            if request.cache and request.output and not request.output.dropped:
+                output = request.output
+                self.cache.store(request.commands[0], request.generation,
+                                 output.lines(0, output.total))
+        return completed
+
+    def busy(self):
+        return bool(self._inflight or any(self._queues.itervalues()))
+
+    def stats(self):
+        """ Returns the number of commands in flight, and waiting per priority """
+        with self._lock:
+            waiting = dict((priority, sum(len(r.unsent) for r in queue))
+                           for priority, queue in self._queues.iteritems())
+            return len(self._inflight), waiting
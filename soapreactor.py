@@ -0,0 +1,199 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+
+from select import EPOLLIN, EPOLLOUT, EPOLLERR, EPOLLHUP, EPOLLPRI
+
+DEFAULT_EVENTMASK = EPOLLIN | EPOLLPRI | EPOLLERR | EPOLLHUP
+
+def _setNonBlocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+class Timer(object):
+    __slots__ = ('when', 'func', 'args', 'cancelled')
+
+    def __init__(self, when, func, args):
+        self.when = when
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class SoapReactor(object):
+    """
+    epoll based event loop for all adminport connections. Handlers are called
+    from the reactor thread as handler(fileno, event). Other threads wake the
+    loop through a self-pipe, so (un)registering and stopping take effect
+    immediately instead of after the next poll timeout. Timers scheduled with
+    callLater also run on the reactor thread, so they have to be quick
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._epoll = select.epoll()
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._closed = False
+        self._thread = None
+        self._timers = []
+        self._timerSequence = itertools.count()
+
+        self._wakeRead, self._wakeWrite = os.pipe()
+        _setNonBlocking(self._wakeRead)
+        _setNonBlocking(self._wakeWrite)
+        self._epoll.register(self._wakeRead, EPOLLIN)
+
+    def register(self, fileno, handler, eventmask=DEFAULT_EVENTMASK):
+        with self._lock:
+            if self._closed:
+                return
+            if fileno in self._handlers:
+                self._epoll.modify(fileno, eventmask)
+            else:
+                self._epoll.register(fileno, eventmask)
+            self._handlers[fileno] = handler
+        self.wakeup()
+
+    def modify(self, fileno, eventmask):
+        with self._lock:
+            if self._closed or not fileno in self._handlers:
+                return
+            try:
+                self._epoll.modify(fileno, eventmask)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def unregister(self, fileno):
+        with self._lock:
+            if self._handlers.pop(fileno, None) is None:
+                return
+            try:
+                self._epoll.unregister(fileno)
+            except (IOError, OSError, ValueError):
+                # fd was already closed, epoll dropped it by itself
+                pass
+        self.wakeup()
+
+    def isRegistered(self, fileno):
+        return fileno in self._handlers
+
+    def inReactorThread(self):
+        return threading.current_thread() is self._thread
+
+    def callLater(self, delay, func, *args):
+        timer = Timer(time.time() + delay, func, args)
+        with self._lock:
+            if self._closed:
+                # nothing is going to run it, hand back a dead timer
+                timer.cancel()
+                return timer
+            heapq.heappush(self._timers,
+                           (timer.when, next(self._timerSequence), timer))
+            first = self._timers[0][2] is timer
+        if first and not self.inReactorThread():
+            self.wakeup()
+        return timer
+
+    def _runTimers(self):
+        # Returns the time until the next timer is due, -1 if there is none
+        while True:
+            with self._lock:
+                if not self._timers:
+                    return -1
+                when, sequence, timer = self._timers[0]
+                if timer.cancelled:
+                    heapq.heappop(self._timers)
+                    continue
+                delay = when - time.time()
+                if delay > 0:
+                    return delay
+                heapq.heappop(self._timers)
+            try:
+                timer.func(*timer.args)
+            except Exception:
+                self.log.exception('Uncaught exception in timer %s' % timer.func)
+
+    def wakeup(self):
+        # Holding the lock keeps _close from closing the pipe under us, and
+        # its fd number from being reused by something else before we write
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                os.write(self._wakeWrite, 'x')
+            except OSError as e:
+                # a full pipe means the loop is going to wake up anyway
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def stop(self):
+        self._stopped = True
+        self.wakeup()
+
+    def _drainWakeup(self):
+        try:
+            while os.read(self._wakeRead, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def run(self):
+        self._thread = threading.current_thread()
+        try:
+            while not self._stopped:
+                timeout = self._runTimers()
+                try:
+                    events = self._epoll.poll(timeout)
+                except IOError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                for fileno, event in events:
+                    if fileno == self._wakeRead:
+                        self._drainWakeup()
+                        continue
+                    handler = self._handlers.get(fileno)
+                    if handler is None:
+                        continue
+                    try:
+                        handler(fileno, event)
+                    except Exception:
+                        self.log.exception('Uncaught exception handling event %s on fd %s'
+                            % (event, fileno))
+        finally:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            self._closed = True
+            self._handlers.clear()
+            self._timers = []
+            self._epoll.close()
+            os.close(self._wakeRead)
+            os.close(self._wakeWrite)
@@ -0,0 +1,108 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import random
+import threading
+import time
+
+class _Retry(object):
+    __slots__ = ('attempts', 'nextAttempt', 'timer', 'lastError')
+
+    def __init__(self):
+        self.attempts = 0
+        self.nextAttempt = None
+        self.timer = None
+        self.lastError = None
+
+class ReconnectScheduler(object):
+    """
+    Keeps track of which servers should be (re)connected, and when. Attempts
+    are started from a reactor timer by calling connect(key), failures are
+    retried with exponential backoff plus jitter, capped at maxDelay
+    """
+
+    def __init__(self, reactor, connect, baseDelay, maxDelay):
+        self.reactor = reactor
+        self.connect = connect
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self._lock = threading.Lock()
+        self._retries = {}
+
+    def backoff(self, attempts):
+        delay = min(self.maxDelay, self.baseDelay * 2 ** attempts)
+        # spread the attempts, so servers that went down together don't all
+        # come knocking at the same moment
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+    def schedule(self, key, delay=None):
+        with self._lock:
+            retry = self._retries.get(key)
+            if retry is None:
+                retry = self._retries[key] = _Retry()
+            if retry.timer:
+                retry.timer.cancel()
+            if delay is None:
+                delay = self.backoff(retry.attempts)
+            retry.nextAttempt = time.time() + delay
+            retry.timer = self.reactor.callLater(delay, self._attempt, key)
+        return delay
+
+    def _attempt(self, key):
+        with self._lock:
+            retry = self._retries.get(key)
+            if retry is None:
+                return
+            retry.timer = None
+            retry.nextAttempt = None
+            retry.attempts += 1
+        self.connect(key)
+
+    def failed(self, key, reason):
+        with self._lock:
+            retry = self._retries.get(key)
+            if retry is None:
+                return None
+            retry.lastError = reason
+        return self.schedule(key)
+
+    def attempts(self, key):
+        retry = self._retries.get(key)
+        return retry.attempts if retry else 0
+
+    def succeeded(self, key):
+        self.cancel(key)
+
+    def cancel(self, key):
+        with self._lock:
+            retry = self._retries.pop(key, None)
+            if retry and retry.timer:
+                retry.timer.cancel()
+
+    def status(self):
+        now = time.time()
+        result = []
+        with self._lock:
+            for key, retry in sorted(self._retries.items()):
+                if retry.nextAttempt is None:
+                    text = 'connecting now'
+                else:
+                    text = 'next attempt in %ds' % max(0, retry.nextAttempt - now)
+                text += ', %d attempts so far' % retry.attempts
+                if retry.lastError:
+                    text += ', last error: %s' % retry.lastError
+                result.append((key, text))
+        return result
@@ -0,0 +1,110 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import threading
+
+from soapthrottle import SendQueue
+
+def textLength(text):
+    if isinstance(text, unicode):
+        return len(text.encode('utf-8'))
+    return len(text)
+
+class _Pending(object):
+    __slots__ = ('sender', 'prefix', 'lines', 'length', 'timer')
+
+    def __init__(self, sender, prefix, timer):
+        self.sender = sender
+        self.prefix = prefix
+        self.lines = []
+        self.length = textLength(prefix)
+        self.timer = timer
+
+class LinePacker(object):
+    """
+    Holds chat lines for up to window seconds, joining consecutive lines of
+    the same sender into one message of at most maxLength bytes. A line from
+    someone else, or one that doesn't fit anymore, sends what was collected
+    first, so lines never change order. Lines are sent after the lock is
+    released, through a queue per target, so a send that blocks holds up
+    neither the flush timer nor the other targets
+    """
+
+    def __init__(self, reactor, send, maxLength, separator=' | '):
+        self.reactor = reactor
+        self._send = send
+        self._outboxes = {}
+        self.maxLength = maxLength
+        self.separator = separator
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.counts = {}
+
+    def add(self, target, sender, prefix, line, window):
+        """ Relays prefix + line to target, packed with what follows """
+        with self._lock:
+            counts = self.counts.setdefault(target, [0, 0])
+            counts[0] += 1
+            pending = self._pending.get(target)
+            if pending is not None and (pending.sender != sender or
+                    pending.length + textLength(self.separator) + textLength(line) > self.maxLength):
+                self._flush(target)
+                pending = None
+            if window <= 0:
+                self._flush(target)
+                self._emit(target, prefix + line)
+            else:
+                if pending is None:
+                    timer = self.reactor.callLater(window, self.flush, target)
+                    pending = self._pending[target] = _Pending(sender, prefix, timer)
+                else:
+                    pending.length += textLength(self.separator)
+                pending.lines.append(line)
+                pending.length += textLength(line)
+            outbox = self._outboxes.get(target)
+        if outbox is not None:
+            outbox.deliver()
+
+    def flush(self, target, wait=False):
+        """
+        Sends what was collected for target. With wait, also waits for lines
+        another thread is sending right now, so whatever the caller sends
+        next comes after them
+        """
+        with self._lock:
+            self._flush(target)
+            outbox = self._outboxes.get(target)
+        if outbox is not None:
+            outbox.deliver(wait)
+
+    def _flush(self, target):
+        # Called with the lock held, queueing under it keeps the order
+        pending = self._pending.pop(target, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        self._emit(target, pending.prefix + self.separator.join(pending.lines))
+
+    def _emit(self, target, text):
+        self.counts.setdefault(target, [0, 0])[1] += 1
+        outbox = self._outboxes.get(target)
+        if outbox is None:
+            outbox = self._outboxes[target] = SendQueue(self._send)
+        outbox.push(target, text)
+
+    def stats(self):
+        with self._lock:
+            return dict((target, tuple(counts)) for target, counts in self.counts.iteritems())
@@ -0,0 +1,141 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import OrderedDict
+import sqlite3
+import threading
+import time
+
+PROXY_THRESHOLD = 0.95
+
+def isProxy(verdict):
+    return (float(verdict['result']) > PROXY_THRESHOLD or
+            verdict.get('BadIP', 0) == 1)
+
+class ReputationCache(object):
+    """
+    LRU cache of IP validator verdicts, shared by all servers and kept in a
+    sqlite database so it survives reloads. Verdicts flagging a proxy and
+    clean ones expire after their own TTL. Changes are written in batches by
+    flush(), so lookups never wait on the disk
+    """
+
+    def __init__(self, path, maxEntries, proxyTTL, cleanTTL):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.proxyTTL = proxyTTL
+        self.cleanTTL = cleanTTL
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.loaded = 0
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute('CREATE TABLE IF NOT EXISTS verdicts ('
+                   'ip TEXT PRIMARY KEY, result REAL, badip INTEGER, '
+                   'country TEXT, stored REAL)')
+        return db
+
+    def _expired(self, verdict, stored, now):
+        ttl = self.proxyTTL if isProxy(verdict) else self.cleanTTL
+        return now - stored > ttl
+
+    def load(self):
+        now = time.time()
+        db = self._connect()
+        try:
+            rows = db.execute('SELECT ip, result, badip, country, stored '
+                              'FROM verdicts ORDER BY stored').fetchall()
+        finally:
+            db.close()
+        with self._lock:
+            # Lookups may have run before the load finished. Whatever they
+            # stored is newer than the disk, so it wins and stays at the
+            # recently used end
+            loaded = OrderedDict()
+            for ip, result, badip, country, stored in rows:
+                if ip in self._entries or ip in self._dirty:
+                    continue
+                verdict = {'result': result, 'BadIP': badip, 'Country': country}
+                if self._expired(verdict, stored, now):
+                    self._dirty[ip] = None
+                else:
+                    loaded[ip] = (verdict, stored)
+            self.loaded = len(loaded)
+            loaded.update(self._entries)
+            self._entries = loaded
+            self._evict()
+
+    def get(self, ip):
+        with self._lock:
+            entry = self._entries.pop(ip, None)
+            if entry is not None and self._expired(entry[0], entry[1], time.time()):
+                self._dirty[ip] = None
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[ip] = entry
+            self.hits += 1
+            return entry[0]
+
+    def store(self, ip, verdict):
+        entry = (verdict, time.time())
+        with self._lock:
+            self._entries.pop(ip, None)
+            self._entries[ip] = entry
+            self._dirty[ip] = entry
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.maxEntries:
+            ip, entry = self._entries.popitem(last=False)
+            self._dirty[ip] = None
+            self.evictions += 1
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        stores = []
+        deletes = []
+        for ip, entry in dirty.iteritems():
+            if entry is None:
+                deletes.append((ip,))
+            else:
+                verdict, stored = entry
+                stores.append((ip, verdict['result'], verdict.get('BadIP', 0),
+                               verdict.get('Country'), stored))
+        db = self._connect()
+        try:
+            with db:
+                db.executemany('DELETE FROM verdicts WHERE ip = ?', deletes)
+                db.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)',
+                               stores)
+        finally:
+            db.close()
+        self.writes += len(dirty)
+
+    def stats(self):
+        with self._lock:
+            return (len(self._entries), self.hits, self.misses, self.evictions,
+                    len(self._dirty), self.writes)
@@ -0,0 +1,124 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import os
+import threading
+import time
+
+_defaults = {}
+_defaultsLock = threading.Lock()
+
+_BOOLEANS = {
+    'on': 'true', 'yes': 'true', 'true': 'true',
+    'off': 'false', 'no': 'false', 'false': 'false'}
+
+def normalizeValue(value):
+    value = value.strip().strip('"').lower()
+    return _BOOLEANS.get(value, value)
+
+def loadDefaults(path):
+    """
+    Reads a defaults file, returning the settings it sets as a list of
+    (name, value) and the other commands in it. The result is kept until
+    the file is modified
+    """
+    mtime = os.path.getmtime(path)
+    with _defaultsLock:
+        cached = _defaults.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+    settings = []
+    commands = []
+    with open(path) as rf:
+        for line in rf:
+            line = line.strip()
+            if not line:
+                continue
+            words = line.split(None, 2)
+            if len(words) == 3 and words[0].lower() == 'set':
+                settings.append((words[1], words[2]))
+            else:
+                commands.append(line)
+    with _defaultsLock:
+        _defaults[path] = (mtime, settings, commands)
+    return settings, commands
+
+class SettingsSnapshot(object):
+    """
+    The settings of a server as list_settings last reported them, updated
+    with what we changed since
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._short = {}
+        self.fetched = None
+
+    def fresh(self, maxAge):
+        return self.fetched is not None and time.time() - self.fetched < maxAge
+
+    def update(self, lines):
+        values = {}
+        for line in lines:
+            name, sep, value = line.partition(' = ')
+            if sep and name and not ' ' in name:
+                values[name.strip().lower()] = value
+        # settings can be set by their name without the group, as long as
+        # that is unambiguous
+        short = {}
+        for name in values:
+            shortName = name.rpartition('.')[2]
+            short[shortName] = None if shortName in short else name
+        with self._lock:
+            self._values = values
+            self._short = short
+            self.fetched = time.time()
+        return len(values)
+
+    def invalidate(self):
+        self.fetched = None
+
+    def _lookup(self, name):
+        name = name.lower()
+        if name in self._values:
+            return name
+        return self._short.get(name)
+
+    def diff(self, settings):
+        """
+        Returns the (name, current, new) of settings that differ from the
+        server, and the number that don't. Unknown settings count as
+        different, so they are sent anyway
+        """
+        changes = []
+        unchanged = 0
+        with self._lock:
+            for name, value in settings:
+                key = self._lookup(name)
+                current = self._values.get(key) if key else None
+                if current is not None and normalizeValue(current) == normalizeValue(value):
+                    unchanged += 1
+                else:
+                    changes.append((name, current, value))
+        return changes, unchanged
+
+    def apply(self, changes):
+        with self._lock:
+            for name, current, value in changes:
+                key = self._lookup(name)
+                if key:
+                    self._values[key] = value
@@ -0,0 +1,170 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+from collections import deque
+import threading
+import time
+
+class TokenBucket(object):
+    """
+    Allows rate operations per second on average, in bursts of up to burst.
+    On top of that it holds reserve tokens, which only take(reserved=True)
+    may use, so moderation still gets through when normal traffic has used
+    up the bucket
+    """
+
+    def __init__(self, rate, burst, reserve=0):
+        self.rate = float(rate)
+        self.burst = burst
+        self.reserve = reserve
+        self.tokens = float(burst + reserve)
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def configure(self, rate, burst, reserve=0):
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = burst
+            self.reserve = reserve
+            self.tokens = min(self.tokens, float(burst + reserve))
+
+    def take(self, reserved=False):
+        """
+        Takes a token and returns 0, or returns the number of seconds until
+        one is available
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst + self.reserve,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            floor = 0 if reserved else self.reserve
+            if self.tokens - floor >= 1:
+                self.tokens -= 1
+                return 0
+            return (floor + 1 - self.tokens) / self.rate
+
+class SendQueue(object):
+    """
+    Hands items to send(*args, **kwargs) in the order push() got them, but
+    outside of the lock of whoever decided to send them. push() is called
+    with that lock held, deliver() once it is released. One thread sends at
+    a time; while it is busy, say waiting on a full socket, the others only
+    queue and return, so the reactor never waits behind a worker
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._items = deque()
+        self._sending = False
+
+    def push(self, *args, **kwargs):
+        with self._lock:
+            self._items.append((args, kwargs))
+
+    def deliver(self, wait=False):
+        """
+        Sends what was pushed. With wait, returns only once another thread
+        that is sending has finished too; only for sends that never block
+        """
+        with self._lock:
+            if self._sending:
+                while wait and self._sending:
+                    self._idle.wait()
+                return
+            self._sending = True
+        try:
+            while True:
+                with self._lock:
+                    if not self._items:
+                        self._sending = False
+                        self._idle.notify_all()
+                        return
+                    args, kwargs = self._items.popleft()
+                self._send(*args, **kwargs)
+        except:
+            with self._lock:
+                self._sending = False
+                self._idle.notify_all()
+            raise
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+class PacketThrottle(object):
+    """
+    Sends packets through send(packet, **kwargs) as fast as the bucket
+    allows, queueing the rest in order. Moderation packets go before any
+    waiting ones and may use the bucket's reserve. Queued packets are sent
+    from a reactor timer. Sending happens outside the lock, a send blocking
+    on a full socket doesn't hold up the timer
+    """
+
+    def __init__(self, reactor, bucket, send):
+        self.reactor = reactor
+        self.bucket = bucket
+        self._outbox = SendQueue(send)
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._moderation = deque()
+        self._timer = None
+
+    def send(self, packet, kwargs, moderation=False):
+        with self._lock:
+            if moderation:
+                self._moderation.append((packet, kwargs))
+            else:
+                self._queue.append((packet, kwargs))
+            if self._timer is None or moderation:
+                self._drain()
+        self._outbox.deliver()
+
+    def _drain(self):
+        # Called with the lock held
+        while self._moderation or self._queue:
+            moderation = bool(self._moderation)
+            wait = self.bucket.take(moderation)
+            if wait:
+                if self._timer is None:
+                    self._timer = self.reactor.callLater(wait, self._timedDrain)
+                return
+            queue = self._moderation if moderation else self._queue
+            packet, kwargs = queue.popleft()
+            self._outbox.push(packet, **kwargs)
+
+    def _timedDrain(self):
+        with self._lock:
+            self._timer = None
+            self._drain()
+        self._outbox.deliver()
+
+    def depth(self):
+        return len(self._moderation) + len(self._queue) + len(self._outbox)
+
+    def stop(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._moderation.clear()
+            self._queue.clear()
+            self._outbox.clear()
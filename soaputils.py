@@ -19,28 +19,18 @@ import supybot.ircdb as ircdb
 import supybot.ircmsgs as ircmsgs
 import supybot.ircutils as ircutils
 
+import fnmatch
 import logging
 import logging.handlers
 import os.path
 import re
 import urllib2
-import requests
 import sys
-import json
-from datetime import datetime, timedelta
 
 from enums import *
+from soapvalidator import ValidatorError
 from libottdadmin2.enums import Colour, Action, DestType, ClientID
-from libottdadmin2.packets.admin import AdminRcon, AdminChat
-from libottdadmin2.trackingclient import MappingObject
-
-class RconResults(MappingObject):
-    _mapping = [
-        ('irc', 'irc'),
-        ('command', 'command'),
-        ('succestext', 'succestext'),
-        ('results', 'results'),
-    ]
+from libottdadmin2.packets.admin import AdminChat
 
 def checkPermission(irc, msg, channel, allowOps):
     capable = ircdb.checkCapability(msg.prefix, 'trusted')
@@ -166,6 +156,36 @@ def getConnection(connections, channels, source, serverID = None):
 
     return conn
 
+def getConnections(connections, selector):
+    """
+    Returns the connections selected by 'all' or by a glob pattern matching
+    server IDs or channels, None if selector is neither
+    """
+    if not selector:
+        return None
+    selector = selector.lower()
+    if selector != 'all' and not any(c in selector for c in '*?['):
+        return None
+    conns = [c for c in connections.itervalues() if selector == 'all'
+             or fnmatch.fnmatchcase(c.ID.lower(), selector)
+             or fnmatch.fnmatchcase(c.channel.lower(), selector)]
+    return sorted(conns, key=getConnectionID)
+
+def permittedConnections(irc, msg, conns, allowOps):
+    """
+    The connections of conns the sender of msg may command. allowOps(channel)
+    tells whether ops of that channel may
+    """
+    allowed = []
+    for conn in conns:
+        try:
+            if checkPermission(irc, msg, conn.channel, allowOps(conn.channel)):
+                allowed.append(conn)
+        except KeyError:
+            # not in that channel, so we can't tell if they're opped
+            pass
+    return allowed
+
 def getConnectionID(conn):
     if conn.ID == 'default':
         return conn.channel
@@ -187,11 +207,44 @@ def logEvent(logger, message):
     except AttributeError:
         pass
 
-def msgChannel(irc, channel, msg):
+_outputScheduler = None
+
+def setOutputScheduler(scheduler):
+    global _outputScheduler
+    _outputScheduler = scheduler
+
+def msgChannel(irc, channel, msg, priority=MessagePriority.NORMAL):
+    scheduler = _outputScheduler
+    if scheduler is not None:
+        scheduler.send(irc, channel, msg, priority)
+    else:
+        sendChannel(irc, channel, msg, priority == MessagePriority.ALERT)
+
+def sendChannel(irc, channel, msg, fast=False):
     if channel in irc.state.channels or irc.isNick(channel):
-        irc.queueMsg(ircmsgs.privmsg(channel, msg))
+        if fast:
+            irc.sendMsg(ircmsgs.privmsg(channel, msg))
+        else:
+            irc.queueMsg(ircmsgs.privmsg(channel, msg))
+
+def compileWhitelist(entries):
+    """
+    Merges the addresses and CIDR subnets in entries into a single IPSet.
+    Returns the set and the entries that could not be parsed
+    """
+    networks = []
+    bad = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(netaddr.IPNetwork(entry))
+        except (netaddr.AddrFormatError, ValueError, TypeError):
+            bad.append(entry)
+    return netaddr.IPSet(networks), bad
 
-def checkIP(irc, conn, client, whitelist, checkedDict):
+def checkIP(say, conn, client, whitelist, blocklist, reputation, validator):
 
     try:
         ipAddr = netaddr.IPAddress(client.hostname)
@@ -202,84 +255,63 @@ def checkIP(irc, conn, client, whitelist, checkedDict):
                          destType=DestType.BROADCAST,
                          clientID=ClientID.SERVER,
                          message=text)
-        msgChannel(irc, conn.channel, text)
+        say(text)
         return
 
-    for v in whitelist:
-        try:
-            entry = netaddr.IPNetwork(v)
-        except netaddr.AddrFormatError:
-            text = '*** *[ADM]* Invalid Whitelist entry while checking {name}'.format(name=client.name)
-            conn.send_packet(AdminChat,
-                             action=Action.CHAT,
-                             destType=DestType.BROADCAST,
-                             clientID=ClientID.SERVER,
-                             message=text)
-            msgChannel(irc, conn.channel, text)
-            return
-
-        if ipAddr in entry:
-            text = '*** {name} is a whitelisted player, and will not be checked.'.format(name=client.name)
-            conn.send_packet(AdminChat,
-                             action=Action.CHAT,
-                             destType=DestType.BROADCAST,
-                             clientID=ClientID.SERVER,
-                             message=text)
-            msgChannel(irc, conn.channel, text)
-            return
-
-    result = None
+    if ipAddr in whitelist:
+        text = '*** {name} is a whitelisted player, and will not be checked.'.format(name=client.name)
+        conn.send_packet(AdminChat,
+                         action=Action.CHAT,
+                         destType=DestType.BROADCAST,
+                         clientID=ClientID.SERVER,
+                         message=text)
+        say(text, MessagePriority.ROUTINE)
+        return
 
-    # First let's garbage collect
-    # learner's note: you can't just do iteritems() into a del because you'll get a RuntimeError exception when
-    # the dictionary changes size during the loop
-    cutoff = datetime.utcnow() - timedelta(days=1)
-    checkedDict = { k:v for k,v in checkedDict.iteritems() if v.get('timestamp') < cutoff }
+    listed = blocklist.lookup(ipAddr)
+    if listed:
+        conn.logger.debug('>>--DEBUG--<< %s is listed in %s' % (client.hostname, listed))
+        result = {'result': 1, 'Country': 'a blocklisted network (%s)' % listed}
+    else:
+        result = reputation.get(client.hostname)
 
-    if client.hostname not in checkedDict \
-    or not checkedDict.get(client.hostname, {}).get('message', False):
+    if result is None:
         try:
-            result = requests.get("http://check.getipintel.net/check.php?ip=" + client.hostname + "&format=json&oflags=bc&contact=" + "ttd-abuse@duck.me.uk",timeout=5.00)
-            if (result.status_code != 200):
-                msgChannel(irc, conn.channel, str("*** *[ADM]* Couldn\'t contact validator to check %s. Status error?" % client.name))
-                return
-            result = json.loads(result.text)
-        except requests.exceptions.RequestException as e:
-            msgChannel(irc, conn.channel, str("*** *[ADM]* Couldn\'t contact validator to check {name}. Timeout?".format(name=client.name)))
+            result = validator.lookup(client.hostname)
+        except ValidatorError as e:
+            say(str("*** *[ADM]* Couldn\'t contact validator to check {name}. {error}".format(name=client.name, error=e)), MessagePriority.ALERT)
             return
 
         if (result == None):
-            msgChannel(irc, conn.channel,"*** *[ADM]* Received NONE during checkIP (this should never happen!)")
+            say("*** *[ADM]* Received NONE during checkIP (this should never happen!)", MessagePriority.ALERT)
             return
         conn.logger.debug('>>--DEBUG--<< CheckIP result: %s' % str(result))
-        if result['result'] < 0:
-
-            checkedDict[client.hostname] = {'result': result['result'], 'BadIP': result.get('BadIP', 0), 'Country': result['Country'], 'timestamp': datetime.utcnow()}
-        else:
-            checkedDict[client.hostname] = {'result': result['result'], 'message': result.get('message', 'Unknown failure'), 'timestamp': datetime.utcnow()}
-    else:
+        # only verdicts are worth remembering, errors are retried next time
+        if float(result['result']) >= 0:
+            reputation.store(client.hostname, {'result': result['result'], 'BadIP': result.get('BadIP', 0), 'Country': result.get('Country')})
+    elif not listed:
         conn.logger.debug('>>--DEBUG--<< Using cached result for IP: %s' % client.hostname)
-        result = checkedDict[client.hostname]
 
     if float(result['result']) < 0:
-        msgChannel(irc, conn.channel, "*** There was a problem validating {name}. The error was: {error}".format(name=client.name, error=result['message']))
+        say("*** There was a problem validating {name}. The error was: {error}".format(name=client.name, error=result['message']))
     elif float(result['result']) == 1:
         kickMessage = "Sorry, connecting from a VPN or proxy is not allowed! Please disable any such software and try again. If you think this is an error, please contact us."
         conn.send_packet(AdminChat,
                          action=Action.CHAT_CLIENT,
                          destType=DestType.CLIENT,
                          clientID=client.id,
-                         message=kickMessage)
+                         message=kickMessage,
+                         moderation=True)
         text = '*** {name} was trying to connect from a VPN or proxy in {location}, which is not allowed.'.format(name=client.name, location=result['Country'])
         command = 'ban {clientid} "{message}"'.format(clientid=client.id, message=kickMessage)
-        conn.rcon = conn.channel
         conn.send_packet(AdminChat,
                          action=Action.CHAT,
                          destType=DestType.BROADCAST,
                          clientID=ClientID.SERVER,
-                         message=text)
-        msgChannel(irc, conn.channel, text)
-        conn.send_packet(AdminRcon, command=command)
+                         message=text,
+                         moderation=True)
+        say(text, MessagePriority.ALERT)
+        conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
     elif float(result['result']) > 0.95 or result.get('BadIP', 0) == 1:
         text = str('*** {name} MIGHT BE CONNECTING VIA A PROXY IN {location}. {certainty:.2f} certainty.' + (" Warning: Potential ISP blacklisted address!" if bool(result.get('BadIP', False)) else "")).format(name=client.name, location=result['Country'], certainty=float(result['result'])*100)
         conn.send_packet(AdminChat,
@@ -287,7 +319,7 @@ def checkIP(irc, conn, client, whitelist, checkedDict):
                          destType=DestType.BROADCAST,
                          clientID=ClientID.SERVER,
                          message=text)
-        msgChannel(irc, conn.channel, text)
+        say(text, MessagePriority.ALERT)
     else:
         text = '*** {name} is a valid player from {location}.'.format(name=client.name, location=result.get('Country', 'an unknown country'))
         conn.send_packet(AdminChat,
@@ -295,10 +327,10 @@ def checkIP(irc, conn, client, whitelist, checkedDict):
                          destType=DestType.BROADCAST,
                          clientID=ClientID.SERVER,
                          message=text)
-        msgChannel(irc, conn.channel, text)
+        say(text, MessagePriority.ROUTINE)
     return
 
-def moveToSpectators(irc, conn, client, kickCount, kickDict):
+def moveToSpectators(say, conn, client, kickCount, kickDict):
     if client.id in kickDict:
         kickDict[client.id] += 1
     else:
@@ -306,26 +338,26 @@ def moveToSpectators(irc, conn, client, kickCount, kickDict):
 
     text = '%s: Change your name before joining/starting a company. Use \'!name <new name>\' to do so. (%s OF %s BEFORE KICK)' % (client.name, kickDict[client.id], kickCount)
     command = 'move {clientid} 255'.format(clientid=client.id)
-    conn.rcon = conn.channel
-    conn.send_packet(AdminRcon, command = command)
+    conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
     conn.send_packet(AdminChat,
         action = Action.CHAT,
         destType = DestType.BROADCAST,
         clientID = ClientID.SERVER,
-        message = text)
-    conn.send_packet(AdminRcon, command = command)
+        message = text,
+        moderation = True)
+    conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
 
     if kickDict is not None and kickDict[client.id] >= kickCount:
         text = 'Kicking {clientname} for reaching name change warning count'.format(clientname=client.name)
         command = 'kick {clientid} "Please set a player name in the top right of the server browser before reconnecting."'.format(clientid=client.id)
-        conn.rcon = conn.channel
         conn.send_packet(AdminChat,
             action = Action.CHAT,
             destType = DestType.BROADCAST,
             clientID = ClientID.SERVER,
-            message = text)
-        msgChannel(irc, conn.channel, text)
-        conn.send_packet(AdminRcon, command = command)
+            message = text,
+            moderation = True)
+        say(text, MessagePriority.ALERT)
+        conn.rconEngine.submit(command, priority=RconPriority.MODERATION)
 
 def playercount(conn):
     clients = len(conn.clients)
@@ -0,0 +1,138 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+import threading
+import time
+
+import requests
+import requests.adapters
+
+class ValidatorError(Exception):
+    pass
+
+class _Flight(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class IPValidator(object):
+    """
+    Client for the IP validation service. Requests go through one keep-alive
+    session, at most concurrency at a time. Concurrent lookups of the same
+    address share a single request. After failureLimit failures in a row
+    lookups fail straight away for cooldown seconds, then one is let through
+    to see whether the service is back. url should contain {ip}
+    """
+
+    def __init__(self, url, timeout, concurrency, failureLimit, cooldown):
+        self.url = url
+        self.timeout = timeout
+        self.failureLimit = failureLimit
+        self.cooldown = cooldown
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._failures = 0
+        self._openUntil = 0
+
+        self.requests = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def lookup(self, ip):
+        with self._lock:
+            flight = self._flights.get(ip)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                wait = self._openUntil - time.time()
+                if wait > 0:
+                    self.rejected += 1
+                    raise ValidatorError('Validator failed repeatedly, not trying again for %ds' % (int(wait) + 1))
+                if self._failures >= self.failureLimit:
+                    # let this one probe the service, the rest wait for it
+                    self._openUntil = time.time() + self.cooldown
+                flight = self._flights[ip] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+        else:
+            try:
+                flight.result = self._fetch(ip)
+            except ValidatorError as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[ip]
+                flight.done.set()
+        if flight.error:
+            raise flight.error
+        return flight.result
+
+    def _fetch(self, ip):
+        with self._slots:
+            self.requests += 1
+            try:
+                response = self.session.get(self.url.format(ip=ip),
+                                            timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                self._failed()
+                raise ValidatorError('Timeout?')
+            if response.status_code != 200:
+                self._failed()
+                raise ValidatorError('Status error?')
+            try:
+                result = response.json()
+            except ValueError:
+                result = None
+            if not isinstance(result, dict) or 'result' not in result:
+                self._failed()
+                raise ValidatorError('Invalid response?')
+        with self._lock:
+            self._failures = 0
+            self._openUntil = 0
+        return result
+
+    def _failed(self):
+        with self._lock:
+            self.errors += 1
+            self._failures += 1
+            if self._failures >= self.failureLimit:
+                self._openUntil = time.time() + self.cooldown
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            state = 'closed'
+            if self._openUntil > time.time():
+                state = 'open'
+            elif self._failures >= self.failureLimit:
+                state = 'half-open'
+            return (self.requests, self.coalesced, self.rejected, self.errors,
+                    len(self._flights), state)
@@ -0,0 +1,60 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+# Times reading the snapshotted values from the supybot registry, as event
+# handlers used to, against reading them from a ChannelConfig snapshot.
+# Needs supybot installed. Usage: python2 tests/bench_config.py [rounds]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import supybot.conf as conf
+
+import config
+from soapconfig import buildSnapshot, SNAPSHOT_VALUES, SNAPSHOT_GLOBALS
+
+CHANNEL = '#openttd'
+
+def registryValue(name, channel=None):
+    value = conf.supybot.plugins.Suds.get(name)
+    if channel is not None:
+        value = value.get(channel)
+    return value()
+
+def main(rounds):
+    names = SNAPSHOT_VALUES + SNAPSHOT_GLOBALS
+    start = time.time()
+    for i in xrange(rounds):
+        for name in SNAPSHOT_VALUES:
+            registryValue(name, CHANNEL)
+        for name in SNAPSHOT_GLOBALS:
+            registryValue(name)
+    registry = (time.time() - start) / rounds
+    snapshot = buildSnapshot(registryValue, CHANNEL)
+    start = time.time()
+    for i in xrange(rounds):
+        for name in names:
+            getattr(snapshot, name)
+    cached = (time.time() - start) / rounds
+    print 'reading %d values costs %.1fus from the registry, %.1fus from the snapshot' % (
+        len(names), registry * 1000000, cached * 1000000)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
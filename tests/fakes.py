@@ -0,0 +1,77 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import logging
+
+# Stand-ins for the reactor and connections, so tests control time
+
+class FakeTimer(object):
+    def __init__(self, when, func, args):
+        self.when = when
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeReactor(object):
+    """ Runs timers only when advance() moves its clock past them """
+
+    def __init__(self):
+        self.now = 0
+        self.timers = []
+        self.masks = {}
+        self.inReactor = True
+
+    def modify(self, fileno, eventmask):
+        self.masks[fileno] = eventmask
+
+    def inReactorThread(self):
+        return self.inReactor
+
+    def callLater(self, delay, func, *args):
+        timer = FakeTimer(self.now + delay, func, args)
+        self.timers.append(timer)
+        return timer
+
+    def time(self):
+        # lets the reactor stand in for the time module of the code under test
+        return self.now
+
+    def pending(self):
+        return [timer for timer in self.timers if not timer.cancelled]
+
+    def advance(self, seconds):
+        self.now += seconds
+        while True:
+            due = [timer for timer in self.pending() if timer.when <= self.now]
+            if not due:
+                break
+            timer = min(due, key=lambda timer: timer.when)
+            self.timers.remove(timer)
+            timer.func(*timer.args)
+
+class FakeConnection(object):
+    """ Records the rcon commands an RconEngine sends """
+
+    def __init__(self):
+        self.logger = logging.getLogger('test')
+        self.sent = []
+
+    def send_packet(self, packet, command):
+        self.sent.append(command)
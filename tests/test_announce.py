@@ -0,0 +1,91 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from enums import MessagePriority
+from fakes import FakeReactor
+from soapannounce import AnnouncementBatcher, joinNames
+
+class AnnouncementBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.sent = []
+        self.batcher = AnnouncementBatcher(self.reactor, self.send, 60)
+
+    def send(self, irc, channel, text, priority):
+        self.sent.append((channel, text, priority))
+
+    def join(self, name, channel='#a', window=2):
+        self.batcher.announce(None, channel, 'join', name,
+                              '*** %s has joined' % name, '*** %s have joined', window)
+
+    def texts(self):
+        return [text for channel, text, priority in self.sent]
+
+    def test_single_announcement_uses_single_line(self):
+        self.join('Alice')
+        self.reactor.advance(2)
+        self.assertEqual(self.sent, [('#a', '*** Alice has joined', MessagePriority.ROUTINE)])
+
+    def test_announcements_within_window_are_joined(self):
+        self.join('Alice')
+        self.join('Bob')
+        self.join('Carol')
+        self.assertEqual(self.sent, [])
+        self.reactor.advance(2)
+        self.assertEqual(self.texts(), ['*** Alice, Bob and Carol have joined'])
+
+    def test_long_batches_are_cut_short(self):
+        for i in range(20):
+            self.join('Player%d' % i)
+        self.reactor.advance(2)
+        self.assertEqual(len(self.texts()), 1)
+        text = self.texts()[0]
+        self.assertTrue(len(text) <= 60)
+        self.assertTrue(text.endswith(' others have joined'))
+
+    def test_kinds_and_channels_are_kept_apart(self):
+        self.join('Alice')
+        self.batcher.announce(None, '#a', 'quit', 'Bob', '*** Bob has left',
+                              '*** %s have left', 2)
+        self.join('Carol', '#b')
+        self.reactor.advance(2)
+        self.assertEqual(sorted(self.sent), [
+            ('#a', '*** Alice has joined', MessagePriority.ROUTINE),
+            ('#a', '*** Bob has left', MessagePriority.ROUTINE),
+            ('#b', '*** Carol has joined', MessagePriority.ROUTINE)])
+
+    def test_say_flushes_first(self):
+        self.join('Alice')
+        self.batcher.say(None, '#a', '<Alice> hi')
+        self.assertEqual(self.texts(), ['*** Alice has joined', '<Alice> hi'])
+        self.assertEqual(self.reactor.pending(), [])
+
+    def test_no_window_sends_straight_away(self):
+        self.join('Alice')
+        self.join('Bob', window=0)
+        self.assertEqual(self.texts(), ['*** Alice has joined', '*** Bob has joined'])
+
+    def test_join_names(self):
+        self.assertEqual(joinNames(['A']), 'A')
+        self.assertEqual(joinNames(['A', 'B', 'C']), 'A, B and C')
+        self.assertEqual(joinNames(['A', 'B'], 1), 'A, B and 1 other')
+        self.assertEqual(joinNames(['A'], 3), 'A and 3 others')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import netaddr
+
+from soapblocklist import CidrBlocklist
+
+class CidrBlocklistTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text, mtime=1000):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as wf:
+            wf.write(text)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def lookup(self, blocklist, address):
+        return blocklist.lookup(netaddr.IPAddress(address))
+
+    def test_lookup_finds_listed_networks(self):
+        path = self.write('vpn.txt', '# providers\n198.51.100.0/24\n\n203.0.113.7 # one host\n2001:db8::/32\n')
+        blocklist = CidrBlocklist([path])
+        self.assertEqual(blocklist.reload(), [])
+        self.assertEqual(self.lookup(blocklist, '198.51.100.200'), 'vpn.txt')
+        self.assertEqual(self.lookup(blocklist, '203.0.113.7'), 'vpn.txt')
+        self.assertEqual(self.lookup(blocklist, '203.0.113.8'), None)
+        self.assertEqual(self.lookup(blocklist, '2001:db8::1'), 'vpn.txt')
+        self.assertEqual(self.lookup(blocklist, '2001:db9::1'), None)
+        self.assertEqual(blocklist.stats(), (2, 1, 1, 5, 3))
+
+    def test_overlapping_and_adjacent_ranges_merge(self):
+        datacenter = self.write('datacenter.txt', '10.0.0.0/24\n10.0.1.0/24\n')
+        tor = self.write('tor.txt', '10.0.0.128/25\n10.0.5.1\n')
+        blocklist = CidrBlocklist([datacenter, tor])
+        blocklist.reload()
+        self.assertEqual(blocklist.stats()[0], 2)
+        self.assertEqual(self.lookup(blocklist, '10.0.1.255'), 'datacenter.txt')
+        self.assertEqual(self.lookup(blocklist, '10.0.5.1'), 'tor.txt')
+
+    def test_problems_are_reported(self):
+        path = self.write('vpn.txt', '198.51.100.0/24\nnot an address\n300.1.1.1\n')
+        blocklist = CidrBlocklist([path, os.path.join(self.dir, 'missing.txt')])
+        problems = blocklist.reload()
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(problems[0].endswith('missing.txt: No such file or directory'))
+        self.assertEqual(problems[1], '2 invalid entries ignored')
+        self.assertEqual(self.lookup(blocklist, '198.51.100.1'), 'vpn.txt')
+
+    def test_reload_only_when_files_change(self):
+        path = self.write('vpn.txt', '198.51.100.0/24\n')
+        blocklist = CidrBlocklist([path])
+        blocklist.reload()
+        self.assertEqual(blocklist.reload(), None)
+        self.write('vpn.txt', '203.0.113.0/24\n', 2000)
+        self.assertEqual(blocklist.reload(), [])
+        self.assertEqual(self.lookup(blocklist, '198.51.100.1'), None)
+        self.assertEqual(self.lookup(blocklist, '203.0.113.1'), 'vpn.txt')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import select
+import socket
+import threading
+import time
+import unittest
+
+import soapclient
+from fakes import FakeReactor
+from soapclient import PACKET_HEADER, RECV_BUFFER_SIZE, SoapClient
+from soapreactor import DEFAULT_EVENTMASK, EPOLLOUT
+
+def packet(packetType, payload):
+    return PACKET_HEADER.pack(PACKET_HEADER.size + len(payload), packetType) + payload
+
+class ClientTestCase(unittest.TestCase):
+    """ A SoapClient connected to a socket on localhost playing the server """
+
+    def setUp(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.client = SoapClient('#test', 'test')
+        self.client.connect(listener.getsockname())
+        # as finish_connect leaves it, whatever default timeout is set
+        self.client.setblocking(True)
+        self.peer = listener.accept()[0]
+        listener.close()
+        self.client.filenumber = self.client.fileno()
+        self.received = []
+        self.client._dispatchPacket = self.dispatch
+
+    def tearDown(self):
+        self.peer.close()
+        self.client.close()
+
+    def dispatch(self, packetType, payload):
+        self.received.append((packetType, payload))
+        return packetType
+
+class RecvPacketsTest(ClientTestCase):
+    def read(self):
+        select.select([self.client], [], [], 1)
+        return self.client.recv_packets()
+
+    def test_packet_split_across_reads(self):
+        data = packet(5, 'hello')
+        self.peer.sendall(data[:2])
+        self.assertEqual(self.read(), [])
+        self.peer.sendall(data[2:6])
+        self.assertEqual(self.read(), [])
+        self.peer.sendall(data[6:])
+        self.assertEqual(self.read(), [5])
+        self.assertEqual(self.received, [(5, 'hello')])
+
+    def test_several_packets_in_one_read(self):
+        self.peer.sendall(packet(1, 'a') + packet(2, '') + packet(3, 'ccc') + packet(4, 'dd')[:4])
+        self.assertEqual(self.read(), [1, 2, 3])
+        self.assertEqual(self.received, [(1, 'a'), (2, ''), (3, 'ccc')])
+        self.peer.sendall(packet(4, 'dd')[4:])
+        self.assertEqual(self.read(), [4])
+
+    def test_partial_packet_at_end_of_buffer_is_kept(self):
+        payload = 'x' * 1000
+        count = RECV_BUFFER_SIZE // len(packet(1, payload)) + 5
+        self.peer.sendall(packet(1, payload) * count)
+        packets = []
+        while len(packets) < count:
+            result = self.read()
+            self.assertNotEqual(result, None)
+            packets.extend(result)
+        self.assertEqual(len(packets), count)
+        self.assertTrue(all(item == (1, payload) for item in self.received))
+
+    def test_zero_length_header_drops_connection(self):
+        self.peer.sendall('\x00\x00\x01')
+        self.assertEqual(self.read(), None)
+
+    def test_short_length_header_drops_connection(self):
+        self.peer.sendall(packet(1, 'ok') + '\x02\x00\x01')
+        self.assertEqual(self.read(), None)
+        self.assertEqual(self.received, [(1, 'ok')])
+
+    def test_closed_connection(self):
+        self.peer.close()
+        self.assertEqual(self.read(), None)
+
+class SendBufferTest(ClientTestCase):
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.reactor = FakeReactor()
+        self.client.enable_send_buffer(self.reactor, 1024)
+        self.peer.setblocking(False)
+        self.timeout = soapclient.SEND_WAIT_TIMEOUT
+
+    def tearDown(self):
+        soapclient.SEND_WAIT_TIMEOUT = self.timeout
+        ClientTestCase.tearDown(self)
+
+    def mask(self):
+        return self.reactor.masks.get(self.client.filenumber)
+
+    def readPeer(self):
+        data = []
+        while True:
+            try:
+                chunk = self.peer.recv(65536)
+            except socket.error:
+                break
+            if not chunk:
+                break
+            data.append(chunk)
+        return ''.join(data)
+
+    def test_writes_wait_for_writable(self):
+        self.client.sendall('abc')
+        self.client.sendall('def')
+        self.assertEqual(self.client.pendingBytes(), 6)
+        self.assertEqual(self.mask(), DEFAULT_EVENTMASK | EPOLLOUT)
+        self.assertEqual(self.readPeer(), '')
+        self.assertTrue(self.client.flush_send_buffer())
+        self.assertEqual(self.client.pendingBytes(), 0)
+        self.assertEqual(self.mask(), DEFAULT_EVENTMASK)
+        select.select([self.peer], [], [], 1)
+        self.assertEqual(self.readPeer(), 'abcdef')
+        self.assertEqual(self.client.queuedWrites, 2)
+
+    def test_partial_send_keeps_the_rest(self):
+        data = ''.join(chr(i % 251) for i in range(251)) * 32768
+        self.client.sendall(data)
+        self.assertTrue(self.client.flush_send_buffer())
+        # the socket took what fit, the rest waits for the next EPOLLOUT
+        self.assertTrue(0 < self.client.pendingBytes() < len(data))
+        self.assertEqual(self.mask(), DEFAULT_EVENTMASK | EPOLLOUT)
+        received = []
+        deadline = time.time() + 10
+        while self.client.pendingBytes() and time.time() < deadline:
+            select.select([self.peer], [], [], 0.1)
+            received.append(self.readPeer())
+            self.assertTrue(self.client.flush_send_buffer())
+        select.select([self.peer], [], [], 0.1)
+        received.append(self.readPeer())
+        self.assertEqual(self.mask(), DEFAULT_EVENTMASK)
+        self.assertEqual(''.join(received), data)
+
+    def test_reactor_thread_never_waits(self):
+        start = time.time()
+        self.client.sendall('x' * 65536)
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(self.client.pendingBytes(), 65536)
+
+    def test_other_threads_wait_for_drain(self):
+        self.reactor.inReactor = False
+        threading.Timer(0.2, self.client.flush_send_buffer).start()
+        start = time.time()
+        self.client.sendall('x' * 4096)
+        elapsed = time.time() - start
+        self.assertTrue(0.15 < elapsed < 2, elapsed)
+        self.assertEqual(self.client.pendingBytes(), 0)
+
+    def test_other_threads_give_up_waiting(self):
+        soapclient.SEND_WAIT_TIMEOUT = 0.3
+        self.reactor.inReactor = False
+        start = time.time()
+        self.client.sendall('x' * 4096)
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(self.client.pendingBytes(), 4096)
+
+if __name__ == '__main__':
+    unittest.main()
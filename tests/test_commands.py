@@ -0,0 +1,81 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+import soapcommands
+from fakes import FakeReactor
+from soapcommands import SlidingWindowLimiter, ingameCommand, ingameCommands
+
+class Handlers(object):
+    @ingameCommand('admin', 'help')
+    def admin(self, conn, client, clientName, argument):
+        return 'admin'
+
+    @ingameCommand('rules')
+    def rules(self, conn, client, clientName, argument):
+        return 'rules'
+
+    def other(self):
+        pass
+
+class IngameCommandsTest(unittest.TestCase):
+    def test_table_maps_names_to_bound_handlers(self):
+        handlers = Handlers()
+        table = ingameCommands(handlers)
+        self.assertEqual(sorted(table), ['admin', 'help', 'rules'])
+        self.assertEqual(table['help'](None, 1, 'x', ''), 'admin')
+        self.assertEqual(table['rules'].__self__, handlers)
+
+class SlidingWindowLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeReactor()
+        self.time = soapcommands.time
+        soapcommands.time = self.clock
+        self.limiter = SlidingWindowLimiter()
+
+    def tearDown(self):
+        soapcommands.time = self.time
+
+    def test_limits_events_within_window(self):
+        self.assertTrue(self.limiter.allow('a', 2, 10))
+        self.clock.advance(5)
+        self.assertTrue(self.limiter.allow('a', 2, 10))
+        self.assertFalse(self.limiter.allow('a', 2, 10))
+        self.clock.advance(5)
+        # the first event has left the window
+        self.assertTrue(self.limiter.allow('a', 2, 10))
+        self.assertFalse(self.limiter.allow('a', 2, 10))
+
+    def test_refused_events_do_not_count(self):
+        self.limiter.allow('a', 1, 10)
+        for i in range(5):
+            self.clock.advance(1)
+            self.assertFalse(self.limiter.allow('a', 1, 10))
+        self.clock.advance(5)
+        self.assertTrue(self.limiter.allow('a', 1, 10))
+
+    def test_keys_are_separate_and_forgettable(self):
+        self.assertTrue(self.limiter.allow('a', 1, 10))
+        self.assertTrue(self.limiter.allow('b', 1, 10))
+        self.assertEqual(len(self.limiter), 2)
+        self.limiter.forget('a')
+        self.assertEqual(len(self.limiter), 1)
+        self.assertTrue(self.limiter.allow('a', 1, 10))
+
+if __name__ == '__main__':
+    unittest.main()
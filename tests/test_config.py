@@ -0,0 +1,76 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import os
+import re
+import unittest
+
+from soapconfig import (buildSnapshot, changed, FLOOD_VALUES, SNAPSHOT_GLOBALS,
+                        SNAPSHOT_VALUES)
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.py')
+
+class FakeRegistry(object):
+    def __init__(self, **values):
+        self.values = values
+        self.reads = []
+
+    def __call__(self, name, channel=None):
+        self.reads.append((name, channel))
+        return self.values.get(name, 0)
+
+class SnapshotTest(unittest.TestCase):
+    def test_lists_are_frozen(self):
+        registry = FakeRegistry(rconCacheRules=['companies=5'], welcomeMessage=['hi', 'there'])
+        snapshot = buildSnapshot(registry, '#a')
+        self.assertEqual(snapshot.rconCacheRules, ('companies=5',))
+        self.assertEqual(snapshot.welcomeMessage, ('hi', 'there'))
+        registry.values['welcomeMessage'].append('later')
+        self.assertEqual(snapshot.welcomeMessage, ('hi', 'there'))
+
+    def test_globals_are_read_without_channel(self):
+        registry = FakeRegistry()
+        buildSnapshot(registry, '#a')
+        reads = dict(registry.reads)
+        for name in SNAPSHOT_VALUES:
+            self.assertEqual(reads[name], '#a')
+        for name in SNAPSHOT_GLOBALS:
+            self.assertEqual(reads[name], None)
+
+    def test_changed(self):
+        old = buildSnapshot(FakeRegistry(floodChatLimit=5, rconRate=2), '#a')
+        self.assertTrue(changed(None, old, FLOOD_VALUES))
+        self.assertFalse(changed(old, old, FLOOD_VALUES))
+        rate = buildSnapshot(FakeRegistry(floodChatLimit=5, rconRate=3), '#a')
+        self.assertFalse(changed(old, rate, FLOOD_VALUES))
+        self.assertTrue(changed(old, rate, ('rconRate',)))
+        flood = buildSnapshot(FakeRegistry(floodChatLimit=6, rconRate=2), '#a')
+        self.assertTrue(changed(old, flood, FLOOD_VALUES))
+
+    def test_values_match_their_registration(self):
+        with open(CONFIG) as configFile:
+            source = configFile.read()
+        kinds = dict((name, kind) for kind, name in re.findall(
+            r"register(Channel|Global)Value\(Suds, '(\w+)'", source))
+        for name in SNAPSHOT_VALUES:
+            self.assertEqual(kinds.get(name), 'Channel', name)
+        for name in SNAPSHOT_GLOBALS:
+            self.assertEqual(kinds.get(name), 'Global', name)
+        self.assertTrue(set(FLOOD_VALUES) <= set(SNAPSHOT_VALUES))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import random
+import threading
+import time
+import unittest
+
+from soapdispatch import SoapDispatcher, WorkerPool, slowHandler
+
+class FakeLog(object):
+    def __init__(self):
+        self.warnings = []
+        self.exceptions = []
+
+    def warning(self, text):
+        self.warnings.append(text)
+
+    def exception(self, text):
+        self.exceptions.append(text)
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.log = FakeLog()
+        self.pool = WorkerPool(self.log, 'TestWorker', 4, 5)
+        self.lock = threading.Lock()
+        self.done = threading.Semaphore(0)
+        self.calls = []
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def record(self, key, number, delay=0):
+        if delay:
+            time.sleep(delay)
+        with self.lock:
+            self.calls.append((key, number))
+        self.done.release()
+
+    def wait(self, count):
+        for i in range(count):
+            self.done.acquire()
+        # let the workers finish their bookkeeping
+        deadline = time.time() + 2
+        while self.pool.handled < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_tasks_of_one_key_run_in_order(self):
+        keys = ['#a', '#b', '#c']
+        for number in range(60):
+            key = keys[number % 3]
+            self.pool.submit(key, self.record, (key, number, random.random() / 200))
+        self.wait(60)
+        for key in keys:
+            numbers = [number for calledKey, number in self.calls if calledKey == key]
+            self.assertEqual(numbers, sorted(numbers))
+            self.assertEqual(len(numbers), 20)
+        self.assertEqual(self.pool.handled, 60)
+
+    def test_keys_run_side_by_side(self):
+        release = threading.Event()
+        def block():
+            release.wait(5)
+            self.done.release()
+        self.pool.submit('#a', block)
+        self.pool.submit('#b', self.record, ('#b', 1))
+        self.done.acquire()
+        self.assertEqual(self.calls, [('#b', 1)])
+        release.set()
+        self.done.acquire()
+
+    def test_overrun_is_counted_but_keeps_order(self):
+        @slowHandler(0.05)
+        def slow(key, number):
+            self.record(key, number, 0.3)
+        self.pool.submit('#a', slow, ('#a', 1))
+        time.sleep(0.1)
+        self.pool.submit('#a', self.record, ('#a', 2))
+        self.pool.submit('#a', self.record, ('#a', 3))
+        self.wait(3)
+        self.assertEqual(self.calls, [('#a', 1), ('#a', 2), ('#a', 3)])
+        self.assertEqual(self.pool.overruns, 1)
+        self.assertEqual(self.pool.timeouts, 1)
+        self.assertEqual(len(self.log.warnings), 1)
+        self.assertTrue('1 events for #a are waiting' in self.log.warnings[0])
+
+    def test_backlog_is_measured(self):
+        started = threading.Event()
+        release = threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+            self.done.release()
+        self.pool.submit('#a', block)
+        started.wait(5)
+        for number in range(5):
+            self.pool.submit('#a', self.record, ('#a', number))
+        self.assertEqual(self.pool.depth, 5)
+        release.set()
+        self.wait(6)
+        self.assertEqual(self.pool.depth, 0)
+        self.assertEqual(self.pool.maxDepth, 5)
+        self.assertTrue('queue depth 0 (max 5), 6 handled' in self.pool.stats()[0])
+
+    def test_exceptions_are_logged(self):
+        def fail():
+            self.done.release()
+            raise ValueError('broken')
+        self.pool.submit('#a', fail)
+        self.pool.submit('#a', self.record, ('#a', 1))
+        self.wait(2)
+        self.assertEqual(self.calls, [('#a', 1)])
+        self.assertEqual(len(self.log.exceptions), 1)
+
+    def test_stopped_pool_takes_nothing(self):
+        self.pool.stop()
+        self.pool.submit('#a', self.record, ('#a', 1))
+        self.assertEqual(self.pool.depth, 0)
+
+class SoapDispatcherTest(unittest.TestCase):
+    def test_slow_handlers_get_their_own_pool(self):
+        dispatcher = SoapDispatcher(FakeLog(), 1, 1, 5, 30)
+        done = threading.Event()
+        threads = {}
+        def fast(connChan):
+            threads['fast'] = threading.current_thread().name
+        @slowHandler()
+        def slow(connChan):
+            threads['slow'] = threading.current_thread().name
+            done.set()
+        dispatcher.wrap(fast)('#a')
+        dispatcher.wrap(slow)('#a')
+        done.wait(5)
+        time.sleep(0.05)
+        dispatcher.stop()
+        self.assertTrue(threads['fast'].startswith('SoapWorker'))
+        self.assertTrue(threads['slow'].startswith('SoapSlowWorker'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+# Needs supybot installed, soaputils uses its irc helpers
+
+import unittest
+
+import soaputils
+from fakes import FakeReactor
+from soaprcon import RconFanout
+
+class FakeOutput(object):
+    def __init__(self, lines):
+        self.total = len(lines)
+        self._lines = lines
+
+    def lines(self, start, stop):
+        return self._lines[start:stop]
+
+class FakeRequest(object):
+    def __init__(self, lines):
+        self.output = FakeOutput(lines)
+
+class FakeEngine(object):
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, command, callback=None):
+        self.submitted.append((command, callback))
+
+    def answer(self, lines):
+        command, callback = self.submitted.pop(0)
+        callback(FakeRequest(lines))
+
+class FakeConnection(object):
+    def __init__(self, ID, channel):
+        self.ID = ID
+        self.channel = channel
+        self.rconEngine = FakeEngine()
+
+class FakeChannel(object):
+    def __init__(self, ops):
+        self.ops = set(ops)
+
+class FakeState(object):
+    def __init__(self, channels):
+        self.channels = channels
+
+class FakeIrc(object):
+    def __init__(self, channels):
+        self.state = FakeState(channels)
+
+class FakeMsg(object):
+    def __init__(self, nick):
+        self.nick = nick
+        self.prefix = '%s!user@host' % nick
+
+def connections():
+    conns = [FakeConnection('ps3', '#ps3'), FakeConnection('ps1', '#ps1'),
+             FakeConnection('default', '#coop'), FakeConnection('ps2', '#ps2')]
+    return dict((conn.channel, conn) for conn in conns)
+
+class GetConnectionsTest(unittest.TestCase):
+    def ids(self, conns):
+        return [soaputils.getConnectionID(conn) for conn in conns]
+
+    def test_all_is_sorted(self):
+        self.assertEqual(self.ids(soaputils.getConnections(connections(), 'ALL')),
+                         ['#coop', 'ps1', 'ps2', 'ps3'])
+
+    def test_patterns_match_ids_and_channels(self):
+        conns = connections()
+        self.assertEqual(self.ids(soaputils.getConnections(conns, 'ps[12]')), ['ps1', 'ps2'])
+        self.assertEqual(self.ids(soaputils.getConnections(conns, '#c*')), ['#coop'])
+        self.assertEqual(soaputils.getConnections(conns, 'x*'), [])
+
+    def test_single_server_is_not_a_selector(self):
+        self.assertEqual(soaputils.getConnections(connections(), 'ps1'), None)
+        self.assertEqual(soaputils.getConnections(connections(), None), None)
+
+class PermittedConnectionsTest(unittest.TestCase):
+    def setUp(self):
+        self.checkCapability = soaputils.ircdb.checkCapability
+        soaputils.ircdb.checkCapability = lambda prefix, capability: prefix.startswith('trusted!')
+        self.irc = FakeIrc({'#ps1': FakeChannel(['op']), '#ps2': FakeChannel(['op'])})
+        self.conns = soaputils.getConnections(connections(), 'ps*')
+
+    def tearDown(self):
+        soaputils.ircdb.checkCapability = self.checkCapability
+
+    def permitted(self, nick, allowOps):
+        return [conn.ID for conn in soaputils.permittedConnections(
+            self.irc, FakeMsg(nick), self.conns, allowOps)]
+
+    def test_trusted_may_command_all(self):
+        self.assertEqual(self.permitted('trusted', lambda channel: False), ['ps1', 'ps2', 'ps3'])
+
+    def test_ops_only_where_opped_and_allowed(self):
+        self.assertEqual(self.permitted('op', lambda channel: True), ['ps1', 'ps2'])
+        self.assertEqual(self.permitted('op', lambda channel: channel == '#ps2'), ['ps2'])
+
+    def test_others_may_command_none(self):
+        self.assertEqual(self.permitted('someone', lambda channel: True), [])
+
+class RconFanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.finished = []
+        self.conns = soaputils.getConnections(connections(), 'all')
+
+    def fanout(self, conns):
+        fanout = RconFanout(self.reactor, conns, 'clients', 5, self.finished.append)
+        fanout.start()
+        return fanout
+
+    def test_finishes_when_all_answered(self):
+        fanout = self.fanout(self.conns)
+        for index, conn in enumerate(reversed(self.conns)):
+            self.assertEqual(self.finished, [])
+            conn.rconEngine.answer(['line %d' % index])
+        self.assertEqual(self.finished, [fanout])
+        self.assertEqual(self.reactor.pending(), [])
+        self.assertEqual([fanout.results[conn] for conn in self.conns],
+                         [['line 3'], ['line 2'], ['line 1'], ['line 0']])
+
+    def test_timeout_finishes_without_the_slow_ones(self):
+        fanout = self.fanout(self.conns)
+        self.conns[0].rconEngine.answer(['a'])
+        self.reactor.advance(5)
+        self.assertEqual(self.finished, [fanout])
+        self.assertEqual(fanout.results, {self.conns[0]: ['a']})
+        # late answers don't change the result or finish it twice
+        self.conns[1].rconEngine.answer(['b'])
+        self.assertEqual(fanout.results, {self.conns[0]: ['a']})
+        self.assertEqual(self.finished, [fanout])
+
+    def test_no_servers_finishes_straight_away(self):
+        fanout = self.fanout([])
+        self.assertEqual(self.finished, [fanout])
+        self.assertEqual(self.reactor.pending(), [])
+
+if __name__ == '__main__':
+    unittest.main()
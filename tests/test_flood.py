@@ -0,0 +1,96 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+import soapflood
+from fakes import FakeReactor
+from soapflood import BUCKET_MAX, FloodCounter, FloodGuard
+
+class FloodCounterTest(unittest.TestCase):
+    def test_counts_within_window(self):
+        counter = FloodCounter(8)
+        self.assertEqual([counter.hit('a', t) for t in (0, 1, 2)], [1, 2, 3])
+        self.assertEqual(counter.hit('b', 2), 1)
+
+    def test_window_slides_per_bucket(self):
+        counter = FloodCounter(8)
+        counter.hit('a', 0)
+        counter.hit('a', 4)
+        # the hit at 0 falls out once its bucket is a window behind
+        self.assertEqual(counter.hit('a', 7.9), 3)
+        self.assertEqual(counter.hit('a', 8), 3)
+
+    def test_long_silence_clears_counts(self):
+        counter = FloodCounter(8)
+        for i in range(5):
+            counter.hit('a', 0)
+        self.assertEqual(counter.hit('a', 100), 1)
+
+    def test_bucket_saturates(self):
+        counter = FloodCounter(8)
+        for i in range(BUCKET_MAX + 10):
+            total = counter.hit('a', 0)
+        self.assertEqual(total, BUCKET_MAX)
+
+    def test_reset(self):
+        counter = FloodCounter(8)
+        counter.hit('a', 0)
+        counter.reset('a')
+        self.assertEqual(len(counter), 0)
+        self.assertEqual(counter.hit('a', 0), 1)
+
+class FloodGuardTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeReactor()
+        self.time = soapflood.time
+        soapflood.time = self.clock
+        self.guard = FloodGuard(8, 3, 8, 2, 60)
+
+    def tearDown(self):
+        soapflood.time = self.time
+
+    def flood(self, clientID, hits):
+        return [self.guard.chat(clientID) for i in range(hits)]
+
+    def test_strikes_escalate(self):
+        self.assertEqual(self.flood(1, 4), [None, None, None, 1])
+        # counting starts afresh after a strike
+        self.assertEqual(self.flood(1, 4), [None, None, None, 2])
+        self.assertEqual(self.flood(1, 4), [None, None, None, 3])
+
+    def test_strikes_are_forgiven(self):
+        self.flood(1, 4)
+        self.clock.advance(61)
+        self.assertEqual(self.flood(1, 4)[-1], 1)
+
+    def test_commands_have_their_own_limit(self):
+        self.assertEqual([self.guard.command(1) for i in range(3)], [None, None, 1])
+        self.assertEqual(self.guard.chat(1), None)
+
+    def test_zero_limit_disables(self):
+        guard = FloodGuard(8, 0, 8, 0, 60)
+        self.assertEqual([guard.chat(1) for i in range(50)], [None] * 50)
+
+    def test_forget(self):
+        self.flood(1, 4)
+        self.guard.forget(1)
+        self.assertEqual(self.guard.stats(), (0, 0, 0))
+        self.assertEqual(self.flood(1, 4)[-1], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from soapgeoip import GeoIP, buildTable, packAddress
+
+ROWS = [
+    ('1.0.0.0', '1.0.0.255', 'AU'),
+    ('16777472', '16778239', 'cn'),
+    ('2.16.0.0', '2.16.255.255', 'DE'),
+    ('2001:db8::', '2001:db8::ffff', 'NL'),
+    ('281470698652416', '281470698652671', 'JP'),
+    ('bogus', '2.0.0.0', 'XX'),
+    ('3.0.0.0', '3.0.0.255', 'ZZZ'),
+]
+
+class GeoIPTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'geoip.tbl')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_pack_address(self):
+        self.assertEqual(packAddress('1.2.3.4'), (4, '\x01\x02\x03\x04'))
+        self.assertEqual(packAddress(' 16909060 '), (4, '\x01\x02\x03\x04'))
+        self.assertEqual(packAddress('::ffff:1.2.3.4'), (4, '\x01\x02\x03\x04'))
+        self.assertEqual(packAddress('2001:db8::1')[0], 6)
+        self.assertEqual(packAddress(str(0x20010db8 << 96)), packAddress('2001:db8::'))
+        self.assertEqual(packAddress('1.2.3'), (None, None))
+        self.assertEqual(packAddress(str(1 << 128)), (None, None))
+
+    def test_lookups(self):
+        self.assertEqual(buildTable(ROWS, self.path), (4, 1))
+        geoip = GeoIP(self.path)
+        try:
+            self.assertFalse(geoip.empty())
+            self.assertEqual(geoip.country('1.0.0.1'), 'AU')
+            self.assertEqual(geoip.country('1.0.1.0'), 'CN')
+            self.assertEqual(geoip.country('2.16.8.8'), 'DE')
+            self.assertEqual(geoip.country('1.2.3.0'), 'JP')
+            self.assertEqual(geoip.country('::ffff:1.2.3.0'), 'JP')
+            self.assertEqual(geoip.country('2001:db8::42'), 'NL')
+            self.assertEqual(geoip.country('0.0.0.1'), None)
+            self.assertEqual(geoip.country('1.0.4.0'), None)
+            self.assertEqual(geoip.country('3.0.0.1'), None)
+            self.assertEqual(geoip.country('not an address'), None)
+        finally:
+            geoip.close()
+
+    def test_answers_are_cached(self):
+        buildTable(ROWS, self.path)
+        geoip = GeoIP(self.path, cacheSize=1)
+        try:
+            geoip.country('1.0.0.1')
+            geoip.country('1.0.0.1')
+            geoip.country('2.16.8.8')
+            self.assertEqual(geoip.stats(), (4, 1, 1, 1, 2))
+        finally:
+            geoip.close()
+
+    def test_empty_table(self):
+        self.assertEqual(buildTable([('bogus', 'rows', 'XX')], self.path), (0, 0))
+        geoip = GeoIP(self.path)
+        try:
+            self.assertTrue(geoip.empty())
+            self.assertEqual(geoip.country('1.0.0.1'), None)
+        finally:
+            geoip.close()
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as wf:
+            wf.write('ip,country\n1.0.0.0,AU\n')
+        self.assertRaises(ValueError, GeoIP, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
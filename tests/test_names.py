@@ -0,0 +1,82 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from soapnames import NamePolicy, foldName, isDefaultName, normalizedForms
+
+class NormalizationTest(unittest.TestCase):
+    def test_fold(self):
+        self.assertEqual(foldName('ADMIN'), u'admin')
+        self.assertEqual(foldName(u'\uff21dmin'), u'admin')
+        self.assertEqual(foldName('caf\xc3\xa9'), u'caf\xe9')
+
+    def test_forms(self):
+        self.assertEqual(normalizedForms(u'4dm_1.n'), (u'admin', u'admln'))
+        self.assertEqual(normalizedForms(u'\u0430dmin'), (u'admin',))
+
+class NamePolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = NamePolicy([
+            'Admin', 'Hitler', 'bot*', 'n?zi', 're:^(.)\\1{4,}', 're:x+y', '', 're:(unclosed'])
+
+    def test_exact_and_normalized_names(self):
+        self.assertEqual(self.policy.match('Admin'), 'Admin')
+        self.assertEqual(self.policy.match('ADMIN'), 'Admin')
+        self.assertEqual(self.policy.match('a.d.m.i.n'), 'Admin')
+        self.assertEqual(self.policy.match('4dm1n'), 'Admin')
+        self.assertEqual(self.policy.match(u'\u0430dmin'), 'Admin')
+        self.assertEqual(self.policy.match('h1tler'), 'Hitler')
+        self.assertEqual(self.policy.match('hit|er'), 'Hitler')
+
+    def test_letters_are_not_folded_together(self):
+        self.assertEqual(self.policy.match('Hltler'), None)
+        self.assertEqual(self.policy.match('Admln'), None)
+
+    def test_wildcards(self):
+        self.assertEqual(self.policy.match('B0T_42'), 'bot*')
+        self.assertEqual(self.policy.match('nazi'), 'n?zi')
+        self.assertEqual(self.policy.match('nazis'), None)
+        self.assertEqual(self.policy.match('robot'), None)
+
+    def test_regexes_keep_their_groups(self):
+        self.assertEqual(self.policy.match('aaaaa'), 're:^(.)\\1{4,}')
+        self.assertEqual(self.policy.match('abcde'), None)
+        self.assertEqual(self.policy.match('XXY'), 're:x+y')
+        self.assertEqual(self.policy.match('xyz'), None)
+
+    def test_regex_source_is_not_folded(self):
+        policy = NamePolicy(['re:\\W+', 're:(?P<c>.)(?P=c)'])
+        self.assertEqual(policy.match('Bob'), None)
+        self.assertEqual(policy.match('!!'), 're:\\W+')
+        self.assertEqual(policy.match('oo'), 're:(?P<c>.)(?P=c)')
+
+    def test_invalid_entries_are_reported(self):
+        self.assertEqual(self.policy.bad, ['re:(unclosed'])
+        self.assertEqual(len(self.policy), 6)
+
+    def test_default_names(self):
+        self.assertTrue(isDefaultName('Player'))
+        self.assertTrue(isDefaultName('Player #2'))
+        self.assertFalse(isDefaultName('Alice'))
+
+    def test_real_names_resembling_default_ones(self):
+        for name in ('Play Ernie', 'pla.yer', 'Pl4yer_one', u'\u0440layer'):
+            self.assertFalse(isDefaultName(name), name)
+
+if __name__ == '__main__':
+    unittest.main()
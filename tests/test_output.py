@@ -0,0 +1,84 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from enums import MessagePriority
+from fakes import FakeReactor
+from soapoutput import FEED_DEPTH, OutputScheduler
+
+class FakeIrc(object):
+    def __init__(self):
+        self.queue = []
+
+class OutputSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.irc = FakeIrc()
+        self.sent = []
+        self.scheduler = OutputScheduler(self.reactor, self.send, 4)
+
+    def send(self, irc, channel, text, alert):
+        if alert:
+            self.sent.append(text)
+        else:
+            irc.queue.append(text)
+
+    def drain(self):
+        # the bot sends its queue, then the scheduler tops it up
+        while self.irc.queue or self.reactor.pending():
+            self.sent.extend(self.irc.queue)
+            del self.irc.queue[:]
+            self.reactor.advance(1)
+
+    def test_feeds_irc_queue_a_few_at_a_time(self):
+        for i in range(4):
+            self.scheduler.send(self.irc, '#a', str(i), MessagePriority.NORMAL)
+        self.assertEqual(len(self.irc.queue), FEED_DEPTH)
+        self.drain()
+        self.assertEqual(self.sent, ['0', '1', '2', '3'])
+
+    def test_higher_priority_goes_first(self):
+        for i in range(FEED_DEPTH):
+            self.scheduler.send(self.irc, '#a', 'fill', MessagePriority.NORMAL)
+        self.scheduler.send(self.irc, '#a', 'join', MessagePriority.ROUTINE)
+        self.scheduler.send(self.irc, '#a', 'reply', MessagePriority.NORMAL)
+        self.scheduler.send(self.irc, '#a', 'chat', MessagePriority.CHAT)
+        self.drain()
+        self.assertEqual(self.sent[FEED_DEPTH:], ['chat', 'reply', 'join'])
+
+    def test_full_queue_drops_lowest_priority(self):
+        for i in range(FEED_DEPTH):
+            self.scheduler.send(self.irc, '#a', 'fill', MessagePriority.NORMAL)
+        for i in range(4):
+            self.scheduler.send(self.irc, '#a', 'join%d' % i, MessagePriority.ROUTINE)
+        self.scheduler.send(self.irc, '#a', 'chat', MessagePriority.CHAT)
+        self.scheduler.send(self.irc, '#a', 'late', MessagePriority.ROUTINE)
+        self.drain()
+        self.assertEqual(self.sent[FEED_DEPTH:], [
+            'chat', 'join2', 'join3', 'late',
+            '[2 less important messages were dropped]'])
+        self.assertTrue(self.scheduler.stats()[0].endswith(', 2 dropped'))
+
+    def test_alerts_skip_the_queue(self):
+        for i in range(FEED_DEPTH + 1):
+            self.scheduler.send(self.irc, '#a', 'fill', MessagePriority.NORMAL)
+        self.scheduler.send(self.irc, '#a', 'admin!', MessagePriority.ALERT)
+        self.assertEqual(self.sent, ['admin!'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from fakes import FakeConnection
+from soaprcon import RconCache, RconEngine, parseCacheRules
+
+class RconCacheTest(unittest.TestCase):
+    def test_parse_rules(self):
+        rules, bad = parseCacheRules(['Companies=5', 'status  *=1.5', 'nope', 'x=-1', '=3'])
+        self.assertEqual(rules, [('companies', 5.0), ('status *', 1.5)])
+        self.assertEqual(bad, ['nope', 'x=-1', '=3'])
+
+    def test_store_and_get(self):
+        cache = RconCache([('companies', 60)])
+        cache.store('Companies', cache.generation, ['c1'])
+        self.assertEqual(cache.get('  companies '), ['c1'])
+        self.assertEqual(cache.get('clients'), None)
+        self.assertEqual(cache.stats()[1:3], (1, 1))
+
+    def test_uncached_commands_are_not_stored(self):
+        cache = RconCache([('companies', 60)])
+        cache.store('clients', cache.generation, ['x'])
+        self.assertEqual(cache.get('clients'), None)
+
+    def test_output_from_before_invalidation_is_dropped(self):
+        cache = RconCache([('companies', 60)])
+        generation = cache.generation
+        cache.invalidate()
+        cache.store('companies', generation, ['stale'])
+        self.assertEqual(cache.get('companies'), None)
+
+    def test_invalidate_by_pattern(self):
+        cache = RconCache([('companies', 60), ('clients', 60)])
+        cache.store('companies', cache.generation, ['c'])
+        cache.store('clients', cache.generation, ['p'])
+        cache.invalidate(['client*'])
+        self.assertEqual(cache.get('clients'), None)
+        self.assertEqual(cache.get('companies'), ['c'])
+
+    def test_engine_invalidates_on_other_commands(self):
+        engine = RconEngine(FakeConnection())
+        engine.cache.rules = [('companies', 60)]
+        request = engine.submit('companies', irc=True, cache=True)
+        request.output.append('c1')
+        engine.ended('companies')
+        self.assertEqual(engine.cached('companies').lines(0, 1), ['c1'])
+        engine.submit('reset_company 1')
+        self.assertEqual(engine.cached('companies'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from fakes import FakeConnection
+from soaprcon import RconEngine
+
+class RconEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection()
+        self.engine = RconEngine(self.conn, depth=2)
+
+    def test_pipelines_up_to_depth(self):
+        self.engine.submit(['a', 'b', 'c'])
+        self.assertEqual(self.conn.sent, ['a', 'b'])
+        self.engine.ended('a')
+        self.assertEqual(self.conn.sent, ['a', 'b', 'c'])
+
+    def test_output_belongs_to_oldest_command(self):
+        first = self.engine.submit('a', irc=True)
+        self.engine.submit('b', irc=True)
+        self.assertEqual(self.engine.received(), ('a', first))
+        self.assertEqual(self.engine.ended('a'), [first])
+        self.assertEqual(self.engine.received()[0], 'b')
+
+    def test_lost_rconend_completes_older_commands(self):
+        first = self.engine.submit('a')
+        second = self.engine.submit('b')
+        self.assertEqual(self.engine.ended('b'), [first, second])
+        self.assertFalse(self.engine.busy())
+
+    def test_unexpected_rconend_is_ignored(self):
+        self.engine.submit('a')
+        self.assertEqual(self.engine.ended('x'), [])
+        self.assertTrue(self.engine.busy())
+
+if __name__ == '__main__':
+    unittest.main()
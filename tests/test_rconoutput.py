@@ -0,0 +1,57 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from soaprcon import RconOutput
+
+class RconOutputTest(unittest.TestCase):
+    def test_spills_to_file_and_reads_back(self):
+        output = RconOutput(10, 100)
+        lines = ['line %d' % i for i in range(20)]
+        for line in lines:
+            output.append(line)
+        self.assertEqual(output.lines(0, 20), lines)
+        self.assertEqual(output.lines(5, 8), lines[5:8])
+        output.close()
+
+    def test_unicode_survives_spilling(self):
+        output = RconOutput(4, 100)
+        for line in (u'caf\xe9', u'\u0416uk', u'ok'):
+            output.append(line)
+        self.assertEqual(output.lines(0, 3), [u'caf\xe9', u'\u0416uk', u'ok'])
+        output.close()
+
+    def test_drops_lines_past_limit(self):
+        output = RconOutput(1000, 3)
+        for i in range(5):
+            output.append(str(i))
+        self.assertEqual(output.total, 3)
+        self.assertEqual(output.dropped, 2)
+
+    def test_read_and_page(self):
+        output = RconOutput(1000, 100)
+        for i in range(7):
+            output.append(str(i))
+        self.assertEqual(output.read(3), ['0', '1', '2'])
+        self.assertEqual(output.remaining(), 4)
+        self.assertEqual(output.pages(3), 3)
+        self.assertEqual(output.page(3, 3), ['6'])
+        self.assertEqual(output.remaining(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
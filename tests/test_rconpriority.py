@@ -0,0 +1,60 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from enums import RconPriority
+from fakes import FakeConnection
+from soaprcon import RconEngine
+
+class RconPriorityTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeConnection()
+        self.engine = RconEngine(self.conn, depth=2, starvationLimit=2)
+
+    def test_moderation_skips_depth(self):
+        self.engine.submit(['a', 'b', 'c'])
+        self.engine.submit('kick 5', priority=RconPriority.MODERATION)
+        self.assertEqual(self.conn.sent, ['a', 'b', 'kick 5'])
+
+    def test_interactive_before_bulk(self):
+        self.engine.submit(['a', 'b'])
+        self.engine.submit(['bulk'], priority=RconPriority.BULK)
+        self.engine.submit(['i1', 'i2'])
+        self.engine.ended('a')
+        self.engine.ended('b')
+        self.assertEqual(self.conn.sent, ['a', 'b', 'i1', 'i2'])
+
+    def test_bulk_is_not_starved(self):
+        self.engine.depth = 1
+        self.engine.submit('first')
+        self.engine.submit(['b1'], priority=RconPriority.BULK)
+        self.engine.submit(['i1', 'i2', 'i3', 'i4'])
+        for command in ('first', 'i1', 'i2'):
+            self.engine.ended(command)
+        self.assertEqual(self.conn.sent, ['first', 'i1', 'i2', 'b1'])
+
+    def test_stats_count_waiting_commands(self):
+        self.engine.submit(['a', 'b', 'c'])
+        self.engine.submit(['d'], priority=RconPriority.BULK)
+        inflight, waiting = self.engine.stats()
+        self.assertEqual(inflight, 2)
+        self.assertEqual(waiting[RconPriority.INTERACTIVE], 1)
+        self.assertEqual(waiting[RconPriority.BULK], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import unittest
+
+from fakes import FakeReactor
+from soapreconnect import ReconnectScheduler
+
+class ReconnectSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.connects = []
+        self.scheduler = ReconnectScheduler(self.reactor, self.connects.append, 10, 300)
+
+    def test_backoff_doubles_within_jitter(self):
+        for attempts in range(5):
+            delay = 10 * 2 ** attempts
+            for i in range(20):
+                backoff = self.scheduler.backoff(attempts)
+                self.assertTrue(delay / 2.0 <= backoff <= delay)
+
+    def test_backoff_is_capped(self):
+        for i in range(20):
+            self.assertTrue(self.scheduler.backoff(20) <= 300)
+
+    def test_attempt_runs_from_timer(self):
+        self.scheduler.schedule('s1', 5)
+        self.reactor.advance(4)
+        self.assertEqual(self.connects, [])
+        self.reactor.advance(1)
+        self.assertEqual(self.connects, ['s1'])
+        self.assertEqual(self.scheduler.attempts('s1'), 1)
+
+    def test_rescheduling_replaces_timer(self):
+        self.scheduler.schedule('s1', 5)
+        self.scheduler.schedule('s1', 20)
+        self.assertEqual(len(self.reactor.pending()), 1)
+        self.reactor.advance(10)
+        self.assertEqual(self.connects, [])
+
+    def test_failures_back_off(self):
+        self.scheduler.schedule('s1', 0)
+        self.reactor.advance(0)
+        delays = []
+        for i in range(4):
+            delays.append(self.scheduler.failed('s1', 'refused'))
+            self.reactor.advance(delays[-1])
+        self.assertEqual(len(self.connects), 5)
+        self.assertTrue(10 <= delays[0] <= 20)
+        self.assertTrue(80 <= delays[3] <= 160)
+        self.assertTrue('last error: refused' in self.scheduler.status()[0][1])
+
+    def test_failed_ignores_unknown_servers(self):
+        self.assertEqual(self.scheduler.failed('s1', 'refused'), None)
+        self.assertEqual(self.reactor.pending(), [])
+
+    def test_success_forgets_server(self):
+        self.scheduler.schedule('s1', 5)
+        self.scheduler.succeeded('s1')
+        self.assertEqual(self.reactor.pending(), [])
+        self.assertEqual(self.scheduler.attempts('s1'), 0)
+        self.assertEqual(self.scheduler.status(), [])
+        self.reactor.advance(10)
+        self.assertEqual(self.connects, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import threading
+import unittest
+
+from fakes import FakeReactor
+from soaprelay import LinePacker, textLength
+
+class LinePackerTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.sent = []
+        self.packer = LinePacker(self.reactor, self.send, 30)
+
+    def send(self, target, text):
+        self.sent.append((target, text))
+
+    def test_lines_of_one_sender_are_packed(self):
+        self.packer.add('#a', 'alice', '<alice> ', 'hi', 1)
+        self.packer.add('#a', 'alice', '<alice> ', 'all', 1)
+        self.assertEqual(self.sent, [])
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, [('#a', '<alice> hi | all')])
+        self.assertEqual(self.packer.stats(), {'#a': (2, 1)})
+
+    def test_other_sender_flushes_first(self):
+        self.packer.add('#a', 'alice', '<alice> ', 'hi', 1)
+        self.packer.add('#a', 'bob', '<bob> ', 'hey', 1)
+        self.assertEqual(self.sent, [('#a', '<alice> hi')])
+        self.reactor.advance(1)
+        self.assertEqual(self.sent[1], ('#a', '<bob> hey'))
+
+    def test_line_that_does_not_fit_starts_a_new_message(self):
+        self.packer.add('#a', 'alice', '<alice> ', 'x' * 15, 1)
+        self.packer.add('#a', 'alice', '<alice> ', 'y' * 10, 1)
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, [('#a', '<alice> ' + 'x' * 15),
+                                     ('#a', '<alice> ' + 'y' * 10)])
+
+    def test_no_window_sends_straight_away(self):
+        self.packer.add('#a', 'alice', '<alice> ', 'hi', 1)
+        self.packer.add('#a', 'alice', '<alice> ', 'now', 0)
+        self.assertEqual(self.sent, [('#a', '<alice> hi'), ('#a', '<alice> now')])
+        self.assertEqual(self.reactor.pending(), [])
+
+    def test_targets_are_kept_apart(self):
+        self.packer.add('#a', 'alice', '<alice> ', 'hi', 1)
+        self.packer.add('#b', 'alice', '<alice> ', 'ho', 1)
+        self.reactor.advance(1)
+        self.assertEqual(sorted(self.sent), [('#a', '<alice> hi'), ('#b', '<alice> ho')])
+
+    def test_blocked_target_holds_up_nobody_else(self):
+        sending = threading.Event()
+        release = threading.Event()
+        def send(target, text):
+            if target == '#slow':
+                sending.set()
+                release.wait(5)
+            self.sent.append((target, text))
+        packer = LinePacker(self.reactor, send, 30)
+        worker = threading.Thread(target=packer.add, args=('#slow', 'a', '<a> ', 'hi', 0))
+        worker.start()
+        sending.wait(5)
+        packer.add('#slow', 'b', '<b> ', 'queued', 1)
+        packer.add('#fast', 'c', '<c> ', 'hey', 1)
+        # the flush timers run on the reactor and must not wait for #slow
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, [('#fast', '<c> hey')])
+        release.set()
+        worker.join(5)
+        self.assertEqual(self.sent[1:], [('#slow', '<a> hi'), ('#slow', '<b> queued')])
+
+    def test_flush_can_wait_for_other_senders(self):
+        sending = threading.Event()
+        release = threading.Event()
+        def send(target, text):
+            if text == '<a> hi':
+                sending.set()
+                release.wait(5)
+            self.sent.append((target, text))
+        packer = LinePacker(self.reactor, send, 30)
+        packer.add('#a', 'a', '<a> ', 'hi', 1)
+        timer = threading.Thread(target=self.reactor.advance, args=(1,))
+        timer.start()
+        sending.wait(5)
+        threading.Timer(0.1, release.set).start()
+        packer.flush('#a', True)
+        # the reply to the chat line can go out now
+        self.assertEqual(self.sent, [('#a', '<a> hi')])
+        timer.join(5)
+
+    def test_length_counts_utf8_bytes(self):
+        self.assertEqual(textLength(u'\xe9'), 2)
+        self.assertEqual(textLength('abc'), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import soapreputation
+from fakes import FakeReactor
+from soapreputation import ReputationCache, isProxy
+
+CLEAN = {'result': 0.1, 'BadIP': 0, 'Country': 'NL'}
+PROXY = {'result': 1.0, 'BadIP': 0, 'Country': 'US'}
+
+class ReputationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'reputation.db')
+        self.clock = FakeReactor()
+        self.clock.now = 1000
+        self.time = soapreputation.time
+        soapreputation.time = self.clock
+
+    def tearDown(self):
+        soapreputation.time = self.time
+        shutil.rmtree(self.dir)
+
+    def cache(self, maxEntries=3):
+        return ReputationCache(self.path, maxEntries, 100, 10)
+
+    def test_is_proxy(self):
+        self.assertFalse(isProxy(CLEAN))
+        self.assertTrue(isProxy(PROXY))
+        self.assertTrue(isProxy({'result': 0, 'BadIP': 1}))
+
+    def test_verdicts_expire_after_their_ttl(self):
+        cache = self.cache()
+        cache.store('192.0.2.1', CLEAN)
+        cache.store('192.0.2.2', PROXY)
+        self.clock.advance(11)
+        self.assertEqual(cache.get('192.0.2.1'), None)
+        self.assertEqual(cache.get('192.0.2.2'), PROXY)
+        self.assertEqual(cache.stats()[1:3], (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = self.cache()
+        for i in range(1, 4):
+            cache.store('192.0.2.%d' % i, CLEAN)
+        cache.get('192.0.2.1')
+        cache.store('192.0.2.4', CLEAN)
+        self.assertEqual(cache.get('192.0.2.2'), None)
+        self.assertEqual(cache.get('192.0.2.1'), CLEAN)
+        self.assertEqual(cache.stats()[3], 1)
+
+    def test_survives_reload(self):
+        cache = self.cache()
+        cache.store('192.0.2.1', PROXY)
+        cache.store('192.0.2.2', CLEAN)
+        cache.flush()
+        self.clock.advance(20)
+        cache = self.cache()
+        cache.load()
+        # the clean verdict expired while the bot was away
+        self.assertEqual(cache.loaded, 1)
+        self.assertEqual(cache.get('192.0.2.1'), PROXY)
+        self.assertEqual(cache.get('192.0.2.2'), None)
+
+    def test_evicted_verdicts_are_removed_from_disk(self):
+        cache = self.cache(1)
+        cache.store('192.0.2.1', CLEAN)
+        cache.flush()
+        cache.store('192.0.2.2', CLEAN)
+        cache.flush()
+        cache = self.cache()
+        cache.load()
+        self.assertEqual(cache.loaded, 1)
+        self.assertEqual(cache.get('192.0.2.1'), None)
+
+    def test_load_keeps_newer_verdicts(self):
+        cache = self.cache()
+        cache.store('192.0.2.1', CLEAN)
+        cache.flush()
+        cache = self.cache()
+        fresh = {'result': 0.2, 'BadIP': 0, 'Country': 'DE'}
+        cache.store('192.0.2.1', fresh)
+        cache.load()
+        self.assertEqual(cache.get('192.0.2.1'), fresh)
+        cache.flush()
+        cache = self.cache()
+        cache.load()
+        self.assertEqual(cache.get('192.0.2.1'), fresh)
+
+    def test_load_does_not_revive_expired_lookups(self):
+        cache = self.cache()
+        cache.store('192.0.2.1', CLEAN)
+        cache.flush()
+        cache = self.cache()
+        cache.load()
+        self.clock.advance(11)
+        self.assertEqual(cache.get('192.0.2.1'), None)
+        cache.load()
+        self.assertEqual(cache.get('192.0.2.1'), None)
+
+if __name__ == '__main__':
+    unittest.main()
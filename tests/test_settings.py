@@ -0,0 +1,101 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from soapsettings import SettingsSnapshot, loadDefaults, normalizeValue
+
+SETTINGS = [
+    'difficulty.max_loan = 300000',
+    'gui.autosave = monthly',
+    'network.autoclean_companies = true',
+    'economy.inflation = off',
+    'ai.inflation = off',
+    'some text without a setting',
+]
+
+class SettingsSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = SettingsSnapshot()
+        self.snapshot.update(SETTINGS)
+
+    def test_update_counts_settings(self):
+        self.assertEqual(SettingsSnapshot().update(SETTINGS), 5)
+        self.assertTrue(self.snapshot.fresh(60))
+        self.snapshot.invalidate()
+        self.assertFalse(self.snapshot.fresh(60))
+
+    def test_unchanged_settings_are_skipped(self):
+        changes, unchanged = self.snapshot.diff([
+            ('difficulty.max_loan', '300000'),
+            ('autoclean_companies', 'on'),
+            ('gui.autosave', '"Monthly"')])
+        self.assertEqual(changes, [])
+        self.assertEqual(unchanged, 3)
+
+    def test_changed_and_unknown_settings_are_sent(self):
+        changes, unchanged = self.snapshot.diff([
+            ('max_loan', '500000'),
+            ('no.such_setting', '1')])
+        self.assertEqual(changes, [('max_loan', '300000', '500000'),
+                                   ('no.such_setting', None, '1')])
+        self.assertEqual(unchanged, 0)
+
+    def test_ambiguous_short_names_are_sent(self):
+        changes, unchanged = self.snapshot.diff([('inflation', 'off')])
+        self.assertEqual(changes, [('inflation', None, 'off')])
+
+    def test_apply_remembers_changes(self):
+        changes, unchanged = self.snapshot.diff([('max_loan', '500000')])
+        self.snapshot.apply(changes)
+        self.assertEqual(self.snapshot.diff([('max_loan', '500000')]), ([], 1))
+
+    def test_normalize_value(self):
+        self.assertEqual(normalizeValue(' "Yes" '), 'true')
+        self.assertEqual(normalizeValue('OFF'), 'false')
+        self.assertEqual(normalizeValue('Monthly'), 'monthly')
+
+class LoadDefaultsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'defaults.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, mtime):
+        with open(self.path, 'w') as wf:
+            wf.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_splits_settings_from_commands(self):
+        self.write('set max_loan 500000\n\nSET autosave "every month"\nsay "hi"\n', 1000)
+        settings, commands = loadDefaults(self.path)
+        self.assertEqual(settings, [('max_loan', '500000'), ('autosave', '"every month"')])
+        self.assertEqual(commands, ['say "hi"'])
+
+    def test_reloads_when_modified(self):
+        self.write('set max_loan 1\n', 1000)
+        self.assertEqual(loadDefaults(self.path)[0], [('max_loan', '1')])
+        self.write('set max_loan 2\n', 2000)
+        self.assertEqual(loadDefaults(self.path)[0], [('max_loan', '2')])
+
+if __name__ == '__main__':
+    unittest.main()
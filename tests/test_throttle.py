@@ -0,0 +1,150 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import threading
+import unittest
+
+import soapthrottle
+from enums import RconPriority
+from fakes import FakeConnection, FakeReactor
+from soaprcon import RconEngine
+from soapthrottle import PacketThrottle, SendQueue, TokenBucket
+
+class ThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self.time = soapthrottle.time
+        soapthrottle.time = self.reactor
+
+    def tearDown(self):
+        soapthrottle.time = self.time
+
+class TokenBucketTest(ThrottleTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(2, 3)
+        self.assertEqual([bucket.take() for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.5)
+        self.reactor.advance(0.5)
+        self.assertEqual(bucket.take(), 0)
+
+    def test_refill_is_capped(self):
+        bucket = TokenBucket(1, 2)
+        self.reactor.advance(100)
+        self.assertEqual([bucket.take() for i in range(2)], [0, 0])
+        self.assertNotEqual(bucket.take(), 0)
+
+    def test_reserve_is_only_for_reserved(self):
+        bucket = TokenBucket(1, 1, 2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 1)
+        self.assertEqual(bucket.take(True), 0)
+        self.assertEqual(bucket.take(True), 0)
+        self.assertAlmostEqual(bucket.take(True), 1)
+
+    def test_configure_keeps_tokens_within_new_burst(self):
+        bucket = TokenBucket(1, 10)
+        bucket.configure(5, 2, 1)
+        self.assertEqual(bucket.tokens, 3)
+        self.assertEqual([bucket.take() for i in range(2)], [0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.2)
+
+class PacketThrottleTest(ThrottleTestCase):
+    def setUp(self):
+        ThrottleTestCase.setUp(self)
+        self.sent = []
+        self.throttle = PacketThrottle(self.reactor, TokenBucket(1, 2, 1), self.send)
+
+    def send(self, packet, **kwargs):
+        self.sent.append(packet)
+
+    def test_queues_beyond_burst_in_order(self):
+        for packet in ('a', 'b', 'c', 'd'):
+            self.throttle.send(packet, {})
+        self.assertEqual(self.sent, ['a', 'b'])
+        self.assertEqual(self.throttle.depth(), 2)
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, ['a', 'b', 'c'])
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.throttle.depth(), 0)
+
+    def test_moderation_goes_first_and_uses_reserve(self):
+        for packet in ('a', 'b', 'c'):
+            self.throttle.send(packet, {})
+        self.throttle.send('kick', {}, moderation=True)
+        self.assertEqual(self.sent, ['a', 'b', 'kick'])
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, ['a', 'b', 'kick'])
+        self.reactor.advance(1)
+        self.assertEqual(self.sent, ['a', 'b', 'kick', 'c'])
+
+    def test_stop_drops_queue(self):
+        for packet in ('a', 'b', 'c'):
+            self.throttle.send(packet, {})
+        self.throttle.stop()
+        self.assertEqual(self.reactor.pending(), [])
+        self.assertEqual(self.throttle.depth(), 0)
+
+class SendQueueTest(unittest.TestCase):
+    def test_blocked_sender_does_not_block_others(self):
+        sent = []
+        sending = threading.Event()
+        release = threading.Event()
+        def send(item):
+            if item == 'first':
+                sending.set()
+                release.wait(5)
+            sent.append(item)
+        queue = SendQueue(send)
+        queue.push('first')
+        worker = threading.Thread(target=queue.deliver)
+        worker.start()
+        sending.wait(5)
+        # another thread, say the reactor, only queues while the worker sends
+        queue.push('second')
+        queue.deliver()
+        self.assertEqual(sent, [])
+        release.set()
+        worker.join(5)
+        self.assertEqual(sent, ['first', 'second'])
+
+    def test_failed_send_lets_the_next_one_through(self):
+        sent = []
+        def send(item):
+            if item == 'bad':
+                raise IOError('broken')
+            sent.append(item)
+        queue = SendQueue(send)
+        queue.push('bad')
+        self.assertRaises(IOError, queue.deliver)
+        queue.push('good')
+        queue.deliver()
+        self.assertEqual(sent, ['good'])
+
+class RconThrottleTest(ThrottleTestCase):
+    def test_holds_commands_until_tokens_return(self):
+        conn = FakeConnection()
+        engine = RconEngine(conn, depth=10)
+        engine.throttle(self.reactor, TokenBucket(1000, 1, 1))
+        engine.submit(['a', 'b'])
+        engine.submit('kick 5', priority=RconPriority.MODERATION)
+        # the reserve token is only for moderation
+        self.assertEqual(conn.sent, ['a', 'kick 5'])
+        self.assertEqual(len(self.reactor.pending()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
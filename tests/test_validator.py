@@ -0,0 +1,139 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+import BaseHTTPServer
+import json
+import threading
+import time
+import unittest
+
+from soapvalidator import IPValidator, ValidatorError
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append(self.path)
+        server.gate.wait(5)
+        if server.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({'result': {'vpn': False}})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(BaseHTTPServer.HTTPServer):
+    # one thread per request, so held requests don't block each other
+    def process_request(self, request, address):
+        thread = threading.Thread(target=self._serve, args=(request, address))
+        thread.daemon = True
+        thread.start()
+
+    def _serve(self, request, address):
+        try:
+            self.finish_request(request, address)
+        finally:
+            self.shutdown_request(request)
+
+class IPValidatorTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.hits = []
+        self.server.gate = threading.Event()
+        self.server.gate.set()
+        self.server.failing = False
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        url = 'http://127.0.0.1:%d/{ip}' % self.server.server_address[1]
+        self.validator = IPValidator(url, 2, 4, 2, 0.3)
+
+    def tearDown(self):
+        self.server.gate.set()
+        self.validator.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_concurrent_lookups_share_one_request(self):
+        self.server.gate.clear()
+        results = []
+        def lookup():
+            results.append(self.validator.lookup('192.0.2.1'))
+        threads = [threading.Thread(target=lookup) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        # wait for the leader's request to arrive and the rest to join it
+        deadline = time.time() + 2
+        while time.time() < deadline and self.validator.coalesced < 4:
+            time.sleep(0.01)
+        self.server.gate.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.server.hits, ['/192.0.2.1'])
+        self.assertEqual(self.validator.requests, 1)
+        self.assertEqual(self.validator.coalesced, 4)
+        self.assertEqual(results, [{'result': {'vpn': False}}] * 5)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.failing = True
+        for ip in ('192.0.2.1', '192.0.2.2'):
+            self.assertRaises(ValidatorError, self.validator.lookup, ip)
+        self.assertEqual(self.validator.stats()[5], 'open')
+        self.assertRaises(ValidatorError, self.validator.lookup, '192.0.2.3')
+        self.assertEqual(len(self.server.hits), 2)
+        self.assertEqual(self.validator.rejected, 1)
+
+    def test_half_open_probe_closes_circuit(self):
+        self.server.failing = True
+        for ip in ('192.0.2.1', '192.0.2.2'):
+            self.assertRaises(ValidatorError, self.validator.lookup, ip)
+        time.sleep(0.35)
+        self.assertEqual(self.validator.stats()[5], 'half-open')
+        self.server.failing = False
+        self.server.gate.clear()
+        probe = threading.Thread(target=self.validator.lookup, args=('192.0.2.4',))
+        probe.start()
+        deadline = time.time() + 2
+        while time.time() < deadline and len(self.server.hits) < 3:
+            time.sleep(0.01)
+        # only the probe gets through while it is out
+        self.assertRaises(ValidatorError, self.validator.lookup, '192.0.2.5')
+        self.server.gate.set()
+        probe.join(5)
+        self.assertEqual(self.validator.stats()[5], 'closed')
+        self.assertEqual(self.validator.lookup('192.0.2.5'), {'result': {'vpn': False}})
+        self.assertEqual(len(self.server.hits), 4)
+
+    def test_failed_probe_reopens_circuit(self):
+        self.server.failing = True
+        for ip in ('192.0.2.1', '192.0.2.2'):
+            self.assertRaises(ValidatorError, self.validator.lookup, ip)
+        time.sleep(0.35)
+        self.assertRaises(ValidatorError, self.validator.lookup, '192.0.2.3')
+        self.assertEqual(self.validator.stats()[5], 'open')
+        self.assertEqual(len(self.server.hits), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+###
+# This file is part of Soap.
+#
+# Soap is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# Soap is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+#
+# See the GNU General Public License for more details. You should have received
+# a copy of the GNU General Public License along with Soap. If not, see
+# <http://www.gnu.org/licenses/>.
+###
+
+
+# Needs supybot installed, soaputils uses its irc helpers
+
+import unittest
+
+import netaddr
+
+import soaputils
+from enums import MessagePriority
+
+class FakeClient(object):
+    def __init__(self, hostname):
+        self.id = 5
+        self.name = 'Alice'
+        self.hostname = hostname
+
+class FakeConnection(object):
+    channel = '#test'
+
+    def __init__(self):
+        self.packets = []
+
+    def send_packet(self, packet, **kwargs):
+        self.packets.append(kwargs['message'])
+
+class FailingLookups(object):
+    # the whitelist is checked first, nothing else may be asked
+    def lookup(self, ip):
+        raise AssertionError('looked up %s' % ip)
+
+    get = lookup
+
+class CompileWhitelistTest(unittest.TestCase):
+    def test_networks_and_addresses(self):
+        whitelist, bad = soaputils.compileWhitelist(
+            ['192.0.2.0/24', ' 198.51.100.7 ', '2001:db8::/48', ''])
+        self.assertEqual(bad, [])
+        for address in ('192.0.2.1', '192.0.2.255', '198.51.100.7', '2001:db8:0:1::5'):
+            self.assertTrue(netaddr.IPAddress(address) in whitelist, address)
+        for address in ('192.0.3.0', '198.51.100.8', '2001:db8:1::1'):
+            self.assertFalse(netaddr.IPAddress(address) in whitelist, address)
+
+    def test_invalid_entries_are_returned(self):
+        whitelist, bad = soaputils.compileWhitelist(
+            ['192.0.2.0/24', 'example.com', '300.1.1.1', '192.0.2.0/33'])
+        self.assertEqual(bad, ['example.com', '300.1.1.1', '192.0.2.0/33'])
+        self.assertTrue(netaddr.IPAddress('192.0.2.9') in whitelist)
+
+    def test_overlapping_entries_merge(self):
+        whitelist, bad = soaputils.compileWhitelist(['10.0.0.0/8', '10.1.0.0/16', '10.2.3.4'])
+        self.assertEqual(whitelist.iter_cidrs(), [netaddr.IPNetwork('10.0.0.0/8')])
+
+    def test_whitelisted_players_are_not_checked(self):
+        whitelist, bad = soaputils.compileWhitelist(['192.0.2.0/24'])
+        said = []
+        conn = FakeConnection()
+        lookups = FailingLookups()
+        soaputils.checkIP(lambda text, priority=MessagePriority.NORMAL: said.append((text, priority)),
+                          conn, FakeClient('192.0.2.10'), whitelist, lookups, lookups, lookups)
+        text = '*** Alice is a whitelisted player, and will not be checked.'
+        self.assertEqual(said, [(text, MessagePriority.ROUTINE)])
+        self.assertEqual(conn.packets, [text])
+
+if __name__ == '__main__':
+    unittest.main()